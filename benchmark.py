@@ -0,0 +1,341 @@
+"""
+Benchmarks reprodutíveis do sistema de arquivos.
+
+Monta MemoryDisk (ou um Volume de vários dispositivos) + PermissionManager +
+FileSystem diretamente (sem o shell)
+e executa cargas parametrizadas, varrendo total_blocks, block_size e a
+profundidade/largura da árvore. O resultado (ops/s, latências p50/p99 e pico
+de memória via tracemalloc) é emitido em JSON para comparação com uma
+execução de referência:
+
+    python benchmark.py --output base.json
+    python benchmark.py --baseline base.json
+"""
+import argparse
+import contextlib
+import os
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from file_system import FileSystem
+from memory_disk import MemoryDisk
+from volume import Volume
+from permission_manager import PermissionManager
+from session import Session
+from user import User
+
+
+# ----------------------------------------------------------------------
+# Cargas de trabalho
+# Cada carga prepara o sistema de arquivos e retorna a lista de operações
+# (funções sem argumentos) cujo tempo será medido individualmente.
+# ----------------------------------------------------------------------
+
+def _fill(fs, user, rng, count, size, prefix="/bench/f"):
+    """Cria count arquivos com size bytes cada em /bench."""
+    fs.mkdir("/bench", user)
+    names = []
+    for i in range(count):
+        name = f"{prefix}{i}"
+        fs.touch(name, user)
+        if size:
+            fs.write_file(name, rng.randbytes(size).hex()[:size], user)
+        names.append(name)
+    return names
+
+
+def _file_size(cfg, blocks, files):
+    """Tamanho de arquivo de até `blocks` blocos que cabe files vezes no disco."""
+    per_file = max(1, min(blocks, cfg["total_blocks"] // (2 * files)))
+    return per_file * cfg["block_size"]
+
+
+def wl_create(fs, user, rng, cfg):
+    """Criação de muitos arquivos vazios em poucos diretórios."""
+    for d in range(16):
+        fs.mkdir(f"/d{d}", user)
+    return [lambda i=i: fs.touch(f"/d{i % 16}/f{i}", user) for i in range(cfg["ops"])]
+
+
+def wl_small_write(fs, user, rng, cfg):
+    """Escritas pequenas (pwrite/append) em arquivos já existentes."""
+    names = _fill(fs, user, rng, 64, _file_size(cfg, 4, 64))
+    ops = []
+    for _ in range(cfg["ops"]):
+        name = rng.choice(names)
+        data = "x" * rng.randint(1, 32)
+        if rng.random() < 0.5:
+            offset = rng.randrange(cfg["block_size"] * 4)
+            ops.append(lambda n=name, o=offset, d=data: fs.pwrite_file(n, o, d, user))
+        else:
+            ops.append(lambda n=name, d=data: fs.truncate_file(n, 0, user) or fs.append_file(n, d, user))
+    return ops
+
+
+def wl_large_write(fs, user, rng, cfg):
+    """Sobrescrita sequencial de arquivos grandes (muitos blocos por escrita)."""
+    names = _fill(fs, user, rng, 8, 0)
+    content = "L" * _file_size(cfg, 256, len(names))
+    return [lambda n=names[i % len(names)]: fs.write_file(n, content, user)
+            for i in range(cfg["ops"])]
+
+
+def wl_templates(fs, user, rng, cfg):
+    """Escrita de muitos arquivos a partir de poucos modelos (conteúdo redundante)."""
+    names = _fill(fs, user, rng, 256, 0)
+    size = _file_size(cfg, 16, len(names))
+    templates = [rng.randbytes(size).hex()[:size] for _ in range(4)]
+    return [lambda n=rng.choice(names), c=rng.choice(templates): fs.write_file(n, c, user)
+            for _ in range(cfg["ops"])]
+
+
+def wl_read_heavy(fs, user, rng, cfg):
+    """Leituras completas e por faixa de arquivos com conteúdo."""
+    names = _fill(fs, user, rng, 64, _file_size(cfg, 16, 64))
+    ops = []
+    for _ in range(cfg["ops"]):
+        name = rng.choice(names)
+        if rng.random() < 0.5:
+            ops.append(lambda n=name: fs.read_file(n, user))
+        else:
+            ops.append(lambda n=name, o=rng.randrange(64): fs._lookup(n).file.pread(o, 64))
+    return ops
+
+
+def wl_churn(fs, user, rng, cfg):
+    """Ciclos de cp, mv e rm sobre um conjunto de arquivos."""
+    names = _fill(fs, user, rng, 32, _file_size(cfg, 4, 64))
+    fs.mkdir("/moved", user)
+    ops = []
+    for i in range(cfg["ops"] // 3):
+        src = rng.choice(names)
+        tmp, dst = f"/bench/c{i}", f"/moved/m{i}"
+        ops.append(lambda s=src, t=tmp: fs.cp(s, t, user))
+        ops.append(lambda t=tmp, d=dst: fs.mv(t, d, user))
+        ops.append(lambda d=dst: fs.rm(d, user))
+    return ops
+
+
+def wl_navigation(fs, user, rng, cfg):
+    """Navegação (cd/ls/du) por uma árvore profunda de diretórios."""
+    depth, fanout = cfg["depth"], cfg["fanout"]
+    level = [""]
+    for _ in range(depth):
+        level = [f"{path}/n{i}" for path in level for i in range(fanout)]
+        for path in level:
+            fs.mkdir(path, user)
+    leaves = level
+    session = Session(fs, user)
+    ops = []
+    for _ in range(cfg["ops"]):
+        r = rng.random()
+        if r < 0.5:
+            ops.append(lambda p=rng.choice(leaves): session.cd(p))
+        elif r < 0.7:
+            ops.append(lambda: session.cd(".."))
+        elif r < 0.9:
+            ops.append(lambda p=rng.choice(leaves): fs.ls(p, session))
+        else:
+            ops.append(lambda p=rng.choice(leaves).rsplit("/", 1)[0] or "/": fs.du(p, session))
+    return ops
+
+
+# Nome -> (função, usa os parâmetros de árvore profundidade/largura)
+WORKLOADS = {
+    "create": (wl_create, False),
+    "small_write": (wl_small_write, False),
+    "large_write": (wl_large_write, False),
+    "templates": (wl_templates, False),
+    "read_heavy": (wl_read_heavy, False),
+    "churn": (wl_churn, False),
+    "navigation": (wl_navigation, True),
+}
+
+SWEEP = {
+    "total_blocks": [4096, 65536],
+    "block_size": [64, 512],
+    "tree": [(4, 4), (8, 2)],  # (profundidade, largura)
+}
+
+QUICK_SWEEP = {
+    "total_blocks": [4096],
+    "block_size": [64],
+    "tree": [(4, 3)],
+}
+
+
+# ----------------------------------------------------------------------
+# Execução
+# ----------------------------------------------------------------------
+
+def _build(cfg):
+    if cfg["devices"] > 1:
+        # Mesma capacidade total, dividida entre os dispositivos do volume
+        devices = [MemoryDisk(total_blocks=cfg["total_blocks"] // cfg["devices"],
+                              block_size=cfg["block_size"])
+                   for _ in range(cfg["devices"])]
+        disk = Volume(devices, mode=cfg["raid"], allocation=MemoryDisk.EXTENT,
+                      dedup=cfg["dedup"])
+    else:
+        disk = MemoryDisk(total_blocks=cfg["total_blocks"], block_size=cfg["block_size"],
+                          allocation=MemoryDisk.EXTENT, dedup=cfg["dedup"])
+    return FileSystem(disk, PermissionManager())
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_workload(name, cfg, seed):
+    """
+    Executa uma carga duas vezes com a mesma semente: uma para medir tempo
+    (sem tracemalloc, que distorce as latências) e outra para medir o pico
+    de memória. Retorna o registro de resultado.
+    """
+    func, _ = WORKLOADS[name]
+    user = User("root", uid=0, gid=0)
+
+    # Passada de tempo. A saída dos comandos (ex: echo) é descartada.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        fs = _build(cfg)
+        ops = func(fs, user, random.Random(seed), cfg)
+        latencies = []
+        clock = time.perf_counter_ns
+        start = clock()
+        for op in ops:
+            t0 = clock()
+            op()
+            latencies.append(clock() - t0)
+        elapsed = (clock() - start) / 1e9
+        blocks_used = fs.disk.used_count()
+        fs.disk.close()
+
+    # Passada de memória
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        tracemalloc.start()
+        try:
+            fs = _build(cfg)
+            ops = func(fs, user, random.Random(seed), cfg)
+            tracemalloc.reset_peak()
+            for op in ops:
+                op()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        fs.disk.close()
+
+    latencies.sort()
+    result = {
+        "workload": name,
+        "total_blocks": cfg["total_blocks"],
+        "block_size": cfg["block_size"],
+        "dedup": cfg["dedup"],
+        "devices": cfg["devices"],
+        "ops": len(latencies),
+        "seconds": round(elapsed, 6),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_us": round(_percentile(latencies, 0.50) / 1000, 2),
+        "p99_us": round(_percentile(latencies, 0.99) / 1000, 2),
+        "peak_kib": round(peak / 1024, 1),
+        "blocks_used": blocks_used,
+    }
+    if WORKLOADS[name][1]:
+        result["depth"], result["fanout"] = cfg["depth"], cfg["fanout"]
+    return result
+
+
+def run_suite(workloads, sweep, ops, seed, dedup=False, devices=1, raid=Volume.STRIPE):
+    """Executa as cargas sobre todas as combinações da varredura."""
+    results = []
+    for name in workloads:
+        trees = sweep["tree"] if WORKLOADS[name][1] else [(None, None)]
+        for total_blocks, block_size, (depth, fanout) in itertools.product(
+                sweep["total_blocks"], sweep["block_size"], trees):
+            cfg = {"total_blocks": total_blocks, "block_size": block_size,
+                   "depth": depth, "fanout": fanout, "ops": ops, "dedup": dedup,
+                   "devices": devices, "raid": raid}
+            result = run_workload(name, cfg, seed)
+            print(f"  {name:<12} blocks={total_blocks:<6} bs={block_size:<4} "
+                  f"{'' if depth is None else f'depth={depth} fanout={fanout} '}"
+                  f"{result['ops_per_sec']:>10.0f} ops/s", file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def _key(result):
+    return (result["workload"], result["total_blocks"], result["block_size"],
+            result.get("depth"), result.get("fanout"))
+
+
+def compare(results, baseline):
+    """Imprime a variação de ops/s e p99 em relação a uma execução de referência."""
+    base = {_key(r): r for r in baseline["results"]}
+    print("Comparação com a referência (ops/s, p99):", file=sys.stderr)
+    for result in results:
+        old = base.get(_key(result))
+        if old is None or not old["ops_per_sec"]:
+            continue
+        speedup = result["ops_per_sec"] / old["ops_per_sec"]
+        print(f"  {' '.join(str(k) for k in _key(result) if k is not None):<32} "
+              f"{speedup:6.2f}x  p99 {old['p99_us']:.1f} -> {result['p99_us']:.1f} us",
+              file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do sistema de arquivos M3-SO")
+    parser.add_argument("--workload", action="append", choices=sorted(WORKLOADS),
+                        help="Carga a executar (pode repetir; padrão: todas)")
+    parser.add_argument("--ops", type=int, default=3000,
+                        help="Operações medidas por carga (padrão: 3000)")
+    parser.add_argument("--seed", type=int, default=42, help="Semente do gerador (padrão: 42)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Usa o disco com deduplicação de blocos por conteúdo")
+    parser.add_argument("--devices", type=int, default=1,
+                        help="Divide o disco em um volume com N dispositivos (padrão: 1)")
+    parser.add_argument("--raid", choices=(Volume.STRIPE, Volume.CONCAT), default=Volume.STRIPE,
+                        help="Organização do volume com --devices (padrão: stripe)")
+    parser.add_argument("--quick", action="store_true", help="Varredura reduzida (uma combinação)")
+    parser.add_argument("--output", metavar="ARQUIVO", help="Grava o JSON no arquivo (padrão: stdout)")
+    parser.add_argument("--baseline", metavar="ARQUIVO", help="JSON de referência para comparação")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workloads = args.workload or list(WORKLOADS)
+    sweep = QUICK_SWEEP if args.quick else SWEEP
+    results = run_suite(workloads, sweep, args.ops, args.seed, args.dedup,
+                        args.devices, args.raid)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "ops": args.ops,
+            "dedup": args.dedup,
+            "devices": args.devices,
+            "raid": args.raid,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
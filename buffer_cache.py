@@ -0,0 +1,244 @@
+import threading
+from collections import Counter, OrderedDict
+
+
+class BufferCache:
+    """
+    Cache de blocos (buffer cache) entre os arquivos e o disco.
+
+    Mantém até `capacity` blocos em memória com política LRU. Escritas ficam
+    no cache marcadas como sujas (write-back) e só chegam ao disco quando o
+    bloco é despejado ou em um sync explícito. Expõe a mesma interface de
+    alocação/leitura do MemoryDisk, então pode ser injetado no FileSystem no
+    lugar do disco; o que não é tratado aqui é delegado ao disco subjacente.
+
+    As estruturas do cache são protegidas por uma trava própria. Blocos sujos
+    despejados são gravados fora dela (acertos de outras threads não esperam
+    pelo disco), sob uma trava de E/S que ordena as gravações. Ordem das
+    travas: alocador do disco, E/S, cache.
+    """
+    def __init__(self, disk, capacity=64):
+        if capacity < 1:
+            raise ValueError("A capacidade do cache deve ser de pelo menos 1 bloco.")
+        self.disk = disk
+        self.capacity = capacity
+        self.block_size = disk.block_size
+        # índice do bloco -> conteúdo (bytes); a ordem representa a recência de uso
+        self._blocks = OrderedDict()
+        self._dirty = set()
+        # Blocos sujos já despejados, a caminho do disco (índice -> conteúdo)
+        self._writing = {}
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()
+
+        # Contadores
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writebacks = 0
+        # Com journal, os blocos sujos vão ao disco antes de cada commit (modo ordered)
+        disk.on_commit(self.write_back)
+
+    def __getattr__(self, name):
+        # Delegação ao disco (bitmap, contadores, ganchos de persistência...)
+        return getattr(self.disk, name)
+
+    # ------------------------------------------------------------------
+    # Gerência das entradas
+    # ------------------------------------------------------------------
+
+    def _insert(self, idx, content, dirty):
+        """
+        Insere a entrada e despeja as excedentes. Retorna os blocos sujos
+        despejados, a gravar com _write_evicted depois de soltar a trava.
+        """
+        self._blocks[idx] = content
+        self._blocks.move_to_end(idx)
+        if dirty:
+            self._dirty.add(idx)
+        victims = []
+        while len(self._blocks) > self.capacity:
+            victim = self._evict()
+            if victim is not None:
+                victims.append(victim)
+        return victims
+
+    def _evict(self):
+        """
+        Despeja o bloco menos recentemente usado. Se estiver sujo, passa a
+        aguardar gravação em _writing e é retornado como (índice, conteúdo).
+        """
+        idx, content = self._blocks.popitem(last=False)
+        self.evictions += 1
+        if idx not in self._dirty:
+            return None
+        self._dirty.discard(idx)
+        self._writing[idx] = content
+        return idx, content
+
+    def _write_evicted(self, victims):
+        """Grava os blocos sujos despejados, fora da trava do cache."""
+        if not victims:
+            return
+        with self._io_lock:
+            with self._lock:
+                # Descartados, já gravados ou despejados de novo no intervalo
+                victims = [(idx, content) for idx, content in victims
+                           if self._writing.get(idx) is content]
+            self.disk.write_blocks(victims)
+            with self._lock:
+                for idx, content in victims:
+                    if self._writing.get(idx) is content:
+                        del self._writing[idx]
+                self.writebacks += len(victims)
+
+    def _drop(self, extents):
+        """Descarta entradas (inclusive sujas) dos blocos indicados."""
+        for start, length in extents:
+            for idx in range(start, start + length):
+                self._writing.pop(idx, None)
+                if self._blocks.pop(idx, None) is not None:
+                    self._dirty.discard(idx)
+
+    def _flush_blocks(self, extents):
+        """Grava no disco as entradas sujas dos blocos indicados."""
+        blocks = []
+        for start, length in extents:
+            for idx in range(start, start + length):
+                if idx in self._dirty:
+                    self._dirty.discard(idx)
+                    self._writing.pop(idx, None)
+                    blocks.append((idx, self._blocks[idx]))
+                elif idx in self._writing:
+                    blocks.append((idx, self._writing.pop(idx)))
+        self.disk.write_blocks(blocks)
+        self.writebacks += len(blocks)
+
+    # ------------------------------------------------------------------
+    # Interface de bloco
+    # ------------------------------------------------------------------
+
+    def read_block(self, idx):
+        with self._lock:
+            content = self._blocks.get(idx)
+            if content is not None:
+                self.hits += 1
+                self._blocks.move_to_end(idx)
+                return content
+            self.misses += 1
+            # Um bloco despejado ainda a caminho do disco é lido do próprio despejo
+            content = self._writing.get(idx)
+            if content is None:
+                content = self.disk.read_block(idx)
+            victims = self._insert(idx, content, dirty=False)
+        self._write_evicted(victims)
+        return content
+
+    def write_block(self, idx, content):
+        if len(content) < self.block_size:
+            content = bytes(content) + bytes(self.block_size - len(content))
+        with self._lock:
+            victims = self._insert(idx, bytes(content), dirty=True)
+        self._write_evicted(victims)
+
+    # ------------------------------------------------------------------
+    # Interface do disco
+    # ------------------------------------------------------------------
+
+    def allocate(self, content):
+        """Reserva blocos no disco e grava o conteúdo apenas no cache (sujo)."""
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        if self.disk.dedup:
+            # Blocos inéditos são gravados no cache; os repetidos só ganham referência
+            return self.disk.allocate_dedup(content, self.write_block)
+        n_blocks = -(-len(content) // self.block_size)  # divisão com teto
+        extents = self.disk.reserve(n_blocks)
+        self.write(extents, content)
+        return extents
+
+    def write(self, extents, content):
+        src = memoryview(content)
+        bs = self.block_size
+        offset = 0
+        for start, length in extents:
+            for idx in range(start, start + length):
+                self.write_block(idx, src[offset:offset + bs])
+                offset += bs
+
+    def iter_views(self, extents, size=None):
+        """Gera o conteúdo bloco a bloco, truncado em size bytes."""
+        bs = self.block_size
+        remaining = size if size is not None else float("inf")
+        for start, length in extents:
+            for idx in range(start, start + length):
+                if remaining <= 0:
+                    return
+                content = self.read_block(idx)
+                yield content if remaining >= bs else content[:remaining]
+                remaining -= bs
+
+    def read(self, extents, size=None):
+        return b"".join(self.iter_views(extents, size))
+
+    def free(self, extents):
+        # Blocos que realmente voltam a ficar livres (última referência) não
+        # precisam ser gravados: descarta suas entradas. Blocos compartilhados
+        # continuam em uso por outro arquivo e permanecem no cache. Um bloco
+        # pode aparecer mais de uma vez nos extents (deduplicação).
+        refcount = self.disk.refcount
+        with self.disk.alloc_lock, self._io_lock, self._lock:
+            counts = Counter(idx for start, length in extents for idx in range(start, start + length))
+            released = [(idx, 1) for idx, n in counts.items() if refcount[idx] <= n]
+            self._drop(released)
+            self.disk.free(extents)
+
+    def relocate(self, extents, new_start):
+        with self.disk.alloc_lock, self._io_lock, self._lock:
+            self._flush_blocks(extents)
+            self._drop(extents)
+            return self.disk.relocate(extents, new_start)
+
+    def write_back(self):
+        """
+        Grava todos os blocos sujos no disco, em ordem de endereço, com um
+        único write_blocks (um volume distribui o lote entre os dispositivos).
+        Inclui os despejados ainda não gravados.
+        """
+        with self._io_lock, self._lock:
+            pending = dict(self._writing)
+            pending.update((idx, self._blocks[idx]) for idx in self._dirty)
+            self.disk.write_blocks(sorted(pending.items()))
+            self.writebacks += len(pending)
+            self._dirty.clear()
+            self._writing.clear()
+
+    def sync(self):
+        """Grava todos os blocos sujos e descarrega o disco."""
+        self.write_back()
+        self.disk.flush()
+
+    def flush(self):
+        self.sync()
+
+    def close(self):
+        self.sync()
+        self.disk.close()
+
+    def stats(self):
+        """Retorna os contadores do cache."""
+        with self._lock:
+            return self._stats()
+
+    def _stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "capacity": self.capacity,
+            "cached": len(self._blocks),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "writebacks": self.writebacks,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,89 @@
+"""
+Cliente do modo servidor (python main.py --serve).
+
+Interativo quando a entrada padrão é um terminal; caso contrário envia as
+linhas da entrada (ou os comandos passados com -c) e imprime as respostas:
+
+    python client.py --port 7070 --user alice
+    python client.py --unix /tmp/m3so.sock -c "ls" -c "du /"
+"""
+import argparse
+import socket
+import sys
+
+from server import PROMPT_MARK
+
+
+class Client:
+    """Conexão bloqueante com o servidor: envia comandos e lê as respostas."""
+
+    def __init__(self, host="127.0.0.1", port=7070, unix=None):
+        if unix:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection((host, port))
+        self._reader = self.sock.makefile("r", encoding="utf-8", newline="\n")
+        self.prompt = ""
+        self.closed = False
+        # Banner de boas-vindas
+        self.banner = self._read_reply()
+
+    def _read_reply(self):
+        """Lê a saída até a linha de prompt (ou até o servidor fechar a conexão)."""
+        lines = []
+        for line in self._reader:
+            if line.startswith(PROMPT_MARK):
+                self.prompt = line[len(PROMPT_MARK):].rstrip("\n")
+                return "".join(lines)
+            lines.append(line)
+        self.closed = True
+        return "".join(lines)
+
+    def send(self, command):
+        """Executa um comando no servidor e retorna a saída."""
+        self.sock.sendall((command.rstrip("\n") + "\n").encode("utf-8"))
+        return self._read_reply()
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cliente do servidor M3-SO")
+    parser.add_argument("--host", default="127.0.0.1", help="Endereço do servidor (padrão: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=7070, help="Porta do servidor (padrão: 7070)")
+    parser.add_argument("--unix", metavar="CAMINHO", help="Conecta a um socket Unix em vez de TCP")
+    parser.add_argument("--user", help="Usuário da sessão (executa 'su <usuario>' ao conectar)")
+    parser.add_argument("-c", dest="commands", action="append", metavar="COMANDO",
+                        help="Comando a executar (pode repetir); sem -c lê da entrada padrão")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    client = Client(args.host, args.port, args.unix)
+    try:
+        if args.user:
+            client.send(f"su {args.user}")
+        if args.commands or not sys.stdin.isatty():
+            for command in args.commands or sys.stdin:
+                sys.stdout.write(client.send(command))
+                if client.closed:
+                    break
+            return
+        sys.stdout.write(client.banner)
+        while not client.closed:
+            try:
+                command = input(client.prompt)
+            except (EOFError, KeyboardInterrupt):
+                print()
+                break
+            sys.stdout.write(client.send(command))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,513 @@
+import contextlib
 import time
 from file_type import FileType
+from inode_table import InodeTable
 
 class File:
     """
     File Control Block (FCB).
-    Armazena metadados e ponteiros para os blocos de dados no disco.
+    Visão leve (__slots__) sobre uma linha da tabela de inodes: metadados e
+    extents dos blocos de dados no disco ficam na InodeTable.
     """
-    _id_counter = 1
+    __slots__ = ("table", "ino", "disk")
 
-    def __init__(self, name, user, file_type=FileType.CHAR, disk_ref=None):
-        self.id = File._id_counter
-        File._id_counter += 1
+    def __init__(self, name, user, file_type=FileType.CHAR, disk_ref=None, table=None, parent=0, ino=None):
+        # Aloca o inode; números liberados são reutilizados pela tabela
+        self.table = table if table is not None else InodeTable.shared()
+        # Propriedade (Owner/Group) e Permissões padrão (rw-r--r--)
+        self.ino = self.table.alloc(InodeTable.FILE, name, parent=parent, ftype=file_type.value,
+                                    mode=0o644, uid=user.uid, gid=user.gid, now=time.time(), ino=ino)
+        self.disk = disk_ref
 
-        self.name = name
-        self.size = 0
-        self.type = file_type
+    @classmethod
+    def view(cls, table, ino, disk=None):
+        """Cria uma visão sobre um inode de arquivo já existente."""
+        file_obj = cls.__new__(cls)
+        file_obj.table = table
+        file_obj.ino = ino
+        file_obj.disk = disk if disk is not None else table.disk
+        return file_obj
 
-        # Timestamps
-        now = time.time()
-        self.created_at = now
-        self.updated_at = now
-        self.access_at = now
+    def __eq__(self, other):
+        return isinstance(other, File) and other.ino == self.ino and other.table is self.table
 
-        # Propriedade (Owner/Group) e Permissões padrão (rw-r--r--)
-        self.uid = user.uid
-        self.gid = user.gid
-        self.permissions = 0o644
+    def __hash__(self):
+        return self.ino
 
-        self.disk = disk_ref
-        self.blocks = [] # Lista de índices dos blocos no MemoryDisk
+    @property
+    def id(self):
+        return self.ino
+
+    @property
+    def name(self):
+        return self.table.names[self.ino]
+
+    @name.setter
+    def name(self, value):
+        self.table.names[self.ino] = value
+
+    @property
+    def type(self):
+        return FileType(self.table.ftype[self.ino])
+
+    @type.setter
+    def type(self, value):
+        self.table.ftype[self.ino] = value.value
+
+    @property
+    def uid(self):
+        return self.table.uid[self.ino]
+
+    @uid.setter
+    def uid(self, value):
+        self.table.set_owner(self.ino, uid=value)
+
+    @property
+    def gid(self):
+        return self.table.gid[self.ino]
+
+    @gid.setter
+    def gid(self, value):
+        self.table.set_owner(self.ino, gid=value)
+
+    @property
+    def permissions(self):
+        return self.table.mode[self.ino]
+
+    @permissions.setter
+    def permissions(self, value):
+        self.table.set_mode(self.ino, value)
+
+    # Timestamps
+    @property
+    def created_at(self):
+        return self.table.ctime[self.ino]
+
+    @created_at.setter
+    def created_at(self, value):
+        self.table.ctime[self.ino] = value
+
+    @property
+    def updated_at(self):
+        return self.table.mtime[self.ino]
+
+    @updated_at.setter
+    def updated_at(self, value):
+        self.table.mtime[self.ino] = value
+
+    @property
+    def access_at(self):
+        return self.table.atime[self.ino]
+
+    @access_at.setter
+    def access_at(self, value):
+        self.table.atime[self.ino] = value
+
+    @property
+    def extents(self):
+        """Lista de extents (inicio, comprimento) no MemoryDisk."""
+        return self.table.get_extents(self.ino)
+
+    @extents.setter
+    def extents(self, value):
+        self.table.set_extents(self.ino, value)
+
+    @property
+    def size(self):
+        return self.table.size[self.ino]
+
+    @size.setter
+    def size(self, value):
+        table = self.table
+        delta = value - table.size[self.ino]
+        table.size[self.ino] = value
+        # Propaga a variação para os diretórios ancestrais (O(profundidade))
+        if delta and table.parent[self.ino]:
+            table.add_usage(table.parent[self.ino], delta, 0, self.disk)
+
+    @property
+    def blocks(self):
+        """Lista de índices dos blocos no MemoryDisk (derivada dos extents)."""
+        return [idx for start, length in self.extents for idx in range(start, start + length)]
+
+    def block_count(self):
+        """Número de blocos ocupados pelo arquivo."""
+        return self.table.block_count(self.ino)
+
+    def _check_quota(self, n_blocks):
+        """Lança exceção se o dono ou o grupo não puder receber mais n_blocks blocos."""
+        if n_blocks > 0:
+            self.table.quotas.check(self.uid, self.gid, blocks=n_blocks)
 
     def touch(self):
         """Atualiza data de modificação."""
         self.updated_at = time.time()
 
     def echo(self, content):
-        """Escreve conteúdo no arquivo, alocando blocos no disco."""
+        """
+        Escreve conteúdo no arquivo, alocando blocos no disco.
+        Aceita texto (gravado em UTF-8) ou bytes; o tamanho é medido em bytes.
+        Lança exceção se a cota do dono (ou do grupo) não comportar o novo
+        conteúdo (o arquivo fica intacto) ou se faltar espaço no disco (o
+        arquivo fica vazio).
+        """
         if self.disk:
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            self._check_quota(-(-len(content) // self.disk.block_size) - self.block_count())
             # Sobrescreve: Libera blocos antigos antes de alocar novos
-            if self.blocks:
-                self.disk.free(self.blocks)
+            if self.extents:
+                self.disk.free(self.extents)
+                self.extents = []
+                self.size = 0
 
             try:
-                self.blocks = self.disk.allocate(content)
+                self.extents = self.disk.allocate(content)
                 self.size = len(content)
                 self.updated_at = time.time()
-                print(f"Conteúdo escrito em {self.name}. Blocos alocados: {self.blocks}")
-            except Exception as e:
-                print(e)
+                print(f"Conteúdo escrito em {self.name}. Extents alocados: {self.extents}")
+            finally:
+                # Persiste os novos metadados (no-op em discos voláteis)
+                self.disk.sync_file(self)
+
+    # ------------------------------------------------------------------
+    # Escrita parcial (modifica apenas os blocos afetados)
+    # ------------------------------------------------------------------
+
+    def _iter_physical(self, first, last):
+        """Gera os índices físicos dos blocos lógicos first..last (inclusive)."""
+        logical = 0
+        for start, length in self.extents:
+            if logical + length > first:
+                lo = max(first - logical, 0)
+                hi = min(last - logical, length - 1)
+                for i in range(lo, hi + 1):
+                    yield start + i
+            logical += length
+            if logical > last:
+                return
+
+    def _grow(self, n_blocks):
+        """Reserva n_blocks novos blocos no fim do arquivo (unindo extents vizinhos)."""
+        self._check_quota(n_blocks)
+        extents = self.extents
+        for start, length in self.disk.reserve(n_blocks):
+            if extents and extents[-1][0] + extents[-1][1] == start:
+                last_start, last_len = extents[-1]
+                extents[-1] = (last_start, last_len + length)
+            else:
+                extents.append((start, length))
+        self.extents = extents
+
+    def _shrink(self, n_blocks):
+        """Mantém apenas os n_blocks primeiros blocos e libera o restante."""
+        kept, released = [], []
+        remaining = n_blocks
+        for start, length in self.extents:
+            if remaining >= length:
+                kept.append((start, length))
+                remaining -= length
+            elif remaining > 0:
+                kept.append((start, remaining))
+                released.append((start + remaining, length - remaining))
+                remaining = 0
+            else:
+                released.append((start, length))
+        if released:
+            self.disk.free(released)
+        self.extents = kept
+
+    def _unshare(self, first, last):
+        """
+        Copy-on-write: antes de modificar os blocos lógicos first..last, troca
+        os blocos compartilhados com outros arquivos por cópias exclusivas.
+        Apenas os blocos compartilhados da faixa são copiados.
+        """
+        physical = list(self._iter_physical(first, last))
+        # Blocos deduplicados deixam o índice antes da conferência: nenhuma
+        # alocação nova pode passar a compartilhá-los durante a escrita
+        self.disk.unindex(physical)
+        shared = [i for i, idx in enumerate(physical) if self.disk.is_shared(idx)]
+        if not shared:
+            return
+        new_blocks = self.disk.expand(self.disk.reserve(len(shared)))
+        blocks = self.blocks
+        released = []
+        for i, new_idx in zip(shared, new_blocks):
+            old_idx = physical[i]
+            self.disk.write_block(new_idx, self.disk.read_block(old_idx))
+            blocks[first + i] = new_idx
+            released.append((old_idx, 1))
+        # Devolve a referência deste arquivo aos blocos originais
+        self.disk.free(released)
+
+        # Reconstrói a lista de extents unindo blocos vizinhos
+        extents = []
+        for idx in blocks:
+            if extents and extents[-1][0] + extents[-1][1] == idx:
+                extents[-1] = (extents[-1][0], extents[-1][1] + 1)
+            else:
+                extents.append((idx, 1))
+        self.extents = extents
+
+    def pwrite(self, offset, data):
+        """
+        Escreve data a partir de offset, alterando apenas os blocos afetados.
+        Escritas além do fim preenchem o intervalo com zeros e alocam somente
+        os novos blocos da cauda. Retorna o número de bytes escritos.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if offset < 0:
+            raise ValueError("Erro: Offset negativo.")
+        if not data:
+            return 0
+        written = len(data)
+        if offset > self.size:
+            # Preenche o "buraco" entre o fim atual e o offset com zeros
+            data = bytes(offset - self.size) + data
+            offset = self.size
+
+        bs = self.disk.block_size
+        end = offset + len(data)
+        needed = -(-end // bs)  # divisão com teto
+        have = self.block_count()
+        first, last = offset // bs, (end - 1) // bs
+        # Reserva antes de escrever: se faltar espaço, o arquivo fica intacto
+        if needed > have:
+            self._grow(needed - have)
+        try:
+            self._unshare(first, min(last, have - 1))
+        except Exception:
+            # Devolve a cauda recém-reservada
+            self._shrink(have)
+            raise
+
+        src = memoryview(data)
+        pos = 0
+        for lbn, idx in enumerate(self._iter_physical(first, last), start=first):
+            block_lo = lbn * bs
+            lo = max(offset, block_lo) - block_lo
+            hi = min(end, block_lo + bs) - block_lo
+            chunk = src[pos:pos + hi - lo]
+            if lo == 0 and (hi == bs or block_lo + hi >= self.size):
+                # Bloco inteiro (ou cauda sem dados válidos após o trecho)
+                self.disk.write_block(idx, chunk)
+            else:
+                # Leitura-modificação-escrita de um bloco parcial
+                block = bytearray(self.disk.read_block(idx))
+                block[lo:hi] = chunk
+                self.disk.write_block(idx, block)
+            pos += hi - lo
+
+        self.size = max(self.size, end)
+        self.updated_at = time.time()
+        self.disk.sync_file(self)
+        return written
+
+    def append(self, data):
+        """Acrescenta data ao fim do arquivo. Retorna o número de bytes escritos."""
+        return self.pwrite(self.size, data)
+
+    def truncate(self, size):
+        """
+        Ajusta o tamanho do arquivo. Ao encolher, libera os blocos excedentes e
+        zera o restante do último bloco; ao crescer, completa com zeros.
+        """
+        if size < 0:
+            raise ValueError("Erro: Tamanho negativo.")
+        if size > self.size:
+            self.pwrite(self.size, bytes(size - self.size))
+            return
+        bs = self.disk.block_size
+        if size % bs:
+            # Copia o último bloco (se compartilhado) antes de liberar a cauda:
+            # se faltar espaço, o arquivo fica intacto
+            self._unshare(size // bs, size // bs)
+        self._shrink(-(-size // bs))
+        if size % bs:
+            # Zera a sobra do último bloco para que um crescimento futuro leia zeros
+            idx = next(self._iter_physical(size // bs, size // bs))
+            block = bytearray(self.disk.read_block(idx))
+            block[size % bs:] = bytes(bs - size % bs)
+            self.disk.write_block(idx, block)
+        self.size = size
+        self.updated_at = time.time()
+        self.disk.sync_file(self)
+
+    # ------------------------------------------------------------------
+    # Leitura por faixas / streaming
+    # ------------------------------------------------------------------
+
+    def _range_extents(self, first, last):
+        """Recorta os extents que cobrem os blocos lógicos first..last (inclusive)."""
+        ranged = []
+        logical = 0
+        for start, length in self.extents:
+            if logical + length > first:
+                lo = max(first - logical, 0)
+                hi = min(last - logical, length - 1)
+                ranged.append((start + lo, hi - lo + 1))
+            logical += length
+            if logical > last:
+                break
+        return ranged
+
+    def pread(self, offset, length):
+        """Lê até length bytes a partir de offset, acessando apenas os blocos da faixa."""
+        self.access_at = time.time()
+        if offset < 0:
+            raise ValueError("Erro: Offset negativo.")
+        end = min(offset + length, self.size)
+        if offset >= end or not self.disk:
+            return b""
+        bs = self.disk.block_size
+        first = offset // bs
+        data = self.disk.read(self._range_extents(first, (end - 1) // bs), end - first * bs)
+        return data[offset - first * bs:]
+
+    def iter_chunks(self, chunk_size=4096):
+        """
+        Gera o conteúdo do arquivo em pedaços de até chunk_size bytes,
+        sem montar o arquivo inteiro em memória.
+        """
+        self.access_at = time.time()
+        if not self.disk or not self.extents:
+            return
+        pending = bytearray()
+        for view in self.disk.iter_views(self.extents, self.size):
+            pending += view
+            while len(pending) >= chunk_size:
+                yield bytes(pending[:chunk_size])
+                del pending[:chunk_size]
+        if pending:
+            yield bytes(pending)
 
     def cat(self):
-        """Lê o conteúdo do disco baseado nos blocos alocados."""
+        """
+        Lê o conteúdo do disco baseado nos blocos alocados.
+        Arquivos BINARY retornam bytes; os demais são decodificados como texto.
+        """
         self.access_at = time.time()
-        if self.disk and self.blocks:
-            return self.disk.read(self.blocks)
-        return ""
+        data = b""
+        if self.disk and self.extents:
+            data = self.disk.read(self.extents, self.size)
+        if self.type == FileType.BINARY:
+            return data
+        return data.decode("utf-8", errors="replace")
+
+    def share_from(self, other_file):
+        """
+        Torna este arquivo uma cópia de other_file compartilhando os blocos
+        (copy-on-write): apenas os contadores de referência são atualizados.
+        Os blocos passam a contar também na cota do dono desta cópia.
+        """
+        self._check_quota(other_file.block_count() - self.block_count())
+        if self.extents:
+            self.disk.free(self.extents)
+        self.disk.share(other_file.extents)
+        self.extents = list(other_file.extents)
+        self.size = other_file.size
+        self.type = other_file.type
+        self.updated_at = time.time()
+        self.disk.sync_file(self)
 
     def copy_meta_from(self, other_file):
         """Copia metadados de outro arquivo (usado em cp -p, se implementado)."""
         self.size = other_file.size
         self.type = other_file.type
-        self.permissions = other_file.permissions
\ No newline at end of file
+        self.permissions = other_file.permissions
+
+
+class FileHandle:
+    """
+    Descritor de arquivo aberto: mantém a posição corrente e lê/escreve
+    por faixas (pread/pwrite) em vez de carregar o arquivo inteiro.
+    Modos: 'r' (leitura), 'w' (escrita, trunca), 'a' (acréscimo).
+    Com locks (LockTable), cada leitura/escrita trava o arquivo enquanto executa.
+    """
+    def __init__(self, file_obj, mode="r", locks=None):
+        if mode not in ("r", "w", "a"):
+            raise ValueError(f"Modo inválido: {mode}")
+        self.file = file_obj
+        self.mode = mode
+        self.pos = 0
+        self.closed = False
+        self._locks = locks
+        if mode == "w":
+            with self._transaction(), self._locked(write=True):
+                file_obj.truncate(0)
+        elif mode == "a":
+            self.pos = file_obj.size
+
+    def _transaction(self):
+        disk = self.file.disk
+        return disk.transaction() if disk is not None else contextlib.nullcontext()
+
+    def _locked(self, write=False):
+        if self._locks is None:
+            return contextlib.nullcontext()
+        return (self._locks.write if write else self._locks.read)(self.file.ino)
+
+    def _check(self, *modes):
+        if self.closed:
+            raise ValueError("Erro: Operação em arquivo fechado.")
+        if self.mode not in modes:
+            raise ValueError(f"Erro: Operação não permitida no modo '{self.mode}'.")
+
+    def read(self, n=-1):
+        """Lê até n bytes a partir da posição corrente (n < 0: até o fim)."""
+        self._check("r")
+        with self._locked():
+            if n is None or n < 0:
+                n = max(self.file.size - self.pos, 0)
+            data = self.file.pread(self.pos, n)
+        self.pos += len(data)
+        return data
+
+    def write(self, data):
+        """Escreve na posição corrente (no fim, em modo 'a')."""
+        self._check("w", "a")
+        with self._transaction(), self._locked(write=True):
+            if self.mode == "a":
+                self.pos = self.file.size
+            written = self.file.pwrite(self.pos, data)
+        self.pos += written
+        return written
+
+    def seek(self, offset, whence=0):
+        """Reposiciona o cursor (0: início, 1: atual, 2: fim). Retorna a nova posição."""
+        if self.closed:
+            raise ValueError("Erro: Operação em arquivo fechado.")
+        if whence == 0:
+            base = 0
+        elif whence == 1:
+            base = self.pos
+        elif whence == 2:
+            base = self.file.size
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if base + offset < 0:
+            raise ValueError("Erro: Posição negativa.")
+        self.pos = base + offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def __iter__(self):
+        """Itera pelo restante do arquivo em pedaços."""
+        while True:
+            chunk = self.read(4096)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
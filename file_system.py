@@ -1,189 +1,1021 @@
+import codecs
+import fnmatch
+import functools
+import heapq
+import itertools
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
 from file_type import FileType
-from file import File
+from file import File, FileHandle
+from inode_table import InodeTable
+from locks import LockTable
+from session import Session
+
+def _glob_literal(pattern):
+    """Trecho inicial de um padrão glob sem curingas (*, ? ou [)."""
+    for i, ch in enumerate(pattern):
+        if ch in "*?[":
+            return pattern[:i]
+    return pattern
+
+
+def _prefix_end(prefix):
+    """Menor texto maior que todos os que começam com prefix (ou None)."""
+    while prefix and prefix[-1] == "\U0010ffff":
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class _Children(MutableMapping):
+    """
+    Filhos de um diretório: mapeia nome -> Node sobre o dicionário
+    nome -> inode guardado na tabela. Inserções e remoções também
+    atualizam o índice ordenado de nomes do diretório, se já existir.
+    """
+    __slots__ = ("table", "ino", "entries")
+
+    def __init__(self, table, ino, entries):
+        self.table = table
+        self.ino = ino
+        self.entries = entries
+
+    def __getitem__(self, name):
+        return Node(self.table, self.entries[name])
+
+    def __setitem__(self, name, node):
+        if name not in self.entries:
+            index = self.table.name_indexes.get(self.ino)
+            if index is not None:
+                index.add(name)
+        self.entries[name] = node.ino
+
+    def __delitem__(self, name):
+        del self.entries[name]
+        index = self.table.name_indexes.get(self.ino)
+        if index is not None:
+            index.remove(name)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
 
 class Node:
     """
     Representa um nó na árvore do sistema de arquivos.
     Pode ser um diretório (contendo filhos) ou um arquivo (contendo um objeto File).
+    É apenas uma visão sobre uma linha da tabela de inodes (InodeTable).
     """
-    def __init__(self, name, is_dir=False, parent=None, file_obj=None):
-        self.name = name
-        self.is_dir = is_dir
-        self.parent = parent
-        # Se for diretório, inicializa dicionário de filhos; caso contrário, None.
-        self.children = {} if is_dir else None
-        # Referência ao objeto File (FCB) se for um arquivo.
-        self.file = file_obj
+    __slots__ = ("table", "ino")
+
+    def __init__(self, table, ino):
+        self.table = table
+        self.ino = ino
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and other.ino == self.ino and other.table is self.table
+
+    def __hash__(self):
+        return self.ino
+
+    @property
+    def name(self):
+        return self.table.names[self.ino]
+
+    @name.setter
+    def name(self, value):
+        self.table.names[self.ino] = value
+
+    @property
+    def is_dir(self):
+        return self.table.kind[self.ino] == InodeTable.DIR
+
+    @property
+    def parent(self):
+        parent_ino = self.table.parent[self.ino]
+        return Node(self.table, parent_ino) if parent_ino else None
+
+    @parent.setter
+    def parent(self, node):
+        self.table.parent[self.ino] = node.ino if node is not None else 0
+
+    @property
+    def file(self):
+        """Objeto File (FCB) se for um arquivo; None para diretórios."""
+        if self.is_dir:
+            return None
+        return File.view(self.table, self.ino)
+
+    @property
+    def children(self):
+        # Diretórios vindos de uma imagem em disco só leem seus filhos no
+        # primeiro acesso (montagem preguiçosa)
+        if not self.is_dir:
+            return None
+        return _Children(self.table, self.ino, self.table.children(self.ino))
+
+    # Agregados da subárvore (apenas diretórios): bytes e quantidade de arquivos
+    @property
+    def agg_size(self):
+        return self.table.size[self.ino]
+
+    @property
+    def agg_files(self):
+        return self.table.nfiles[self.ino]
+
+    def add_usage(self, d_size, d_files, disk=None):
+        """
+        Soma as variações de tamanho e de número de arquivos a este diretório
+        e a todos os seus ancestrais (O(profundidade)).
+        """
+        self.table.add_usage(self.ino, d_size, d_files, disk)
+
+    def usage(self):
+        """Retorna (bytes, arquivos) da subárvore (ou do próprio arquivo)."""
+        if self.is_dir:
+            return self.agg_size, self.agg_files
+        return self.table.size[self.ino], 1
+
+
+def _transaction(method):
+    """
+    Executa a operação dentro de uma transação do disco: com journal, suas
+    alterações de metadados são confirmadas juntas (ou descartadas juntas).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.disk.transaction():
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class FileSystem:
     """
     Controlador principal do sistema de arquivos.
     Gerencia a navegação, criação e exclusão de nós e interage com o disco e permissões.
+
+    Pode ser usado por várias threads. O estado de cada usuário (diretório
+    atual e credenciais) fica em um objeto Session, passado no lugar do
+    usuário. A concorrência é controlada por travas finas:
+      - travas de leitores/escritor por inode (LockTable): leituras do mesmo
+        arquivo ou de arquivos diferentes não se bloqueiam; escritas e
+        alterações de um diretório são exclusivas;
+      - uma trava de renomeação para mv, rm -r e cp -r (operações que
+        mudam a forma da árvore), sempre adquirida antes das travas de inode;
+      - travas próprias do alocador de blocos, da tabela de inodes e do cache.
+    A resolução de caminhos não trava: as consultas aos dicionários de
+    filhos são atômicas e o resultado é revalidado após travar o inode.
     """
+    # Tamanho dos pedaços usados na leitura em streaming (cat, cp)
+    STREAM_CHUNK = 4096
+
     def __init__(self, disk_manager, permission_manager):
-        # Inicializa a raiz do sistema
-        self.root = Node("/", is_dir=True)
-        self.current_dir = self.root
+        # Tabela de inodes: metadados de todos os nós em colunas compactas
+        self.inodes = InodeTable()
+        self.inodes.disk = disk_manager
+        # Inicializa a raiz do sistema (ou monta a raiz de uma imagem existente)
+        root_ino = disk_manager.mount_root(self.inodes) or self.inodes.alloc(
+            InodeTable.DIR, "/", ftype=FileType.DIRECTORY.value, mode=0o755, now=time.time())
+        self.root = Node(self.inodes, root_ino)
         self.disk = disk_manager
         self.pm = permission_manager
+        # Cotas por usuário/grupo (uso contabilizado pela tabela de inodes)
+        self.quotas = self.inodes.quotas
+        # Travas por inode e trava de renomeação
+        self._locks = LockTable()
+        self._rename_lock = threading.Lock()
+        # Incrementada quando diretórios são removidos ou movidos: as sessões
+        # revalidam o diretório atual ao perceber a mudança
+        self.generation = 0
+        # Fila de arquivos pendentes da passada atual do desfragmentador incremental
+        self._defrag_queue = []
+        self._defrag_lock = threading.Lock()
+        # Cache de dentries: caminho absoluto normalizado (tupla de componentes) -> Node.
+        # Apenas buscas bem-sucedidas são guardadas.
+        self._dcache = {}
+        self._dcache_lock = threading.Lock()
+        # Incrementada a cada invalidação: buscas iniciadas antes dela não alimentam o cache
+        self._dcache_gen = 0
+
+    # ------------------------------------------------------------------
+    # Resolução de caminhos
+    # ------------------------------------------------------------------
+
+    DCACHE_SIZE = 4096
+
+    def _abspath(self, path, user=None):
+        """
+        Normaliza um caminho absoluto ou relativo (com '.', '..' e barras
+        repetidas) na tupla de componentes a partir da raiz. Caminhos
+        relativos partem do diretório atual da sessão (ou da raiz).
+        """
+        if path.startswith("/") or not isinstance(user, Session):
+            parts = []
+        else:
+            parts = list(user.cwd)
+        for comp in path.split("/"):
+            if comp == "" or comp == ".":
+                continue
+            if comp == "..":
+                if parts:
+                    parts.pop()
+            else:
+                parts.append(comp)
+        return tuple(parts)
+
+    def _lookup_key(self, key):
+        """Resolve uma tupla de componentes, consultando e alimentando o cache de dentries."""
+        node = self._dcache.get(key)
+        if node is not None:
+            return node
+        gen = self._dcache_gen
+        node = self.root
+        found = []
+        for comp in key:
+            # Diretório removido por outra thread durante a busca: children é None
+            children = node.children if node.is_dir else None
+            if children is None:
+                return None
+            node = children.get(comp)
+            if node is None:
+                return None
+            found.append(node)
+        with self._dcache_lock:
+            # Uma invalidação durante a busca pode tornar o resultado obsoleto
+            if gen == self._dcache_gen:
+                if len(self._dcache) + len(found) > self.DCACHE_SIZE:
+                    self._dcache.clear()
+                for depth, hit in enumerate(found, start=1):
+                    self._dcache[key[:depth]] = hit
+        return node
+
+    def _lookup(self, path, user=None):
+        """Resolve um caminho para o nó correspondente (ou None)."""
+        return self._lookup_key(self._abspath(path, user))
+
+    def _still(self, key, node):
+        """Revalida (após travar) que o caminho ainda leva ao mesmo nó."""
+        return self._lookup_key(key) == node
+
+    def _resolve_parent(self, path, user=None):
+        """
+        Resolve o diretório pai de um caminho a ser criado.
+        Retorna (pai, nome, chave) ou (None, mensagem de erro, None).
+        """
+        key = self._abspath(path, user)
+        if not key:
+            return None, "Erro: Caminho inválido.", None
+        parent = self._lookup_key(key[:-1])
+        if parent is None:
+            return None, f"Erro: '{path}' não encontrado.", None
+        if not parent.is_dir:
+            return None, f"Erro: '{path}' não é um diretório.", None
+        return parent, key[-1], key
+
+    def _invalidate(self, key, node):
+        """Remove do cache a entrada de um nó (e, se for diretório, de toda a subárvore)."""
+        with self._dcache_lock:
+            self._dcache_gen += 1
+            if node.is_dir:
+                n = len(key)
+                for cached in [k for k in self._dcache if k[:n] == key]:
+                    del self._dcache[cached]
+            else:
+                self._dcache.pop(key, None)
 
-    def get_pwd(self):
-        """Retorna o caminho absoluto do diretório atual."""
-        if self.current_dir == self.root:
-            return "/"
-        path = ""
-        node = self.current_dir
-        # Percorre a árvore de baixo para cima até a raiz
+    def _is_ancestor(self, node, other):
+        """Indica se node é other ou um de seus ancestrais."""
+        while other is not None:
+            if other == node:
+                return True
+            other = other.parent
+        return False
+
+    def _path_of(self, node):
+        """Calcula a tupla de componentes de um nó subindo até a raiz."""
+        parts = []
         while node.parent is not None:
-            path = "/" + node.name + path
+            parts.append(node.name)
             node = node.parent
-        return path
-
-    def mkdir(self, name, user):
-        """Cria um novo diretório no diretório atual."""
-        if name in self.current_dir.children:
-            return "Erro: Diretório já existe."
-        new_dir = Node(name, is_dir=True, parent=self.current_dir)
-        self.current_dir.children[name] = new_dir
+        return tuple(reversed(parts))
+
+    def _path_of_live(self, node):
+        """Como _path_of, mas retorna None se o diretório não estiver mais na árvore."""
+        table = self.inodes
+        if table.kind[node.ino] != InodeTable.DIR:
+            return None
+        parts = self._path_of(node)
+        return parts if self._still(parts, node) else None
+
+    def _cwd_node(self, user):
+        """Diretório atual da sessão (a raiz para usuários sem sessão)."""
+        return user.current_dir if isinstance(user, Session) else self.root
+
+    # ------------------------------------------------------------------
+    # Operações sobre a árvore
+    # ------------------------------------------------------------------
+
+    @_transaction
+    def mkdir(self, path, user):
+        """Cria um novo diretório (o caminho pode ser absoluto ou relativo)."""
+        parent, name, key = self._resolve_parent(path, user)
+        if parent is None:
+            return name
+        with self._locks.write(parent.ino):
+            if not self._still(key[:-1], parent):
+                return f"Erro: '{path}' não encontrado."
+            if name in parent.children:
+                return "Erro: Diretório já existe."
+            try:
+                self.quotas.check(user.uid, user.gid, inodes=1)
+            except Exception as e:
+                return str(e)
+            ino = self.inodes.alloc(InodeTable.DIR, name, parent=parent.ino,
+                                    ftype=FileType.DIRECTORY.value, mode=0o755,
+                                    uid=user.uid, gid=user.gid, now=time.time(),
+                                    ino=self.disk.reserve_inode())
+            new_dir = Node(self.inodes, ino)
+            parent.children[name] = new_dir
+            self.disk.new_inode(new_dir, user)
+        self._invalidate(key, new_dir)
         return f"Diretório '{name}' criado."
 
-    def touch(self, name, user):
+    @_transaction
+    def touch(self, path, user):
         """Cria um arquivo vazio e o associa a um novo nó."""
-        if name in self.current_dir.children:
-            return "Erro: Arquivo já existe."
-        # Cria o FCB (File Control Block)
-        new_file_fcb = File(name, user, disk_ref=self.disk)
-        # Cria o nó na árvore e associa o FCB
-        new_node = Node(name, is_dir=False, parent=self.current_dir, file_obj=new_file_fcb)
-        self.current_dir.children[name] = new_node
+        parent, name, key = self._resolve_parent(path, user)
+        if parent is None:
+            return name
+        with self._locks.write(parent.ino):
+            if not self._still(key[:-1], parent):
+                return f"Erro: '{path}' não encontrado."
+            if name in parent.children:
+                return "Erro: Arquivo já existe."
+            try:
+                self.quotas.check(user.uid, user.gid, inodes=1)
+            except Exception as e:
+                return str(e)
+            # Cria o FCB (File Control Block) na tabela de inodes
+            new_file_fcb = File(name, user, disk_ref=self.disk, table=self.inodes,
+                                parent=parent.ino, ino=self.disk.reserve_inode())
+            # Cria o nó na árvore (visão sobre o mesmo inode)
+            new_node = Node(self.inodes, new_file_fcb.ino)
+            parent.children[name] = new_node
+            self.disk.new_inode(new_node, user)
+            parent.add_usage(0, 1, self.disk)
         return f"Arquivo '{name}' criado."
 
-    def cd(self, path):
-        """Navega entre diretórios (suporta '..' e '/')."""
-        if path == "..":
-            if self.current_dir.parent:
-                self.current_dir = self.current_dir.parent
-            return ""
-        if path == "/":
-            self.current_dir = self.root
-            return ""
-        if path in self.current_dir.children:
-            node = self.current_dir.children[path]
-            if node.is_dir:
-                self.current_dir = node
-                return ""
+    # Critérios de ordenação do ls: nome usa o índice ordenado do diretório;
+    # tamanho e data de modificação listam os maiores/mais recentes primeiro
+    LS_SORTS = ("name", "size", "time")
+
+    def ls(self, path=None, user=None, **options):
+        """Lista o conteúdo do diretório atual da sessão (ou de path) com metadados básicos."""
+        return "\n".join(self.stream_ls(path, user, **options))
+
+    def stream_ls(self, path=None, user=None, sort=None, reverse=False, offset=0, limit=None,
+                  prefix=None, pattern=None):
+        """
+        Versão em streaming de ls: gera a listagem linha a linha (ou uma única
+        mensagem de erro), sem montar a saída inteira.
+
+        sort: None (ordem de criação), "name", "size" ou "time"; reverse inverte.
+        prefix e pattern (glob) filtram pelo nome; offset/limit paginam o
+        resultado. Ordenação por nome e filtros usam o índice ordenado do
+        diretório: a primeira página custa O(log n + página), sem percorrer
+        todas as entradas. Sem sort, uma listagem filtrada sai em ordem de nome.
+        As linhas da página são montadas sob a trava de leitura do diretório,
+        liberada antes de serem geradas: um consumidor lento (ou que para de
+        ler) não bloqueia os escritores.
+        """
+        if sort is not None and sort not in self.LS_SORTS:
+            yield f"Erro: Ordenação inválida: '{sort}' (use {', '.join(self.LS_SORTS)})."
+            return
+        if offset < 0 or (limit is not None and limit < 0):
+            yield "Erro: offset e limit não podem ser negativos."
+            return
+        node = self._cwd_node(user) if path is None else self._lookup(path, user)
+        if node is None:
+            yield f"Erro: '{path}' não encontrado."
+            return
+        if not node.is_dir:
+            yield f"Erro: '{path}' não é um diretório."
+            return
+        with self._locks.read(node.ino):
+            children = node.children
+            if children is None:
+                # Diretório removido por outra thread depois de ser encontrado
+                lines = [f"Erro: '{path or '.'}' não encontrado."]
             else:
-                return f"Erro: '{path}' não é um diretório."
-        return f"Erro: '{path}' não encontrado."
-
-    def ls(self):
-        """Lista o conteúdo do diretório atual com metadados básicos."""
-        output = []
-        output.append(f"Conteúdo de {self.get_pwd()}:")
-        for name, node in self.current_dir.children.items():
-            type_str = "<DIR>" if node.is_dir else "<FILE>"
-            meta = ""
-            if not node.is_dir:
-                # Converte permissões para octal e exibe tamanho/inode
-                perm = oct(node.file.permissions)[2:]
-                size = node.file.size
-                meta = f"(Perm: {perm}, Size: {size}, Inode: {node.file.id})"
-            output.append(f"  {type_str}\t{name}\t{meta}")
-        return "\n".join(output)
+                # Sob a trava o diretório não pode ser removido: o caminho é válido
+                title = "/" + "/".join(self._path_of(node) if path is None
+                                       else self._abspath(path, user))
+                lines = [f"Conteúdo de {title}:"]
+                filtered = prefix is not None or pattern is not None
+                if sort is None and filtered:
+                    sort = "name"
+                stop = None if limit is None else offset + limit
 
-    def rm(self, name, user):
-        """Remove arquivos ou diretórios e libera blocos de memória."""
-        if name not in self.current_dir.children:
-            return "Erro: Arquivo não encontrado."
+                if sort is None:
+                    names = itertools.islice(children, offset, stop)
+                else:
+                    names = self._ls_names(node, children, sort, reverse, offset, stop,
+                                           prefix, pattern)
+                lines.extend(self._ls_line(name, children[name]) for name in names)
+        yield from lines
+
+    def _ls_names(self, node, children, sort, reverse, offset, stop, prefix, pattern):
+        """Nomes a listar, já filtrados, ordenados e paginados (ver stream_ls)."""
+        bounds = self._name_range(prefix, pattern)
+        if bounds is None:
+            return iter(())
+        lo, hi = bounds
+        # Um glob que é apenas "<literal>*" equivale ao filtro por prefixo
+        if pattern is not None and pattern == _glob_literal(pattern) + "*":
+            pattern = None
+        index = self.inodes.name_index(node.ino) if (sort == "name" or lo) else None
+
+        if sort == "name":
+            if pattern is None:
+                # Paginação direta por posição no índice
+                names = index.irange(lo, hi, skip=offset, reverse=reverse)
+                return itertools.islice(names, None if stop is None else stop - offset)
+            names = (n for n in index.irange(lo, hi, reverse=reverse)
+                     if fnmatch.fnmatchcase(n, pattern))
+            return itertools.islice(names, offset, stop)
+
+        # Tamanho ou data: seleciona só a página (heap) entre os candidatos
+        candidates = index.irange(lo, hi) if index is not None else iter(children)
+        if pattern is not None:
+            candidates = (n for n in candidates if fnmatch.fnmatchcase(n, pattern))
+        column = self.inodes.size if sort == "size" else self.inodes.mtime
+        entries = children.entries
+        # Chave (valor, nome): maiores primeiro, empates em ordem de nome
+        sign = 1 if reverse else -1
+        keyed = ((sign * column[entries[n]], n) for n in candidates)
+        ordered = heapq.nsmallest(stop, keyed) if stop is not None else sorted(keyed)
+        return (n for _, n in ordered[offset:])
+
+    @staticmethod
+    def _name_range(prefix, pattern):
+        """
+        Intervalo [lo, hi) de nomes que podem satisfazer prefix e o trecho
+        literal inicial de pattern: (None, None) se não restringem o nome
+        ou None se forem incompatíveis.
+        """
+        literal = _glob_literal(pattern) if pattern is not None else ""
+        start = prefix or ""
+        if literal.startswith(start):
+            start = literal
+        elif not start.startswith(literal):
+            return None
+        if not start:
+            return None, None
+        return start, _prefix_end(start)
+
+    def _ls_line(self, name, child):
+        """Linha do ls para uma entrada: tipo, nome e, em arquivos, permissões/tamanho/inode."""
+        type_str = "<DIR>" if child.is_dir else "<FILE>"
+        meta = ""
+        if not child.is_dir:
+            # Converte permissões para octal e exibe tamanho/inode
+            perm = oct(child.file.permissions)[2:]
+            size = child.file.size
+            meta = f"(Perm: {perm}, Size: {size}, Inode: {child.file.id})"
+        return f"  {type_str}\t{name}\t{meta}"
 
-        node = self.current_dir.children[name]
+    def _snapshot_children(self, node):
+        """Cópia dos filhos de um diretório, tirada sob a trava de leitura dele."""
+        with self._locks.read(node.ino):
+            children = node.children
+            # Diretório removido por outra thread depois de ser encontrado
+            return list(children.items()) if children is not None else []
+
+    def _iter_subtree(self, node, locked=False):
+        """
+        Percorre a subárvore iterativamente (pré-ordem), sem recursão.
+        locked indica que o chamador já trava todos os diretórios da subárvore.
+        """
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            yield current
+            if current.is_dir:
+                if locked:
+                    stack.extend(current.children.values())
+                else:
+                    stack.extend(child for _, child in self._snapshot_children(current))
+
+    @_transaction
+    def rm(self, path, user, recursive=False):
+        """
+        Remove arquivos ou diretórios e libera blocos de memória.
+        Diretórios não vazios exigem recursive=True (rm -r), que libera os
+        blocos de todos os arquivos da subárvore.
+        """
+        key = self._abspath(path, user)
+        node = self._lookup_key(key)
+        if node is None:
+            return "Erro: Arquivo não encontrado."
+        if node == self.root:
+            return "Erro: Não é possível remover a raiz."
 
         if not node.is_dir:
-            # Verifica permissão de escrita no arquivo para poder removê-lo
-            if not self.pm.check_permission(node.file, user, 'w'):
-                return "Erro: Permissão negada."
+            with self._locks.hold(write=(node.parent.ino, node.ino)):
+                if not self._still(key, node):
+                    return "Erro: Arquivo não encontrado."
+                return self._remove(key, node, [node], user)
 
-            # Libera os blocos no disco virtual
-            if node.file.blocks:
-                self.disk.free(node.file.blocks)
+        with self._rename_lock:
+            if not self._still(key, node):
+                return "Erro: Arquivo não encontrado."
+            while True:
+                # Trava o pai e toda a subárvore; se ela mudar enquanto as
+                # travas são adquiridas, tenta novamente
+                inos = {m.ino for m in self._iter_subtree(node)}
+                inos.add(node.parent.ino)
+                with self._locks.hold(write=inos):
+                    subtree = list(self._iter_subtree(node, locked=True))
+                    if all(m.ino in inos for m in subtree):
+                        if len(subtree) > 1 and not recursive:
+                            return f"Erro: '{path}' não está vazio (use rm -r)."
+                        return self._remove(key, node, subtree, user)
 
-        del self.current_dir.children[name]
+    def _remove(self, key, node, subtree, user):
+        """Remove node (com a subárvore já travada pelo chamador)."""
+        # Verifica permissão de escrita em todos os arquivos (em lote) antes de remover qualquer um
+        if not all(self.pm.check_many([m.file for m in subtree if not m.is_dir], user, 'w')):
+            return "Erro: Permissão negada."
+
+        name = node.name
+        d_size, d_files = node.usage()
+        parent = node.parent
+        del parent.children[name]
+        parent.add_usage(-d_size, -d_files, self.disk)
+        # Invalida o cache antes de liberar os inodes (que podem ser reutilizados)
+        self._invalidate(key, node)
+        if node.is_dir:
+            # Sessões dentro do diretório removido voltam ao ancestral existente
+            self.generation += 1
+
+        # Libera blocos e inodes de baixo para cima (filhos antes dos pais)
+        for member in reversed(subtree):
+            if not member.is_dir and member.file.extents:
+                self.disk.free(member.file.extents)
+                member.file.extents = []
+            # A linha da tabela é liberada antes do número no disco: do
+            # contrário outra thread poderia reservar o mesmo número e ter
+            # o seu inode recém-criado apagado por este free
+            self.inodes.free(member.ino)
+            self.disk.release_inode(member)
         return f"'{name}' removido."
 
-    def cp(self, src_name, dest_name, user):
+    def _resolve_dest(self, src_node, dest_path, user=None):
+        """
+        Resolve o destino de cp/mv: se dest_path for um diretório existente,
+        o destino é dest_path/<nome da origem>. Retorna (pai, nome, chave) ou
+        (None, erro, None).
+        """
+        dest_key = self._abspath(dest_path, user)
+        dest_node = self._lookup_key(dest_key)
+        if dest_node is not None and dest_node.is_dir:
+            if src_node.name in dest_node.children:
+                return None, "Erro: Destino já existe.", None
+            return dest_node, src_node.name, dest_key + (src_node.name,)
+        if dest_node is not None:
+            return None, "Erro: Destino já existe.", None
+        return self._resolve_parent(dest_path, user)
+
+    @_transaction
+    def cp(self, src_path, dest_path, user, recursive=False):
         """
-        Copia um arquivo.
-        Lê o conteúdo da origem e escreve em um novo arquivo de destino.
+        Copia um arquivo (ou, com recursive=True, uma árvore de diretórios).
+        O destino compartilha os blocos da origem (copy-on-write).
         """
-        if src_name not in self.current_dir.children:
+        src_node = self._lookup(src_path, user)
+        if src_node is None:
             return "Erro: Origem não encontrada."
-        if dest_name in self.current_dir.children:
-            return "Erro: Destino já existe."
 
-        src_node = self.current_dir.children[src_name]
+        parent, dest_name, dest_key = self._resolve_dest(src_node, dest_path, user)
+        if parent is None:
+            return dest_name
+
         if src_node.is_dir:
-            return "Erro: cp não implementado para diretórios (use recursivo manualmente)."
+            if not recursive:
+                return "Erro: Origem é um diretório (use cp -r)."
+            if self._is_ancestor(src_node, parent):
+                return "Erro: Não é possível copiar um diretório para dentro de si mesmo."
+            with self._rename_lock:
+                if not self._still(self._abspath(src_path, user), src_node):
+                    return "Erro: Origem não encontrada."
+                return self._cp_tree(src_node, dest_key, user, src_path, dest_path)
 
         # Verifica permissão de leitura na origem
         if not self.pm.check_permission(src_node.file, user, 'r'):
             return "Erro: Permissão de leitura negada na origem."
 
-        # Lê conteúdo da memória
-        content = src_node.file.cat()
+        # Cria arquivo de destino compartilhando os blocos da origem (copy-on-write):
+        # nenhum dado é copiado até que um dos arquivos seja modificado
+        created = self._lookup_key(dest_key) is None
+        msg = self.touch("/" + "/".join(dest_key), user)
+        dest_node = self._lookup_key(dest_key)
+        if dest_node is None or dest_node.is_dir:
+            return msg
+        try:
+            self._share(src_node, dest_node)
+        except Exception as e:
+            if created:
+                self._discard(dest_key, dest_node, user)
+            return str(e)
+        return f"'{src_path}' copiado para '{dest_path}'."
 
-        # Cria arquivo de destino e escreve o conteúdo
-        self.touch(dest_name, user)
-        dest_node = self.current_dir.children[dest_name]
+    def _share(self, src_node, dest_node):
+        """Faz dest compartilhar os blocos de src, travando ambos os arquivos."""
+        with self._locks.hold(write=(dest_node.ino,), read=(src_node.ino,)):
+            dest_node.file.share_from(src_node.file)
 
-        dest_node.file.echo(content)
-        return f"'{src_name}' copiado para '{dest_name}'."
+    def _discard(self, key, node, user):
+        """Remove o arquivo vazio criado por uma cópia que falhou (cota, limite de referências)."""
+        with self._locks.hold(write=(node.parent.ino, node.ino)):
+            if self._still(key, node):
+                self._remove(key, node, [node], user)
 
-    def mv(self, src_name, dest_name, user):
-        """Renomeia ou move um arquivo (nesta impl, apenas renomeia no dir atual)."""
-        if src_name not in self.current_dir.children:
-            return "Erro: Origem não encontrada."
+    def _cp_tree(self, src_node, dest_key, user, src_path, dest_path):
+        """Copia uma subárvore iterativamente (pilha explícita, sem recursão)."""
+        copied = 0
+        denied = 0
+        stack = [(src_node, dest_key)]
+        while stack:
+            src_dir, key = stack.pop()
+            msg = self.mkdir("/" + "/".join(key), user)
+            dest_dir = self._lookup_key(key)
+            if dest_dir is None or not dest_dir.is_dir:
+                return msg
+            files = []
+            for name, child in self._snapshot_children(src_dir):
+                if child.is_dir:
+                    stack.append((child, key + (name,)))
+                else:
+                    files.append((name, child))
+            # Permissão de leitura de todos os arquivos do diretório em uma passada
+            allowed = self.pm.check_many([child.file for _, child in files], user, 'r')
+            for (name, child), readable in zip(files, allowed):
+                child_key = key + (name,)
+                if not readable:
+                    denied += 1
+                    continue
+                created = name not in dest_dir.children
+                self.touch("/" + "/".join(child_key), user)
+                dest_child = dest_dir.children.get(name)
+                if dest_child is None or dest_child.is_dir:
+                    continue
+                try:
+                    self._share(child, dest_child)
+                except Exception as e:
+                    if created:
+                        self._discard(child_key, dest_child, user)
+                    return str(e)
+                copied += 1
+        msg = f"'{src_path}' copiado para '{dest_path}' ({copied} arquivo(s))."
+        if denied:
+            msg += f" {denied} arquivo(s) ignorado(s) por permissão de leitura negada."
+        return msg
 
-        if dest_name in self.current_dir.children:
-            return "Erro: Destino já existe."
+    @_transaction
+    def mv(self, src_path, dest_path, user):
+        """Renomeia ou move um arquivo/diretório (inclusive entre diretórios)."""
+        with self._rename_lock:
+            src_key = self._abspath(src_path, user)
+            node = self._lookup_key(src_key)
+            if node is None:
+                return "Erro: Origem não encontrada."
+            if node == self.root:
+                return "Erro: Não é possível mover a raiz."
 
-        node = self.current_dir.children.pop(src_name)
-        node.name = dest_name
-        if not node.is_dir:
-            node.file.name = dest_name
-            node.file.touch() # Atualiza timestamp
+            parent, dest_name, dest_key = self._resolve_dest(node, dest_path, user)
+            if parent is None:
+                return dest_name
+            if node.is_dir and self._is_ancestor(node, parent):
+                return "Erro: Não é possível mover um diretório para dentro de si mesmo."
 
-        self.current_dir.children[dest_name] = node
-        return f"'{src_name}' movido para '{dest_name}'."
+            old_parent = node.parent
+            with self._locks.hold(write=(old_parent.ino, parent.ino, node.ino)):
+                # Revalida com as travas: origem e pai do destino ainda existem
+                if not self._still(src_key, node) or not self._still(dest_key[:-1], parent):
+                    return "Erro: Origem não encontrada."
+                if dest_name in parent.children:
+                    return "Erro: Destino já existe."
+                del old_parent.children[node.name]
+                self._invalidate(src_key, node)
+                d_size, d_files = node.usage()
+                old_parent.add_usage(-d_size, -d_files, self.disk)
+                node.name = dest_name
+                node.parent = parent
+                if not node.is_dir:
+                    node.file.touch() # Atualiza timestamp
 
-    def write_file(self, name, content, user):
+                parent.children[dest_name] = node
+                parent.add_usage(d_size, d_files, self.disk)
+                self.disk.relink_inode(node, old_parent)
+                if node.is_dir:
+                    # Sessões dentro do diretório movido recalculam o pwd
+                    self.generation += 1
+        return f"'{src_path}' movido para '{dest_path}'."
+
+    # ------------------------------------------------------------------
+    # Operações sobre arquivos
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _open_file(self, path, user, write=False):
+        """
+        Resolve um arquivo e mantém sua trava (escrita ou leitura) durante o
+        bloco. Produz (nó, None) ou (None, erro).
+        """
+        key = self._abspath(path, user)
+        node = self._lookup_key(key)
+        if node is None:
+            yield None, "Arquivo não encontrado."
+            return
+        if node.is_dir:
+            yield None, f"'{path}' é um diretório."
+            return
+        with (self._locks.write if write else self._locks.read)(node.ino):
+            if not self._still(key, node):
+                yield None, "Arquivo não encontrado."
+            else:
+                yield node, None
+
+    @_transaction
+    def write_file(self, path, content, user):
         """Escreve texto em um arquivo existente, verificando permissões."""
-        if name in self.current_dir.children:
-            node = self.current_dir.children[name]
-            if not node.is_dir:
-                if self.pm.check_permission(node.file, user, 'w'):
+        with self._open_file(path, user, write=True) as (node, error):
+            if error:
+                return error
+            if self.pm.check_permission(node.file, user, 'w'):
+                try:
                     node.file.echo(content)
-                    return "Conteúdo escrito."
-                return "Permissão negada (Write)."
-            return f"'{name}' é um diretório."
-        return "Arquivo não encontrado."
+                except Exception as e:
+                    return str(e)
+                return "Conteúdo escrito."
+            return "Permissão negada (Write)."
 
-    def read_file(self, name, user):
+    def _modify_file(self, path, user, operation):
+        """
+        Aplica operation(File) a um arquivo que pode ser escrito, sob a trava
+        de escrita dele. Retorna (resultado, None) ou (None, erro).
+        """
+        with self._open_file(path, user, write=True) as (node, error):
+            if error:
+                return None, error
+            if not self.pm.check_permission(node.file, user, 'w'):
+                return None, "Permissão negada (Write)."
+            try:
+                return operation(node.file), None
+            except Exception as e:
+                return None, str(e)
+
+    @_transaction
+    def pwrite_file(self, path, offset, content, user):
+        """Escreve a partir de um offset, modificando apenas os blocos afetados."""
+        written, error = self._modify_file(path, user, lambda f: f.pwrite(offset, content))
+        if error:
+            return error
+        return f"{written} byte(s) escrito(s) em '{path}' (offset {offset})."
+
+    @_transaction
+    def append_file(self, path, content, user):
+        """Acrescenta conteúdo ao fim do arquivo, alocando apenas os blocos novos."""
+        written, error = self._modify_file(path, user, lambda f: f.append(content))
+        if error:
+            return error
+        return f"{written} byte(s) acrescentado(s) a '{path}'."
+
+    @_transaction
+    def truncate_file(self, path, size, user):
+        """Trunca (ou estende com zeros) o arquivo para o tamanho indicado."""
+        _, error = self._modify_file(path, user, lambda f: f.truncate(size))
+        if error:
+            return error
+        return f"'{path}' truncado para {size} byte(s)."
+
+    def read_file(self, path, user):
         """Lê o conteúdo de um arquivo, verificando permissões."""
-        if name in self.current_dir.children:
-            node = self.current_dir.children[name]
-            if not node.is_dir:
-                if self.pm.check_permission(node.file, user, 'r'):
-                    return node.file.cat()
-                return "Permissão negada (Read)."
-            return f"'{name}' é um diretório."
-        return "Arquivo não encontrado."
-
-    def chmod_file(self, name, mode, user):
+        with self._open_file(path, user) as (node, error):
+            if error:
+                return error
+            if self.pm.check_permission(node.file, user, 'r'):
+                return node.file.cat()
+            return "Permissão negada (Read)."
+
+    def open(self, path, user, mode="r"):
+        """
+        Abre um arquivo e retorna um FileHandle (read/seek/write).
+        Lança exceção se o arquivo não existir ou a permissão for negada.
+        Cada operação do descritor trava o arquivo enquanto executa.
+        """
+        node = self._lookup(path, user)
+        if node is None:
+            raise FileNotFoundError("Arquivo não encontrado.")
+        if node.is_dir:
+            raise IsADirectoryError(f"'{path}' é um diretório.")
+        operation = 'r' if mode == "r" else 'w'
+        if not self.pm.check_permission(node.file, user, operation):
+            raise PermissionError(f"Permissão negada ({'Read' if operation == 'r' else 'Write'}).")
+        return FileHandle(node.file, mode, locks=self._locks)
+
+    def stream_file(self, path, user, chunk_size=None):
+        """
+        Versão em streaming de read_file: gera o conteúdo em pedaços de texto
+        à medida que os blocos são lidos (ou uma única mensagem de erro).
+        Cada pedaço é copiado sob a trava de leitura do arquivo, liberada antes
+        de ser gerado: um consumidor lento não bloqueia os escritores. Se o
+        arquivo for removido no meio da leitura, o streaming termina ali.
+        """
+        chunk_size = chunk_size or self.STREAM_CHUNK
+        with self._open_file(path, user) as (node, error):
+            if error:
+                yield error
+                return
+            if not self.pm.check_permission(node.file, user, 'r'):
+                yield "Permissão negada (Read)."
+                return
+            key = self._abspath(path, user)
+            binary = node.file.type == FileType.BINARY
+        # Decodificador incremental: caracteres UTF-8 podem cruzar pedaços
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        offset = 0
+        while True:
+            with self._locks.read(node.ino):
+                if not self._still(key, node):
+                    break
+                chunk = node.file.pread(offset, chunk_size)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield repr(chunk) if binary else decoder.decode(chunk)
+        yield decoder.decode(b"", final=True)
+
+    @_transaction
+    def chmod_file(self, path, mode, user):
         """Altera as permissões (modo octal) de um arquivo."""
-        if name in self.current_dir.children:
-            node = self.current_dir.children[name]
-            if not node.is_dir:
-                self.pm.chmod(node.file, user, mode)
-                return f"Permissões de '{name}' alteradas."
-        return "Arquivo não encontrado."
\ No newline at end of file
+        with self._open_file(path, user, write=True) as (node, error):
+            if error:
+                return "Arquivo não encontrado."
+            self.pm.chmod(node.file, user, mode)
+            self.disk.sync_file(node.file)
+            return f"Permissões de '{path}' alteradas."
+
+    @_transaction
+    def chown_file(self, path, uid, gid, user):
+        """Altera dono (uid) e/ou grupo (gid) de um arquivo; None mantém o valor atual."""
+        with self._open_file(path, user, write=True) as (node, error):
+            if error:
+                return "Arquivo não encontrado."
+            if not self.pm.chown(node.file, user, uid, gid):
+                return "Permissão negada."
+            self.disk.sync_file(node.file)
+            return f"Dono/grupo de '{path}' alterados."
+
+    def find(self, pattern, path=None, user=None):
+        """
+        Procura nomes que casem com o padrão glob (ex: '*.txt') na subárvore
+        do diretório atual (ou de path). Percurso iterativo.
+        """
+        start = self._cwd_node(user) if path is None else self._lookup(path, user)
+        if start is None:
+            return f"Erro: '{path}' não encontrado."
+        base = self._path_of(start)
+        matches = []
+        stack = [(start, base)]
+        while stack:
+            node, parts = stack.pop()
+            for name, child in self._snapshot_children(node):
+                child_parts = parts + (name,)
+                if fnmatch.fnmatchcase(name, pattern):
+                    matches.append("/" + "/".join(child_parts))
+                if child.is_dir:
+                    stack.append((child, child_parts))
+        if not matches:
+            return "Nenhum resultado."
+        return "\n".join(sorted(matches))
+
+    def du(self, path=None, user=None):
+        """
+        Uso de espaço de um diretório ou arquivo. Os agregados são mantidos
+        incrementalmente, então a consulta é O(1) mesmo na raiz.
+        """
+        node = self._cwd_node(user) if path is None else self._lookup(path, user)
+        if node is None:
+            return f"Erro: '{path}' não encontrado."
+        size, files = node.usage()
+        return f"{size} bytes em {files} arquivo(s)\t/{'/'.join(self._path_of(node))}"
+
+    def _iter_files(self):
+        """Percorre a árvore (iterativamente) e gera os nós de arquivo."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for _, child in self._snapshot_children(node):
+                if child.is_dir:
+                    stack.append(child)
+                else:
+                    yield child
+
+    def fragmentation(self):
+        """
+        Gera um relatório de fragmentação: extents por arquivo,
+        maior sequência livre e número de sequências livres.
+        """
+        output = ["Relatório de Fragmentação:"]
+        total_files = 0
+        fragmented = 0
+        total_extents = 0
+        for node in self._iter_files():
+            n_ext = len(node.file.extents)
+            if n_ext == 0:
+                continue
+            total_files += 1
+            total_extents += n_ext
+            if n_ext > 1:
+                fragmented += 1
+            output.append(f"  {node.name}\t(Blocos: {node.file.block_count()}, Extents: {n_ext})")
+
+        free_runs = list(self.disk.free_runs())
+        largest = max((length for _, length in free_runs), default=0)
+        avg = total_extents / total_files if total_files else 0
+        output.append(f"Arquivos: {total_files}, Fragmentados: {fragmented}, Extents/arquivo: {avg:.2f}")
+        output.append(f"Sequências livres: {len(free_runs)}, Maior sequência livre: {largest} blocos")
+        return "\n".join(output)
+
+    @_transaction
+    def defrag(self, max_files=8):
+        """
+        Desfragmentação incremental (online).
+        Cada chamada processa no máximo max_files arquivos, movendo cada um para a
+        sequência livre de menor endereço que o comporte por inteiro, desde que
+        isso reduza o número de extents ou aproxime o arquivo do início do disco.
+        O shell continua disponível entre as chamadas.
+        """
+        with self._defrag_lock:
+            return self._defrag(max_files)
+
+    def _defrag(self, max_files):
+        if not self._defrag_queue:
+            # Inicia uma nova passada, processando primeiro os arquivos mais à frente no disco
+            # Extents lidos uma única vez por arquivo: podem mudar (ex: truncate) durante a passada
+            starts = []
+            for n in self._iter_files():
+                extents = n.file.extents
+                if extents:
+                    starts.append((extents[0][0], n.file))
+            starts.sort(key=lambda item: item[0], reverse=True)
+            files = [f for _, f in starts]
+            self._defrag_queue = files
+            if not files:
+                return "Nada a desfragmentar."
+
+        moved = 0
+        processed = 0
+        while self._defrag_queue and processed < max_files:
+            file_obj = self._defrag_queue.pop()
+            processed += 1
+            with self._locks.write(file_obj.ino):
+                if self._defrag_one(file_obj):
+                    moved += 1
+
+        remaining = len(self._defrag_queue)
+        status = "passada concluída" if remaining == 0 else f"{remaining} arquivo(s) pendente(s)"
+        return f"Desfragmentação: {moved} arquivo(s) movido(s), {status}."
+
+    def _defrag_one(self, file_obj):
+        """Move um arquivo (já travado) para o início do disco. Retorna True se moveu."""
+        # Arquivo removido (inode liberado ou reutilizado por um diretório) ou
+        # reescrito como vazio desde o início da passada. Blocos compartilhados
+        # (cp copy-on-write) não são movidos, pois mover um arquivo o separaria
+        # das suas cópias.
+        if self.inodes.kind[file_obj.ino] != InodeTable.FILE:
+            return False
+        if not file_obj.extents or self.disk.any_shared(file_obj.extents):
+            return False
+        # Busca e realocação atômicas em relação a outras alocações
+        with self.disk.alloc_lock:
+            n_blocks = file_obj.block_count()
+            start = self.disk.find_run(n_blocks, fit=self.disk.FIRST_FIT)
+            if start == -1:
+                return False
+            if len(file_obj.extents) == 1 and start >= file_obj.extents[0][0]:
+                return False
+            file_obj.extents = [self.disk.relocate(file_obj.extents, start)]
+        self.disk.sync_file(file_obj)
+        return True
@@ -0,0 +1,751 @@
+import contextlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from file_type import FileType
+from inode_table import InodeTable
+from journal import Journal
+from memory_disk import MemoryDisk
+from quota import QuotaManager
+
+
+class _MappedBitmap:
+    """
+    Janela sobre uma região do mmap que se comporta como o bytearray usado
+    pelo MemoryDisk como bitmap (indexação, fatias e find).
+    """
+    def __init__(self, mm, offset, length):
+        self._mm = mm
+        self._off = offset
+        self._len = length
+
+    def __len__(self):
+        return self._len
+
+    def find(self, value, start=0, end=None):
+        end = self._len if end is None else min(end, self._len)
+        pos = self._mm.find(bytes((value,)), self._off + start, self._off + end)
+        return -1 if pos == -1 else pos - self._off
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(self._len)
+            return self._mm[self._off + start:self._off + stop]
+        return self._mm[self._off + key]
+
+    def __setitem__(self, key, value):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(self._len)
+            self._mm[self._off + start:self._off + stop] = value
+        else:
+            self._mm[self._off + key] = value
+
+
+class ImageDisk(MemoryDisk):
+    """
+    Disco persistente mapeado em memória (mmap) sobre um arquivo de imagem.
+
+    Layout da imagem:
+      [superbloco][bitmap de blocos livres][contadores de referência]
+      [uso por dono][tabela de inodes][área de dados]
+
+    O bitmap e a área de dados são acessados diretamente no mmap, então as
+    rotinas de alocação do MemoryDisk funcionam sem alterações. A árvore de
+    diretórios fica na tabela de inodes: cada diretório aponta para o primeiro
+    filho e os irmãos formam uma lista duplamente encadeada. A montagem é
+    preguiçosa: apenas a raiz é lida no boot e cada diretório carrega seus
+    filhos no primeiro acesso. O uso de blocos e inodes de cada usuário e
+    grupo (cotas) fica em registros próprios, regravados para os donos
+    alterados a cada commit; a montagem lê apenas esses registros.
+
+    Com journal (padrão), as regiões de metadados (superbloco, bitmap,
+    contadores e inodes) são mapeadas em modo privado (copy-on-write): as
+    alterações só chegam ao arquivo da imagem por transações confirmadas no
+    journal (<imagem>.journal). Cada operação do sistema de arquivos é uma
+    transação (transaction()); o group commit reúne as operações de um
+    intervalo (sync_interval) em um único registro e um único fsync. Os dados
+    são gravados no lugar antes do commit dos metadados que os referenciam
+    (modo ordered). Na montagem, as transações confirmadas são reaplicadas;
+    o checkpoint sincroniza a imagem e esvazia o journal.
+    """
+    MAGIC = b"M3SOIMG\0"
+    VERSION = 3
+
+    # Superbloco: magic, versão, block_size, total_blocks, max_inodes, free_count,
+    # root_ino, inode high-water mark, cabeça da lista de inodes livres,
+    # modo de alocação, estratégia de encaixe, cursor next-fit, registros de
+    # uso por dono em uso
+    _SB = struct.Struct("<8sIIQIQIIIBBQI")
+    _SB_SIZE = 512
+    _SB_FREE_COUNT = struct.Struct("<Q")
+    _SB_FREE_COUNT_OFF = struct.calcsize("<8sIIQI")
+
+    # Tipos de inode
+    I_FREE = 0
+    I_FILE = 1
+    I_DIR = 2
+    I_EXTENTS = 3  # continuação da lista de extents de um arquivo
+
+    # Registro de inode: tipo, FileType, modo, uid, gid, tamanho, criação,
+    # modificação, acesso, pai, primeiro filho, próximo irmão, irmão anterior,
+    # nº de extents no registro, próximo registro de extents, tamanho do nome, nome
+    NAME_MAX = 57
+    _INODE = struct.Struct(f"<BBHIIQdddIIIIHIB{NAME_MAX}s")
+    INODE_SIZE = 256
+    EXTENTS_PER_INODE = (INODE_SIZE - _INODE.size) // 8
+    _EXTENT = struct.Struct("<II")
+
+    ROOT_INO = 1
+
+    # Registro de uso por dono: tipo (0 = vago), uid/gid, blocos, inodes.
+    # Há dois registros por inode (dono e grupo distintos para cada um),
+    # então sempre cabem todos os donos com uso.
+    _OWNER = struct.Struct("<BxxxIQQ")
+    _OWNER_CODES = {QuotaManager.USER: 1, QuotaManager.GROUP: 2}
+
+    _ALLOC_CODES = {MemoryDisk.BLOCK: 0, MemoryDisk.EXTENT: 1}
+    _FIT_CODES = {MemoryDisk.BEST_FIT: 0, MemoryDisk.FIRST_FIT: 1}
+
+    # Journal: granularidade do registro de metadados, intervalo do group
+    # commit (segundos), operações por transação e tamanho do journal que
+    # dispara um checkpoint
+    SECTOR = 512
+    SYNC_INTERVAL = 0.1
+    MAX_BATCH = 4096
+    CHECKPOINT_BYTES = 4 << 20
+
+    def __init__(self, path, journal=True, sync_interval=SYNC_INTERVAL, dedup=False):
+        """
+        Abre (monta) uma imagem existente. Use ImageDisk.create para formatar.
+        Transações pendentes no journal são sempre recuperadas. Com
+        sync_interval=0, cada operação é confirmada (fsync) ao terminar.
+        Com dedup, o índice de conteúdo começa vazio a cada montagem (não é
+        gravado na imagem): os blocos já existentes continuam válidos, mas
+        só os gravados depois da montagem são reaproveitados.
+        """
+        self.path = path
+        self._fd = open(path, "r+b")
+        self._journal = None
+        self.recovered = 0
+        journal_path = path + ".journal"
+        if journal or os.path.exists(journal_path):
+            self._journal = Journal(journal_path)
+            self.recovered = self._journal.replay(self._fd.fileno())
+            if not journal:
+                self._journal.close()
+                os.remove(journal_path)
+                self._journal = None
+        # Mapeamento compartilhado da imagem inteira (dados; metadados sem journal)
+        self._dm = mmap.mmap(self._fd.fileno(), 0)
+
+        (magic, version, block_size, total_blocks, max_inodes, _free_count,
+         root_ino, ino_hwm, free_ino_head, alloc, fit, cursor,
+         owner_count) = self._SB.unpack_from(self._dm, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self._dm.close()
+            self._fd.close()
+            if self._journal is not None:
+                self._journal.close()
+            raise ValueError(f"'{path}' não é uma imagem M3-SO válida.")
+
+        self.block_size = block_size
+        self.total_blocks = total_blocks
+        self.max_inodes = max_inodes
+        self.allocation = {v: k for k, v in self._ALLOC_CODES.items()}[alloc]
+        self.fit = {v: k for k, v in self._FIT_CODES.items()}[fit]
+        self.root_ino = root_ino
+        # Trava do alocador, também usada para os registros de inode e o superbloco
+        self.alloc_lock = threading.RLock()
+        self._ino_hwm = ino_hwm
+        self._free_ino_head = free_ino_head
+        self._cursor = cursor
+        self._free_index = None
+        self.blocks_allocated = 0
+        self.blocks_freed = 0
+        self._init_dedup(dedup)
+        # Uso por dono: registros ocupados, (tipo, id) -> registro e as cotas
+        # cujas alterações são gravadas (definidas na montagem)
+        self._owner_count = owner_count
+        self._owner_slots = {}
+        self._quotas = None
+
+        bitmap_off, refcount_off, owner_off, inode_off, data_off, _ = self._layout(
+            total_blocks, block_size, max_inodes)
+        self._bitmap_off = bitmap_off
+        self._refcount_off = refcount_off
+        self._owner_off = owner_off
+        self._inode_off = inode_off
+        self._data_off = data_off
+        if self._journal is not None:
+            # Metadados em cópia privada: só o commit os leva ao arquivo
+            self._mm = mmap.mmap(self._fd.fileno(), data_off, access=mmap.ACCESS_COPY)
+        else:
+            self._mm = self._dm
+        self.free_map = _MappedBitmap(self._mm, bitmap_off, total_blocks)
+        self.refcount = memoryview(self._mm)[refcount_off:refcount_off + 2 * total_blocks].cast("H")
+        self.data = memoryview(self._dm)[data_off:data_off + total_blocks * block_size]
+
+        # Estado do journal: setores de metadados alterados desde o último
+        # commit, operações em andamento (handles) e contadores
+        self._dirty = set()
+        self._gate = threading.Condition()
+        self._active = 0
+        self._committing = False
+        self._ops = 0
+        self._local = threading.local()
+        self._commit_lock = threading.Lock()
+        self._commit_hooks = []
+        self._sync_interval = sync_interval
+        self.commits = 0
+        self.committed_ops = 0
+        self.checkpoints = 0
+        self._stop = threading.Event()
+        self._flusher = None
+        if self._journal is not None and sync_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True,
+                                             name="journal-commit")
+            self._flusher.start()
+
+    @classmethod
+    def _layout(cls, total_blocks, block_size, max_inodes):
+        """Calcula os offsets das regiões da imagem e o tamanho total."""
+        bitmap_off = cls._SB_SIZE
+        refcount_off = bitmap_off + ((total_blocks + 7) // 8) * 8
+        owner_off = refcount_off + ((2 * total_blocks + 7) // 8) * 8
+        inode_off = owner_off + cls._owner_capacity(max_inodes) * cls._OWNER.size
+        data_off = inode_off + (max_inodes + 1) * cls.INODE_SIZE
+        size = data_off + total_blocks * block_size
+        return bitmap_off, refcount_off, owner_off, inode_off, data_off, size
+
+    @staticmethod
+    def _owner_capacity(max_inodes):
+        return 2 * (max_inodes + 1)
+
+    @classmethod
+    def create(cls, path, total_blocks=100, block_size=10, max_inodes=1024,
+               allocation=MemoryDisk.BLOCK, fit=MemoryDisk.BEST_FIT, **options):
+        """
+        Formata uma nova imagem (com o diretório raiz) e a monta.
+        options são repassadas à montagem (journal, sync_interval, dedup).
+        """
+        if allocation not in cls._ALLOC_CODES:
+            raise ValueError(f"Modo de alocação inválido: {allocation}")
+        if fit not in cls._FIT_CODES:
+            raise ValueError(f"Estratégia de encaixe inválida: {fit}")
+        *_, size = cls._layout(total_blocks, block_size, max_inodes)
+        with open(path, "wb") as f:
+            f.truncate(size)  # arquivo esparso: regiões zeradas = livres
+            f.write(cls._SB.pack(cls.MAGIC, cls.VERSION, block_size, total_blocks, max_inodes,
+                                 total_blocks, cls.ROOT_INO, cls.ROOT_INO + 1, 0,
+                                 cls._ALLOC_CODES[allocation], cls._FIT_CODES[fit], 0, 0))
+        # Um journal antigo com o mesmo nome não pertence a esta imagem
+        if os.path.exists(path + ".journal"):
+            os.remove(path + ".journal")
+
+        disk = cls(path, **options)
+        now = time.time()
+        disk._write_inode(cls.ROOT_INO, cls.I_DIR, FileType.DIRECTORY.value, 0o755, 0, 0, 0,
+                          now, now, now, 0, 0, 0, 0, 0, 0, 1, b"/")
+        # A raiz conta como um inode do root (uid 0, gid 0)
+        for kind in (QuotaManager.USER, QuotaManager.GROUP):
+            disk._write_owner(disk._new_owner_slot((kind, 0)), kind, 0, 0, 1)
+        disk.flush()
+        return disk
+
+    @classmethod
+    def open_or_create(cls, path, journal=True, sync_interval=SYNC_INTERVAL, dedup=False, **kwargs):
+        """Monta a imagem se ela existir; caso contrário, formata uma nova."""
+        if os.path.exists(path):
+            return cls(path, journal=journal, sync_interval=sync_interval, dedup=dedup)
+        return cls.create(path, journal=journal, sync_interval=sync_interval, dedup=dedup, **kwargs)
+
+    # ------------------------------------------------------------------
+    # Superbloco
+    # ------------------------------------------------------------------
+
+    @property
+    def free_count(self):
+        return self._SB_FREE_COUNT.unpack_from(self._mm, self._SB_FREE_COUNT_OFF)[0]
+
+    @free_count.setter
+    def free_count(self, value):
+        self._SB_FREE_COUNT.pack_into(self._mm, self._SB_FREE_COUNT_OFF, value)
+        self._touch(self._SB_FREE_COUNT_OFF, self._SB_FREE_COUNT.size)
+
+    def _write_superblock(self):
+        self._touch(0, self._SB.size)
+        self._SB.pack_into(self._mm, 0, self.MAGIC, self.VERSION, self.block_size,
+                           self.total_blocks, self.max_inodes, self.free_count, self.root_ino,
+                           self._ino_hwm, self._free_ino_head,
+                           self._ALLOC_CODES[self.allocation], self._FIT_CODES[self.fit],
+                           self._cursor, self._owner_count)
+
+    # ------------------------------------------------------------------
+    # Uso por dono (cotas)
+    # ------------------------------------------------------------------
+
+    def _owner_pos(self, slot):
+        return self._owner_off + slot * self._OWNER.size
+
+    def _write_owner(self, slot, kind, ident, blocks, inodes):
+        pos = self._owner_pos(slot)
+        self._OWNER.pack_into(self._mm, pos, self._OWNER_CODES[kind], ident, blocks, inodes)
+        self._touch(pos, self._OWNER.size)
+
+    def _new_owner_slot(self, key):
+        """
+        Obtém um registro para o dono key: o próximo vago ou, com todos já
+        usados, um cujo dono não tem mais uso (sempre existe, pois há dois
+        registros por inode).
+        """
+        if self._owner_count < self._owner_capacity(self.max_inodes):
+            slot = self._owner_count
+            self._owner_count += 1
+            self._write_superblock()
+        else:
+            kinds = {v: k for k, v in self._OWNER_CODES.items()}
+            for slot in range(self._owner_count):
+                code, ident, blocks, inodes = self._OWNER.unpack_from(self._mm, self._owner_pos(slot))
+                if not blocks and not inodes:
+                    self._owner_slots.pop((kinds.get(code), ident), None)
+                    break
+            else:
+                raise Exception("Erro: Tabela de uso por dono cheia.")
+        self._owner_slots[key] = slot
+        return slot
+
+    def _load_usage(self, quotas):
+        """Carrega nas cotas o uso gravado de cada dono (O(donos))."""
+        kinds = {v: k for k, v in self._OWNER_CODES.items()}
+        with self.alloc_lock:
+            for slot in range(self._owner_count):
+                code, ident, blocks, inodes = self._OWNER.unpack_from(self._mm, self._owner_pos(slot))
+                kind = kinds.get(code)
+                if kind is None:
+                    continue
+                self._owner_slots[(kind, ident)] = slot
+                if blocks or inodes:
+                    quotas.restore(kind, ident, blocks, inodes)
+            quotas.track_changes()
+            self._quotas = quotas
+
+    def _sync_usage(self):
+        """Grava o uso dos donos alterados desde a última gravação (O(alterados))."""
+        if self._quotas is None:
+            return
+        for kind, ident, blocks, inodes in self._quotas.changes():
+            slot = self._owner_slots.get((kind, ident))
+            if slot is None:
+                if not blocks and not inodes:
+                    continue
+                slot = self._new_owner_slot((kind, ident))
+            self._write_owner(slot, kind, ident, blocks, inodes)
+
+    # ------------------------------------------------------------------
+    # Tabela de inodes
+    # ------------------------------------------------------------------
+
+    def _inode_pos(self, ino):
+        return self._inode_off + ino * self.INODE_SIZE
+
+    def _read_inode(self, ino):
+        return self._INODE.unpack_from(self._mm, self._inode_pos(ino))
+
+    def _write_inode(self, ino, *fields):
+        pos = self._inode_pos(ino)
+        self._INODE.pack_into(self._mm, pos, *fields)
+        self._touch(pos, self._INODE.size)
+
+    def _set_field(self, ino, index, value):
+        """Altera um único campo do registro de inode."""
+        fields = list(self._read_inode(ino))
+        fields[index] = value
+        self._write_inode(ino, *fields)
+
+    # Índices dos campos no registro
+    F_KIND, F_FTYPE, F_MODE, F_UID, F_GID, F_SIZE = 0, 1, 2, 3, 4, 5
+    F_CTIME, F_MTIME, F_ATIME = 6, 7, 8
+    F_PARENT, F_FIRST, F_NEXT, F_PREV = 9, 10, 11, 12
+    F_EXT_COUNT, F_EXT_NEXT, F_NAME_LEN, F_NAME = 13, 14, 15, 16
+
+    def _alloc_ino(self):
+        """Obtém um inode livre (lista de livres ou high-water mark)."""
+        if self._free_ino_head:
+            ino = self._free_ino_head
+            self._free_ino_head = self._read_inode(ino)[self.F_NEXT]
+        elif self._ino_hwm <= self.max_inodes:
+            ino = self._ino_hwm
+            self._ino_hwm += 1
+        else:
+            raise Exception("Erro: Tabela de inodes cheia.")
+        self._write_superblock()
+        return ino
+
+    def _free_ino(self, ino):
+        """Devolve o inode para a lista de livres (encadeada pelo campo 'próximo')."""
+        self._write_inode(ino, self.I_FREE, 0, 0, 0, 0, 0, 0.0, 0.0, 0.0,
+                          0, 0, self._free_ino_head, 0, 0, 0, 0, b"")
+        self._free_ino_head = ino
+        self._write_superblock()
+
+    def _encode_name(self, name):
+        raw = name.encode("utf-8")
+        if len(raw) > self.NAME_MAX:
+            raise Exception(f"Erro: Nome '{name}' excede {self.NAME_MAX} bytes.")
+        return raw
+
+    def _write_extents(self, ino, extents):
+        """
+        Grava a lista de extents no inode. O que não couber no registro
+        segue em registros de continuação encadeados (I_EXTENTS).
+        """
+        # Libera a cadeia de continuação anterior
+        nxt = self._read_inode(ino)[self.F_EXT_NEXT]
+        while nxt:
+            following = self._read_inode(nxt)[self.F_EXT_NEXT]
+            self._free_ino(nxt)
+            nxt = following
+
+        per = self.EXTENTS_PER_INODE
+        chunks = [extents[i:i + per] for i in range(0, len(extents), per)] or [[]]
+        # Aloca as continuações de trás para frente para encadeá-las
+        next_ino = 0
+        for chunk in reversed(chunks[1:]):
+            cont = self._alloc_ino()
+            self._write_inode(cont, self.I_EXTENTS, 0, 0, 0, 0, 0, 0.0, 0.0, 0.0,
+                              0, 0, 0, 0, len(chunk), next_ino, 0, b"")
+            self._pack_extents(cont, chunk)
+            next_ino = cont
+
+        fields = list(self._read_inode(ino))
+        fields[self.F_EXT_COUNT] = len(chunks[0])
+        fields[self.F_EXT_NEXT] = next_ino
+        self._write_inode(ino, *fields)
+        self._pack_extents(ino, chunks[0])
+
+    def _pack_extents(self, ino, extents):
+        pos = self._inode_pos(ino) + self._INODE.size
+        self._touch(pos, len(extents) * self._EXTENT.size)
+        for start, length in extents:
+            self._EXTENT.pack_into(self._mm, pos, start, length)
+            pos += self._EXTENT.size
+
+    def _read_extents(self, ino):
+        extents = []
+        while ino:
+            fields = self._read_inode(ino)
+            pos = self._inode_pos(ino) + self._INODE.size
+            for _ in range(fields[self.F_EXT_COUNT]):
+                extents.append(self._EXTENT.unpack_from(self._mm, pos))
+                pos += self._EXTENT.size
+            ino = fields[self.F_EXT_NEXT]
+        return extents
+
+    def _link(self, parent_ino, ino):
+        """Insere o inode no início da lista de filhos do diretório pai."""
+        head = self._read_inode(parent_ino)[self.F_FIRST]
+        fields = list(self._read_inode(ino))
+        fields[self.F_PARENT] = parent_ino
+        fields[self.F_NEXT] = head
+        fields[self.F_PREV] = 0
+        self._write_inode(ino, *fields)
+        if head:
+            self._set_field(head, self.F_PREV, ino)
+        self._set_field(parent_ino, self.F_FIRST, ino)
+
+    def _unlink(self, ino):
+        """Remove o inode da lista de filhos do diretório pai."""
+        fields = self._read_inode(ino)
+        parent, nxt, prev = fields[self.F_PARENT], fields[self.F_NEXT], fields[self.F_PREV]
+        if prev:
+            self._set_field(prev, self.F_NEXT, nxt)
+        elif parent:
+            self._set_field(parent, self.F_FIRST, nxt)
+        if nxt:
+            self._set_field(nxt, self.F_PREV, prev)
+
+    # ------------------------------------------------------------------
+    # Montagem preguiçosa
+    # ------------------------------------------------------------------
+
+    def mount_root(self, table):
+        self._table = table
+        table.loader = self._load_children
+        self._load_usage(table.quotas)
+        fields = self._read_inode(self.root_ino)
+        self._claim(self.root_ino, fields, 0)
+        return self.root_ino
+
+    def _claim(self, ino, fields, parent_ino):
+        """Copia um registro de inode do disco para a linha ino da tabela."""
+        (kind, ftype, mode, uid, gid, size, ctime, mtime, atime,
+         _parent, _first, _next, _prev, _n_ext, ext_next, name_len, raw_name) = fields
+        table = self._table
+        name = raw_name[:name_len].decode("utf-8")
+        if kind == self.I_DIR:
+            table.alloc(InodeTable.DIR, name, parent=parent_ino, ftype=ftype, mode=mode,
+                        uid=uid, gid=gid, ino=ino, charge=False)
+            # Filhos ainda não lidos: serão carregados pelo loader no primeiro acesso
+            del table.dirents[ino]
+            # Em diretórios, 'tamanho' guarda os bytes da subárvore e o campo
+            # de continuação de extents guarda a quantidade de arquivos
+            table.size[ino], table.nfiles[ino] = size, ext_next
+        else:
+            table.alloc(InodeTable.FILE, name, parent=parent_ino, ftype=ftype, mode=mode,
+                        uid=uid, gid=gid, ino=ino, charge=False)
+            table.size[ino] = size
+            table.set_extents(ino, self._read_extents(ino), charge=False)
+        table.ctime[ino], table.mtime[ino], table.atime[ino] = ctime, mtime, atime
+        return name
+
+    def _load_children(self, dir_ino):
+        """Lê do disco os filhos de um diretório (chamado no primeiro acesso)."""
+        with self.alloc_lock:
+            children = {}
+            ino = self._read_inode(dir_ino)[self.F_FIRST]
+            while ino:
+                fields = self._read_inode(ino)
+                children[self._claim(ino, fields, dir_ino)] = ino
+                ino = fields[self.F_NEXT]
+            return children
+
+    # ------------------------------------------------------------------
+    # Ganchos de persistência
+    # ------------------------------------------------------------------
+
+    def reserve_inode(self):
+        with self.alloc_lock:
+            return self._alloc_ino()
+
+    def new_inode(self, node, user):
+        with self.alloc_lock:
+            ino = node.ino
+            raw = self._encode_name(node.name)
+            if node.is_dir:
+                now = time.time()
+                self._write_inode(ino, self.I_DIR, FileType.DIRECTORY.value, 0o755, user.uid, user.gid,
+                                  0, now, now, now, 0, 0, 0, 0, 0, 0, len(raw), raw)
+            else:
+                f = node.file
+                self._write_inode(ino, self.I_FILE, f.type.value, f.permissions, f.uid, f.gid,
+                                  f.size, f.created_at, f.updated_at, f.access_at,
+                                  0, 0, 0, 0, 0, 0, len(raw), raw)
+                self._write_extents(ino, f.extents)
+            self._link(node.parent.ino, ino)
+
+    def sync_file(self, file_obj):
+        with self.alloc_lock:
+            ino = file_obj.id
+            fields = list(self._read_inode(ino))
+            if fields[self.F_KIND] != self.I_FILE:
+                return
+            fields[self.F_FTYPE] = file_obj.type.value
+            fields[self.F_MODE] = file_obj.permissions
+            fields[self.F_UID] = file_obj.uid
+            fields[self.F_GID] = file_obj.gid
+            fields[self.F_SIZE] = file_obj.size
+            fields[self.F_CTIME] = file_obj.created_at
+            fields[self.F_MTIME] = file_obj.updated_at
+            fields[self.F_ATIME] = file_obj.access_at
+            self._write_inode(ino, *fields)
+            self._write_extents(ino, file_obj.extents)
+
+    def sync_dir(self, ino):
+        with self.alloc_lock:
+            fields = list(self._read_inode(ino))
+            fields[self.F_SIZE] = self._table.size[ino]
+            fields[self.F_EXT_NEXT] = self._table.nfiles[ino]
+            self._write_inode(ino, *fields)
+
+    def relink_inode(self, node, old_parent):
+        with self.alloc_lock:
+            raw = self._encode_name(node.name)
+            self._unlink(node.ino)
+            fields = list(self._read_inode(node.ino))
+            fields[self.F_NAME_LEN] = len(raw)
+            fields[self.F_NAME] = raw
+            self._write_inode(node.ino, *fields)
+            self._link(node.parent.ino, node.ino)
+            if node.file is not None:
+                self.sync_file(node.file)
+
+    def release_inode(self, node):
+        with self.alloc_lock:
+            # O tipo vem do registro: a linha da tabela já pode ter sido liberada
+            if self._read_inode(node.ino)[self.F_KIND] == self.I_FILE:
+                self._write_extents(node.ino, [])
+            self._unlink(node.ino)
+            self._free_ino(node.ino)
+
+    def flush(self):
+        """
+        Grava o superbloco e descarrega as páginas do mmap no arquivo. Com
+        journal, confirma as transações pendentes e faz um checkpoint.
+        """
+        if self._journal is not None:
+            self.checkpoint()
+            return
+        with self.alloc_lock:
+            self._sync_usage()
+            self._write_superblock()
+            self._dm.flush()
+
+    def close(self):
+        """Grava o superbloco, descarrega o mmap no arquivo e fecha a imagem."""
+        if self._dm.closed:
+            return
+        if self._flusher is not None:
+            self._stop.set()
+            self._flusher.join()
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+        self.data.release()
+        self.refcount.release()
+        for mm in (self._mm, self._dm) if self._mm is not self._dm else (self._dm,):
+            try:
+                mm.close()
+            except BufferError:
+                # Ainda há memoryviews vivas sobre o mmap; o GC fecha o mapeamento.
+                pass
+        self._fd.close()
+
+    # ------------------------------------------------------------------
+    # Journal: transações, group commit e checkpoint
+    # ------------------------------------------------------------------
+
+    def _touch(self, offset, length):
+        """Marca os setores de metadados [offset, offset + length) para o próximo commit."""
+        if self._journal is not None and length > 0:
+            sector = self.SECTOR
+            self._dirty.update(range(offset // sector, (offset + length - 1) // sector + 1))
+
+    def _blocks_changed(self, start, length):
+        start = max(start, 0)
+        length = min(start + length, self.total_blocks) - start
+        self._touch(self._bitmap_off + start, length)
+        self._touch(self._refcount_off + 2 * start, 2 * length)
+
+    def transaction(self):
+        if self._journal is None:
+            return contextlib.nullcontext()
+        return self._transaction()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Operações aninhadas (ex: cp -> touch) fazem parte da transação externa
+        local = self._local
+        depth = getattr(local, "depth", 0)
+        if depth == 0:
+            with self._gate:
+                while self._committing:
+                    self._gate.wait()
+                self._active += 1
+        local.depth = depth + 1
+        try:
+            yield
+        finally:
+            local.depth = depth
+            if depth == 0:
+                with self._gate:
+                    self._active -= 1
+                    self._ops += 1
+                    if not self._active:
+                        self._gate.notify_all()
+                    due = self._sync_interval <= 0 or self._ops >= self.MAX_BATCH
+                if due:
+                    self.commit()
+
+    def on_commit(self, callback):
+        self._commit_hooks.append(callback)
+
+    def _flush_loop(self):
+        """Thread de commit periódico (group commit a cada sync_interval)."""
+        while not self._stop.wait(self._sync_interval):
+            if self._ops or self._dirty:
+                self.commit()
+
+    def commit(self):
+        """
+        Group commit: espera as operações em andamento terminarem, captura os
+        setores de metadados alterados por todas elas e os grava no journal
+        como um único registro (um fsync). Em seguida, os setores são
+        escritos na posição definitiva da imagem (sem fsync; o checkpoint
+        sincroniza). Retorna o número de operações confirmadas.
+        """
+        if self._journal is None:
+            return 0
+        with self._commit_lock:
+            with self._gate:
+                if not self._ops and not self._dirty:
+                    return 0
+                # Novas operações esperam enquanto a transação é capturada
+                self._committing = True
+                while self._active:
+                    self._gate.wait()
+            try:
+                # Modo ordered: dados (ex: blocos sujos do cache) antes dos metadados
+                for callback in self._commit_hooks:
+                    callback()
+                with self.alloc_lock:
+                    self._sync_usage()
+                    self._write_superblock()
+                    entries = self._capture()
+                ops, self._ops = self._ops, 0
+            finally:
+                with self._gate:
+                    self._committing = False
+                    self._gate.notify_all()
+
+            self._dm.flush()
+            self._journal.append(entries)
+            fd = self._fd.fileno()
+            for offset, data in entries:
+                os.pwrite(fd, data, offset)
+            self.commits += 1
+            self.committed_ops += ops
+            if self._journal.size >= self.CHECKPOINT_BYTES:
+                self._checkpoint()
+            return ops
+
+    def _capture(self):
+        """Copia os setores sujos, agrupados em faixas contíguas, e limpa o conjunto."""
+        sector, limit, mm = self.SECTOR, self._data_off, self._mm
+        entries = []
+        runs = []
+        for idx in sorted(self._dirty):
+            if runs and runs[-1][1] == idx:
+                runs[-1][1] = idx + 1
+            else:
+                runs.append([idx, idx + 1])
+        for first, end in runs:
+            start, stop = first * sector, min(end * sector, limit)
+            entries.append((start, mm[start:stop]))
+        self._dirty = set()
+        return entries
+
+    def checkpoint(self):
+        """Confirma o pendente, sincroniza a imagem e esvazia o journal."""
+        if self._journal is None:
+            self.flush()
+            return
+        self.commit()
+        with self._commit_lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self._dm.flush()
+        os.fsync(self._fd.fileno())
+        self._journal.reset()
+        self.checkpoints += 1
+
+    def journal_stats(self):
+        """Contadores do journal (None se a imagem não usa journal)."""
+        if self._journal is None:
+            return None
+        return {"commits": self.commits, "operations": self.committed_ops,
+                "checkpoints": self.checkpoints, "pending": self._ops,
+                "log_bytes": self._journal.size, "recovered": self.recovered}
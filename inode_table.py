@@ -0,0 +1,241 @@
+import threading
+from array import array
+
+from name_index import NameIndex
+from quota import QuotaManager
+
+
+class InodeTable:
+    """
+    Tabela de inodes compacta.
+
+    Os metadados ficam em colunas tipadas (array), indexadas pelo número do
+    inode, em vez de um objeto Python por arquivo. Node e File são apenas
+    visões (__slots__) sobre uma linha desta tabela. Inodes liberados entram
+    em uma lista de livres e são reutilizados.
+
+    Alocação, liberação, leitura preguiçosa de diretórios e a atualização
+    dos agregados são serializadas por uma trava da tabela; os demais
+    campos de um inode são protegidos pelas travas por inode do FileSystem.
+
+    O inode 0 é reservado e significa "nenhum" (ex: pai da raiz).
+    Em diretórios, a coluna size guarda os bytes da subárvore e a coluna
+    nfiles a quantidade de arquivos da subárvore.
+
+    O uso de blocos e inodes por dono e grupo (cotas) é contabilizado aqui,
+    onde inodes, extents e donos mudam: alloc, free, set_extents e
+    set_owner atualizam os contadores de quotas (QuotaManager).
+    """
+    FREE = 0
+    FILE = 1
+    DIR = 2
+
+    ROOT_INO = 1
+
+    # Nome, código de tipo e valor inicial de cada coluna
+    _COLUMNS = (
+        ("kind", "B", 0),
+        ("ftype", "B", 0),
+        ("mode", "H", 0),
+        ("uid", "I", 0),
+        ("gid", "I", 0),
+        ("size", "Q", 0),
+        ("ctime", "d", 0.0),
+        ("mtime", "d", 0.0),
+        ("atime", "d", 0.0),
+        ("parent", "I", 0),
+        ("nfiles", "Q", 0),
+        # Extent único guardado em linha (arquivos com mais extents usam _extents)
+        ("ext_start", "I", 0),
+        ("ext_len", "I", 0),
+        # Versão das permissões: muda a cada chmod, chown, alocação e
+        # liberação (valida os bits em cache do PermissionManager)
+        ("pversion", "I", 0),
+    )
+
+    _shared = None
+
+    def __init__(self):
+        for name, typecode, initial in self._COLUMNS:
+            setattr(self, name, array(typecode, [initial]))
+        self.names = [None]
+        # Dicionários de filhos (nome -> inode), apenas para diretórios já lidos
+        self.dirents = {}
+        # Índices ordenados de nomes (NameIndex), criados no primeiro uso
+        self.name_indexes = {}
+        # Listas de extents dos arquivos com mais de um extent
+        self._extents = {}
+        # Função (ino) -> {nome: ino} usada para ler diretórios sob demanda
+        self.loader = None
+        # Dispositivo usado pelas visões de arquivo (File)
+        self.disk = None
+        self._free = array("I")
+        self.count = 0
+        self._lock = threading.RLock()
+        # Uso e limites por usuário/grupo
+        self.quotas = QuotaManager()
+
+    @classmethod
+    def shared(cls):
+        """Tabela padrão para arquivos criados fora de um FileSystem."""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, capacity):
+        """Estende todas as colunas até comportar o inode capacity - 1."""
+        extra = capacity - len(self.kind)
+        if extra <= 0:
+            return
+        for name, typecode, initial in self._COLUMNS:
+            getattr(self, name).extend(array(typecode, [initial]) * extra)
+        self.names.extend([None] * extra)
+
+    def alloc(self, kind, name, parent=0, ftype=0, mode=0, uid=0, gid=0, now=0.0, ino=None,
+              charge=True):
+        """
+        Aloca um inode e preenche seus metadados. Se ino for informado (ex: o
+        número já usado no disco persistente), essa linha é usada diretamente.
+        Com charge=False o inode não é contado nas cotas (nós lidos de um
+        disco cujo uso já foi contabilizado na montagem).
+        Retorna o número do inode.
+        """
+        with self._lock:
+            if ino is None:
+                ino = 0
+                while self._free:
+                    candidate = self._free.pop()
+                    if self.kind[candidate] == self.FREE:
+                        ino = candidate
+                        break
+                if not ino:
+                    ino = len(self.kind)
+                    self._grow(ino + 1)
+            else:
+                self._grow(ino + 1)
+
+            self.kind[ino] = kind
+            self.ftype[ino] = ftype
+            self.mode[ino] = mode
+            self.uid[ino] = uid
+            self.gid[ino] = gid
+            self.size[ino] = 0
+            self.nfiles[ino] = 0
+            self.ctime[ino] = self.mtime[ino] = self.atime[ino] = now
+            self.parent[ino] = parent
+            self.ext_start[ino] = self.ext_len[ino] = 0
+            self.names[ino] = name
+            if kind == self.DIR:
+                self.dirents[ino] = {}
+            self.count += 1
+            self._bump(ino)
+            if charge:
+                self.quotas.charge(uid, gid, inodes=1)
+            return ino
+
+    def free(self, ino):
+        """Libera o inode para reutilização."""
+        with self._lock:
+            if self.kind[ino] == self.FREE:
+                return
+            self.quotas.charge(self.uid[ino], self.gid[ino], -self.block_count(ino), -1)
+            self._bump(ino)
+            self.kind[ino] = self.FREE
+            self.names[ino] = None
+            self.dirents.pop(ino, None)
+            self.name_indexes.pop(ino, None)
+            self._extents.pop(ino, None)
+            self.ext_len[ino] = 0
+            self._free.append(ino)
+            self.count -= 1
+
+    def children(self, ino):
+        """Dicionário de filhos de um diretório, lido sob demanda se necessário."""
+        entries = self.dirents.get(ino)
+        if entries is None:
+            with self._lock:
+                entries = self.dirents.get(ino)
+                if entries is None:
+                    if self.kind[ino] != self.DIR:
+                        # Liberado por outra thread: nada a carregar
+                        return {}
+                    entries = self.loader(ino) if self.loader is not None else {}
+                    self.dirents[ino] = entries
+        return entries
+
+    def name_index(self, ino):
+        """
+        Índice ordenado dos nomes do diretório ino. Criado (O(n log n)) no
+        primeiro uso e depois mantido a cada inserção/remoção de filho.
+        O chamador deve ter ao menos a trava de leitura do diretório.
+        """
+        index = self.name_indexes.get(ino)
+        if index is None:
+            index = self.name_indexes.setdefault(ino, NameIndex(self.children(ino)))
+        return index
+
+    def get_extents(self, ino):
+        length = self.ext_len[ino]
+        if length:
+            return [(self.ext_start[ino], length)]
+        extents = self._extents.get(ino)
+        return list(extents) if extents else []
+
+    def block_count(self, ino):
+        """Número de blocos dos extents do inode."""
+        length = self.ext_len[ino]
+        if length:
+            return length
+        return sum(length for _, length in self._extents.get(ino, ()))
+
+    def set_extents(self, ino, extents, charge=True):
+        if charge:
+            new = extents[0][1] if len(extents) == 1 else sum(length for _, length in extents)
+            d_blocks = new - self.block_count(ino)
+            if d_blocks:
+                self.quotas.charge(self.uid[ino], self.gid[ino], blocks=d_blocks)
+        if len(extents) == 1:
+            self.ext_start[ino], self.ext_len[ino] = extents[0]
+            self._extents.pop(ino, None)
+        else:
+            self.ext_len[ino] = 0
+            if extents:
+                self._extents[ino] = list(extents)
+            else:
+                self._extents.pop(ino, None)
+
+    def set_owner(self, ino, uid=None, gid=None):
+        """Troca dono e/ou grupo do inode, transferindo o uso dele nas cotas."""
+        old_uid, old_gid = self.uid[ino], self.gid[ino]
+        uid = old_uid if uid is None else uid
+        gid = old_gid if gid is None else gid
+        self.quotas.move(old_uid, old_gid, uid, gid, self.block_count(ino), 1)
+        self.uid[ino] = uid
+        self.gid[ino] = gid
+        self._bump(ino)
+
+    def set_mode(self, ino, mode):
+        """Troca os bits de permissão do inode."""
+        self.mode[ino] = mode
+        self._bump(ino)
+
+    def _bump(self, ino):
+        # Depois de alterar o inode: quem leu a versão antiga descarta os bits
+        self.pversion[ino] = (self.pversion[ino] + 1) & 0xFFFFFFFF
+
+    def add_usage(self, ino, d_size, d_files, disk=None):
+        """
+        Soma as variações de bytes e de arquivos ao diretório ino e a todos os
+        seus ancestrais (O(profundidade)), avisando o disco de cada alteração.
+        """
+        size, nfiles, parent = self.size, self.nfiles, self.parent
+        with self._lock:
+            while ino:
+                size[ino] += d_size
+                nfiles[ino] += d_files
+                if disk is not None:
+                    disk.sync_dir(ino)
+                ino = parent[ino]
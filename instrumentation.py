@@ -0,0 +1,314 @@
+import threading
+import time
+import types
+
+
+class _OpStats:
+    """Contadores de uma operação: chamadas, bytes, tempo total e histograma."""
+    __slots__ = ("calls", "bytes", "total_ns", "max_ns", "buckets")
+
+    # Histograma em potências de 2 de microssegundos: o bucket i conta as
+    # chamadas com latência em [2^(i-1), 2^i) µs (o bucket 0 é < 1 µs)
+    N_BUCKETS = 24
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * self.N_BUCKETS
+
+    def record(self, elapsed_ns, n_bytes):
+        self.calls += 1
+        self.bytes += n_bytes
+        self.total_ns += elapsed_ns
+        if elapsed_ns > self.max_ns:
+            self.max_ns = elapsed_ns
+        self.buckets[min((elapsed_ns // 1000).bit_length(), self.N_BUCKETS - 1)] += 1
+
+    def percentile_us(self, q):
+        """Estimativa de percentil (limite superior do bucket), em µs."""
+        target = q * self.calls
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= target:
+                return float(1 << i)
+        return 0.0
+
+    def snapshot(self):
+        return {
+            "calls": self.calls,
+            "bytes": self.bytes,
+            "total_ms": self.total_ns / 1e6,
+            "avg_us": self.total_ns / self.calls / 1000 if self.calls else 0.0,
+            "p50_us": self.percentile_us(0.50),
+            "p99_us": self.percentile_us(0.99),
+            "max_us": self.max_ns / 1000,
+            "histogram_us": {(1 << i): c for i, c in enumerate(self.buckets) if c},
+        }
+
+
+def _size(data):
+    if data is None:
+        return 0
+    if isinstance(data, str):
+        return len(data.encode("utf-8"))
+    return len(data)
+
+
+def _arg(index, name):
+    """Medidor de bytes que lê o argumento posicional index (ou nomeado name)."""
+    def sizer(args, kwargs, result):
+        if name in kwargs:
+            return _size(kwargs[name])
+        return _size(args[index]) if len(args) > index else 0
+    return sizer
+
+
+def _result(args, kwargs, result):
+    return _size(result) if isinstance(result, (bytes, bytearray, memoryview)) else 0
+
+
+def _text_result(args, kwargs, result):
+    return _size(result) if isinstance(result, (str, bytes)) else 0
+
+
+class Instrumentation:
+    """
+    Instrumentação ligável/desligável de operações do sistema de arquivos e
+    de primitivas do disco.
+
+    Ao ser ligada, substitui os métodos registrados de cada objeto por
+    wrappers (atributos da instância) que contam chamadas, bytes movidos e
+    latência. Ao ser desligada, os wrappers são removidos e as chamadas
+    voltam a ir direto aos métodos originais: o custo desligado é zero.
+
+    Também mantém contadores livres (count): blocos alocados/liberados e
+    verificações de permissão negadas. Os blocos são contados pelo próprio
+    alocador do disco, sob a trava dele (uma diferença de free_count medida
+    fora da trava incluiria blocos de operações concorrentes); aqui só se
+    guarda o valor no momento em que a instrumentação foi ligada ou zerada.
+
+    As sessões do servidor registram em paralelo: estatísticas e contadores
+    são atualizados sob uma trava própria.
+    """
+    # Operações do FileSystem e bytes movidos por cada uma
+    FS_OPS = {
+        "mkdir": None, "touch": None, "ls": None, "rm": None,
+        "cp": None, "mv": None, "find": None, "du": None, "chmod_file": None,
+        "chown_file": None, "open": None, "fragmentation": None, "defrag": None,
+        "write_file": _arg(1, "content"),
+        "pwrite_file": _arg(2, "content"),
+        "append_file": _arg(1, "content"),
+        "truncate_file": None,
+        "read_file": _text_result,
+        "stream_file": _text_result,
+        "stream_ls": _text_result,
+    }
+    # Primitivas do disco
+    DISK_OPS = {
+        "allocate": _arg(0, "content"),
+        "reserve": None,
+        "write": _arg(1, "content"),
+        "read": _result,
+        "read_block": _result,
+        "write_block": _arg(1, "content"),
+        "write_blocks": None,
+        "free": None,
+        "relocate": None,
+    }
+    # Buffer cache (as chamadas que o FileSystem faz; o disco recebe as faltas e o write-back)
+    CACHE_OPS = {
+        "allocate": _arg(0, "content"),
+        "write": _arg(1, "content"),
+        "read": _result,
+        "read_block": _result,
+        "write_block": _arg(1, "content"),
+        "free": None,
+        "relocate": None,
+        "write_back": None,
+    }
+    ALLOCATOR_COUNTERS = ("blocks_allocated", "blocks_freed")
+
+    def __init__(self):
+        self.enabled = False
+        # (objeto, prefixo, {método: medidor de bytes})
+        self._targets = []
+        self._lock = threading.Lock()
+        # Disco cujo alocador conta os blocos e os totais dele ao ligar/zerar
+        self._allocator = None
+        self._allocator_base = None
+        self.reset()
+
+    # ------------------------------------------------------------------
+    # Registro de alvos
+    # ------------------------------------------------------------------
+
+    def attach(self, obj, prefix, methods):
+        """Registra métodos de obj para instrumentação (nomes 'prefixo.método')."""
+        self._targets.append((obj, prefix, dict(methods)))
+        if self.enabled:
+            self._install(obj, prefix, methods)
+
+    def attach_system(self, fs, disk, pm, cache=None):
+        """
+        Registra as operações do FileSystem, do buffer cache (se houver), as
+        primitivas do disco e as permissões.
+        """
+        self.attach(fs, "fs", self.FS_OPS)
+        if cache is not None:
+            self.attach(cache, "cache", self.CACHE_OPS)
+        self.attach(disk, "disk", self.DISK_OPS)
+        self.attach(pm, "perm", {"check_permission": None, "check_many": None})
+        self._allocator = disk
+        if self.enabled:
+            self._allocator_base = self._allocator_totals()
+
+    def _install(self, obj, prefix, methods):
+        for name, sizer in methods.items():
+            original = getattr(type(obj), name, None)
+            if original is None:
+                continue
+            key = f"{prefix}.{name}"
+            if name in ("check_permission", "check_many"):
+                wrapper = self._wrap_permission(original, key)
+            else:
+                wrapper = self._wrap(original, key, sizer)
+            setattr(obj, name, types.MethodType(wrapper, obj))
+
+    def _uninstall(self, obj, methods):
+        for name in methods:
+            obj.__dict__.pop(name, None)
+
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            self._allocator_base = self._allocator_totals()
+            for obj, prefix, methods in self._targets:
+                self._install(obj, prefix, methods)
+
+    def disable(self):
+        if self.enabled:
+            self.enabled = False
+            for obj, _, methods in self._targets:
+                self._uninstall(obj, methods)
+            with self._lock:
+                self.counters.update(self._allocator_counters())
+            self._allocator_base = None
+
+    def _allocator_totals(self):
+        if self._allocator is None:
+            return None
+        return tuple(getattr(self._allocator, name) for name in self.ALLOCATOR_COUNTERS)
+
+    def _allocator_counters(self):
+        """Contadores de blocos: acumulado + o que o alocador contou desde que foi ligada."""
+        counters = {name: self.counters[name] for name in self.ALLOCATOR_COUNTERS}
+        base = self._allocator_base
+        if base is not None:
+            for name, now, then in zip(self.ALLOCATOR_COUNTERS, self._allocator_totals(), base):
+                counters[name] += now - then
+        return counters
+
+    # ------------------------------------------------------------------
+    # Wrappers
+    # ------------------------------------------------------------------
+
+    def _record(self, key, elapsed_ns, n_bytes):
+        with self._lock:
+            stats = self.ops.get(key)
+            if stats is None:
+                stats = self.ops[key] = _OpStats()
+            stats.record(elapsed_ns, n_bytes)
+
+    def _wrap(self, original, key, sizer):
+        clock = time.perf_counter_ns
+        instr = self
+
+        def wrapper(obj, *args, **kwargs):
+            start = clock()
+            result = original(obj, *args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                return instr._wrap_gen(result, key, start)
+            instr._record(key, clock() - start, sizer(args, kwargs, result) if sizer else 0)
+            return result
+        return wrapper
+
+    def _wrap_gen(self, gen, key, start):
+        """Generators (streaming): mede do início até o último item e soma os bytes gerados."""
+        clock = time.perf_counter_ns
+        elapsed = clock() - start
+        n_bytes = 0
+        try:
+            while True:
+                t0 = clock()
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    elapsed += clock() - t0
+                    return
+                elapsed += clock() - t0
+                n_bytes += _text_result(None, None, item)
+                yield item
+        finally:
+            self._record(key, elapsed, n_bytes)
+
+    def _wrap_permission(self, original, key):
+        """Verificações de permissão (individuais ou em lote): conta as negadas."""
+        clock = time.perf_counter_ns
+        instr = self
+
+        def wrapper(obj, file_objs, user, operation):
+            start = clock()
+            allowed = original(obj, file_objs, user, operation)
+            instr._record(key, clock() - start, 0)
+            if isinstance(allowed, list):
+                denied = allowed.count(False)
+                if denied:
+                    instr.count("permission_denied", denied)
+            elif not allowed:
+                instr.count("permission_denied")
+            return allowed
+        return wrapper
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    def count(self, name, n=1):
+        """Incrementa um contador livre."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        """Zera todas as estatísticas (os wrappers continuam instalados)."""
+        with self._lock:
+            self.ops = {}
+            self.counters = {"blocks_allocated": 0, "blocks_freed": 0, "permission_denied": 0}
+            if self.enabled:
+                self._allocator_base = self._allocator_totals()
+
+    def snapshot(self):
+        """Retorna uma cópia (dicionário) das estatísticas atuais."""
+        with self._lock:
+            counters = dict(self.counters)
+            counters.update(self._allocator_counters())
+            return {
+                "enabled": self.enabled,
+                "counters": counters,
+                "ops": {key: stats.snapshot() for key, stats in sorted(self.ops.items())},
+            }
+
+    def report(self):
+        """Relatório em texto para o comando stats."""
+        snap = self.snapshot()
+        lines = [f"Instrumentação: {'ligada' if snap['enabled'] else 'desligada'}"]
+        lines.append("  " + ", ".join(f"{k}: {v}" for k, v in snap["counters"].items()))
+        if snap["ops"]:
+            lines.append(f"  {'operação':<22}{'chamadas':>10}{'bytes':>12}{'média µs':>11}"
+                         f"{'p50 µs':>9}{'p99 µs':>9}{'máx µs':>10}")
+            for key, op in snap["ops"].items():
+                lines.append(f"  {key:<22}{op['calls']:>10}{op['bytes']:>12}{op['avg_us']:>11.1f}"
+                             f"{op['p50_us']:>9.0f}{op['p99_us']:>9.0f}{op['max_us']:>10.1f}")
+        return "\n".join(lines)
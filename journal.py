@@ -0,0 +1,106 @@
+import os
+import struct
+import zlib
+
+
+class Journal:
+    """
+    Journal (write-ahead log) de metadados da imagem de disco.
+
+    Cada transação confirmada é um registro com as novas versões (after
+    images) dos setores de metadados alterados, gravado e sincronizado no
+    journal antes de ir para a posição definitiva na imagem. Um registro só
+    vale se estiver completo e com o CRC correto: um registro truncado por
+    uma queda é descartado na recuperação, junto com tudo o que vem depois.
+
+    Layout do arquivo:
+      [cabeçalho][registro 1][registro 2]...
+      registro = [cabeçalho do registro][(offset, tamanho, bytes) * n][crc32]
+    """
+    MAGIC = b"M3SOJNL\0"
+    VERSION = 1
+    _HEADER = struct.Struct("<8sI4x")
+    _RECORD = struct.Struct("<4sQII")  # marca, sequência, nº de entradas, bytes do corpo
+    _RECORD_MAGIC = b"TXN\0"
+    _ENTRY = struct.Struct("<QI")      # offset na imagem, tamanho
+    _CRC = struct.Struct("<I")
+
+    def __init__(self, path):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) >= self._HEADER.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if exists:
+            magic, version = self._HEADER.unpack(os.pread(self._fd, self._HEADER.size, 0))
+            if magic != self.MAGIC or version != self.VERSION:
+                os.close(self._fd)
+                raise ValueError(f"'{path}' não é um journal M3-SO válido.")
+        else:
+            self.reset()
+        self.size = os.fstat(self._fd).st_size
+        self.seq = 0
+        # Transações gravadas desde a abertura
+        self.commits = 0
+
+    def records(self):
+        """Gera (sequência, [(offset, bytes)]) de cada registro válido, em ordem."""
+        with open(self.path, "rb") as f:
+            f.seek(self._HEADER.size)
+            while True:
+                head = f.read(self._RECORD.size)
+                if len(head) < self._RECORD.size:
+                    return
+                magic, seq, n_entries, body_len = self._RECORD.unpack(head)
+                if magic != self._RECORD_MAGIC:
+                    return
+                body = f.read(body_len)
+                tail = f.read(self._CRC.size)
+                if len(body) < body_len or len(tail) < self._CRC.size:
+                    return
+                if zlib.crc32(head + body) != self._CRC.unpack(tail)[0]:
+                    return
+                entries = []
+                pos = 0
+                for _ in range(n_entries):
+                    offset, length = self._ENTRY.unpack_from(body, pos)
+                    pos += self._ENTRY.size
+                    entries.append((offset, body[pos:pos + length]))
+                    pos += length
+                yield seq, entries
+
+    def replay(self, image_fd):
+        """
+        Recuperação: reaplica na imagem os registros confirmados, sincroniza
+        a imagem e esvazia o journal. Reaplicar é idempotente, então uma nova
+        queda durante a recuperação apenas a repete. Retorna o nº de registros.
+        """
+        applied = 0
+        for seq, entries in self.records():
+            for offset, data in entries:
+                os.pwrite(image_fd, data, offset)
+            self.seq = seq
+            applied += 1
+        if applied:
+            os.fsync(image_fd)
+        self.reset()
+        return applied
+
+    def append(self, entries):
+        """Grava uma transação (lista de (offset, bytes)) e a torna durável com um único fsync."""
+        self.seq += 1
+        body = b"".join(self._ENTRY.pack(offset, len(data)) + data for offset, data in entries)
+        head = self._RECORD.pack(self._RECORD_MAGIC, self.seq, len(entries), len(body))
+        record = head + body + self._CRC.pack(zlib.crc32(head + body))
+        os.pwrite(self._fd, record, self.size)
+        os.fsync(self._fd)
+        self.size += len(record)
+        self.commits += 1
+
+    def reset(self):
+        """Checkpoint concluído: descarta os registros (a imagem já os contém)."""
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, self._HEADER.pack(self.MAGIC, self.VERSION), 0)
+        os.fsync(self._fd)
+        self.size = self._HEADER.size
+
+    def close(self):
+        os.close(self._fd)
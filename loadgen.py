@@ -0,0 +1,221 @@
+"""
+Gerador de carga para o modo servidor: abre muitas sessões simultâneas e
+mede a latência de cada comando (do envio até a linha de prompt).
+
+Cada cliente usa seu próprio usuário e diretório (/lg<i>) e, com
+probabilidade --shared, opera em um diretório comum (/shared), criando
+contenção entre sessões. O resultado é emitido em JSON, como em
+benchmark.py:
+
+    python loadgen.py --spawn --clients 200 --ops 50
+    python loadgen.py --port 7070 --clients 500 --output carga.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+from server import PROMPT_MARK
+
+MARK = PROMPT_MARK.encode("utf-8")
+
+
+async def _reply(reader):
+    """Lê linhas até a de prompt. Retorna False se o servidor fechou a conexão."""
+    while True:
+        line = await reader.readline()
+        if not line:
+            return False
+        if line.startswith(MARK):
+            return True
+
+
+def _commands(rng, home, ops, shared):
+    """Sequência de comandos de um cliente (determinística pela semente)."""
+    names = []
+    for i in range(ops):
+        base = "/shared" if rng.random() < shared else home
+        r = rng.random()
+        if r < 0.25 or not names:
+            name = f"{base}/f{i}"
+            names.append(name)
+            yield f"touch {name}"
+        elif r < 0.45:
+            yield f"append {rng.choice(names)} {'x' * rng.randint(1, 64)}"
+        elif r < 0.60:
+            yield f"cat {rng.choice(names)}"
+        elif r < 0.70:
+            yield f"ls {base}"
+        elif r < 0.78:
+            yield f"cp {rng.choice(names)} {base}/c{i}"
+        elif r < 0.86:
+            name = names.pop(rng.randrange(len(names)))
+            yield f"mv {name} {name}m"
+            names.append(f"{name}m")
+        elif r < 0.94:
+            yield f"rm {names.pop(rng.randrange(len(names)))}"
+        else:
+            yield "du /"
+
+
+class _StartLine:
+    """Linha de largada: a carga medida começa quando todas as sessões chegam."""
+    def __init__(self, n):
+        self.pending = n
+        self.arrived = asyncio.Event()
+        self.go = asyncio.Event()
+
+    def arrive(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self.arrived.set()
+
+
+async def _connect(args):
+    if args.unix:
+        return await asyncio.open_unix_connection(args.unix, limit=1 << 20)
+    return await asyncio.open_connection(args.host, args.port, limit=1 << 20)
+
+
+async def run_client(index, args, latencies, start):
+    """Uma sessão: conecta, prepara o diretório e executa os comandos medidos."""
+    rng = random.Random(args.seed * 100003 + index)
+    home = f"/lg{index}"
+    writer = None
+
+    async def send(command):
+        writer.write((command + "\n").encode("utf-8"))
+        await writer.drain()
+        return await _reply(reader)
+
+    try:
+        try:
+            reader, writer = await _connect(args)
+            await _reply(reader)
+            await send(f"su u{index % args.users}")
+            await send(f"mkdir {home}")
+            await send(f"cd {home}")
+        finally:
+            # Sessões que falham na preparação também liberam a largada
+            start.arrive()
+        await start.go.wait()
+        clock = time.perf_counter_ns
+        for command in _commands(rng, home, args.ops, args.shared):
+            t0 = clock()
+            if not await send(command):
+                return False
+            latencies.append(clock() - t0)
+        await send("exit")
+        return True
+    finally:
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def run_load(args):
+    latencies = []
+    # Diretório comum, criado (por root) antes de as sessões conectarem
+    reader, writer = await _connect(args)
+    await _reply(reader)
+    writer.write(b"mkdir /shared\n")
+    await _reply(reader)
+    writer.close()
+
+    start = _StartLine(args.clients)
+    tasks = [asyncio.create_task(run_client(i, args, latencies, start))
+             for i in range(args.clients)]
+    await start.arrived.wait()
+    t0 = time.perf_counter()
+    start.go.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+    failed = sum(1 for r in results if r is not True)
+    latencies.sort()
+
+    def pct(q):
+        if not latencies:
+            return 0.0
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] / 1000, 2)
+
+    return {
+        "clients": args.clients,
+        "users": args.users,
+        "ops_per_client": args.ops,
+        "shared_fraction": args.shared,
+        "commands": len(latencies),
+        "failed_clients": failed,
+        "seconds": round(elapsed, 6),
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_us": pct(0.50),
+        "p99_us": pct(0.99),
+        "max_us": pct(1.0),
+    }
+
+
+def spawn_server(args):
+    """Inicia um servidor (main.py --serve) em outro processo, numa porta livre."""
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    proc = subprocess.Popen(
+        [sys.executable, main_py, "--serve", "--port", "0", "--workers", str(args.workers),
+         "--blocks", str(args.blocks), "--block-size", str(args.block_size), "--cache", "0"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    line = proc.stderr.readline()
+    if "escutando em" not in line:
+        proc.kill()
+        raise RuntimeError(f"Servidor não iniciou: {line.strip()}")
+    args.host, _, port = line.rsplit(" ", 1)[1].strip().rpartition(":")
+    args.port = int(port)
+    return proc
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Gerador de carga do servidor M3-SO")
+    parser.add_argument("--host", default="127.0.0.1", help="Endereço do servidor (padrão: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=7070, help="Porta do servidor (padrão: 7070)")
+    parser.add_argument("--unix", metavar="CAMINHO", help="Socket Unix do servidor")
+    parser.add_argument("--clients", type=int, default=100, help="Sessões simultâneas (padrão: 100)")
+    parser.add_argument("--ops", type=int, default=100, help="Comandos medidos por sessão (padrão: 100)")
+    parser.add_argument("--users", type=int, default=10, help="Usuários distintos (padrão: 10)")
+    parser.add_argument("--shared", type=float, default=0.2,
+                        help="Fração dos comandos no diretório comum /shared (padrão: 0.2)")
+    parser.add_argument("--seed", type=int, default=42, help="Semente do gerador (padrão: 42)")
+    parser.add_argument("--spawn", action="store_true",
+                        help="Inicia um servidor próprio (main.py --serve) durante a medição")
+    parser.add_argument("--workers", type=int, default=8, help="Threads do servidor iniciado com --spawn")
+    parser.add_argument("--blocks", type=int, default=262144, help="Blocos do disco com --spawn")
+    parser.add_argument("--block-size", type=int, default=64, help="Tamanho do bloco com --spawn")
+    parser.add_argument("--output", metavar="ARQUIVO", help="Grava o JSON no arquivo (padrão: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    proc = spawn_server(args) if args.spawn else None
+    try:
+        result = asyncio.run(run_load(args))
+    finally:
+        if proc is not None:
+            # SIGINT: o servidor encerra como no Ctrl-C
+            proc.send_signal(signal.SIGINT)
+            proc.wait()
+    print(f"{result['clients']} sessões: {result['ops_per_sec']:.0f} comandos/s, "
+          f"p50 {result['p50_us']:.0f} us, p99 {result['p99_us']:.0f} us", file=sys.stderr)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import threading
+from contextlib import contextmanager
+
+
+class _Guard:
+    """Gerenciador de contexto sem estado que chama acquire/release."""
+    __slots__ = ("_acquire", "_release")
+
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, *exc):
+        self._release()
+
+
+class RWLock:
+    """
+    Trava de leitores/escritor: vários leitores simultâneos ou um único
+    escritor. Dá preferência a escritores em espera, para que um fluxo
+    contínuo de leituras não os deixe esperando indefinidamente.
+    Não é reentrante.
+    """
+    __slots__ = ("_cond", "_readers", "_writer", "_waiting_writers", "_waiting",
+                 "reader", "writer")
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        # Threads bloqueadas em wait(): sem elas, a liberação não precisa notificar
+        self._waiting = 0
+        # Gerenciadores de contexto reutilizáveis (with lock.reader: ...)
+        self.reader = _Guard(self.acquire_read, self.release_read)
+        self.writer = _Guard(self.acquire_write, self.release_write)
+
+    def _wait(self):
+        self._waiting += 1
+        self._cond.wait()
+        self._waiting -= 1
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers and self._waiting:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            if self._waiting:
+                self._cond.notify_all()
+
+
+class LockTable:
+    """
+    Travas de leitores/escritor por inode, distribuídas em faixas (lock
+    striping): o inode ino usa a trava ino % stripes. A memória fica fixa
+    independentemente do número de inodes; inodes que caem na mesma faixa
+    apenas compartilham a trava.
+
+    Para evitar deadlocks, quem precisa de várias travas deve pedi-las de
+    uma vez com hold(), que as adquire em ordem crescente de faixa.
+    """
+    def __init__(self, stripes=256):
+        self._locks = [RWLock() for _ in range(stripes)]
+        self._stripes = stripes
+
+    @contextmanager
+    def hold(self, write=(), read=()):
+        """Adquire as travas dos inodes (escrita vence leitura na mesma faixa)."""
+        n = self._stripes
+        modes = {ino % n: False for ino in read}
+        for ino in write:
+            modes[ino % n] = True
+        acquired = []
+        try:
+            for idx in sorted(modes):
+                lock = self._locks[idx]
+                if modes[idx]:
+                    lock.acquire_write()
+                else:
+                    lock.acquire_read()
+                acquired.append(idx)
+            yield
+        finally:
+            for idx in reversed(acquired):
+                if modes[idx]:
+                    self._locks[idx].release_write()
+                else:
+                    self._locks[idx].release_read()
+
+    def read(self, ino):
+        """Trava de leitura de um inode (para uso com with)."""
+        return self._locks[ino % self._stripes].reader
+
+    def write(self, ino):
+        """Trava de escrita de um inode (para uso com with)."""
+        return self._locks[ino % self._stripes].writer
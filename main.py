@@ -1,8 +1,17 @@
+import argparse
 import sys
+import threading
+import time
 from user import User
 from memory_disk import MemoryDisk
+from image_disk import ImageDisk
+from volume import Volume
+from quota import QuotaManager
+from buffer_cache import BufferCache
 from permission_manager import PermissionManager
 from file_system import FileSystem
+from instrumentation import Instrumentation
+from session import Session
 
 
 def print_help():
@@ -13,183 +22,661 @@ def print_help():
     Comandos Disponíveis:
     ---------------------
     Navegação:
-      ls                  - Listar diretório atual
-      cd <dir>            - Mudar diretório (.. para voltar)
+      ls [dir] [opções]   - Listar diretório atual (ou o indicado). Opções: --sort name|size|time,
+                            -r, --limit N, --offset N, --prefix P, --glob PADRAO
+      cd <dir>            - Mudar diretório (caminhos absolutos/relativos, .. para voltar)
       pwd                 - Mostrar caminho atual
       mkdir <nome>        - Criar diretório
 
     Arquivos:
       touch <nome>        - Criar arquivo vazio
-      rm <nome>           - Remover arquivo/diretório
-      cp <src> <dst>      - Copiar arquivo
-      mv <src> <dst>      - Mover/Renomear arquivo
+      rm [-r] <nome>      - Remover arquivo/diretório (-r: recursivo)
+      cp [-r] <src> <dst> - Copiar arquivo (-r: diretório recursivo)
+      find [dir] <padrão> - Procurar nomes por padrão glob (ex: find *.txt)
+      du [caminho]        - Uso de espaço (bytes e arquivos) da subárvore
+      mv <src> <dst>      - Mover/Renomear arquivo ou diretório (entre diretórios)
       cat <nome>          - Ler conteúdo do arquivo
       write <nome> <txt>  - Escrever texto no arquivo (ex: write nota.txt ola)
+      write -o <off> <nome> <txt>
+                          - Escrever a partir do offset, sem reescrever o arquivo
+      append <nome> <txt> - Acrescentar texto ao fim do arquivo
+      truncate <nome> <n> - Ajustar o tamanho do arquivo para n bytes
       chmod <oct> <nome>  - Mudar permissões (ex: chmod 755 script.py)
+      chown <dono>[:<grupo>] <nome>
+                          - Mudar dono/grupo (nomes de usuário ou números)
 
     Sistema:
       su <user>           - Trocar usuário (simulação: cria se não existir)
-      disk                - Mostrar mapa de blocos do disco
+      id [user]           - Mostrar uid, gid e grupos
+      addgroup <user> <g> - Adicionar grupo suplementar ao usuário (root)
+      quota [user]        - Uso e limites de cota do usuário e do seu grupo primário
+      setquota <user|:grupo> <blocos_suave> <blocos_rígido> <inodes_suave> <inodes_rígido>
+                          - Definir limites de cota (root; 0 = sem limite)
+      repquota            - Relatório de cotas de todos os usuários e grupos (root)
+      disk                - Mostrar mapa de blocos do disco (razão de deduplicação e
+                            utilização de cada dispositivo do volume)
+      frag                - Relatório de fragmentação (extents por arquivo)
+      defrag [n]          - Desfragmentar incrementalmente (n arquivos por passo)
+      sync                - Gravar no disco os blocos sujos do cache (e checkpoint do journal)
+      cache               - Estatísticas do buffer cache
+      stats [on|off|reset]
+                          - Contadores e latências por operação (liga/desliga/zera)
       help                - Mostrar esta ajuda
       exit                - Sair
     """)
 
 
+def parse_args(argv=None):
+    """Lê as opções de linha de comando do simulador."""
+    parser = argparse.ArgumentParser(description="Simulador de SO: M3-SO")
+    parser.add_argument("--image", metavar="ARQUIVO",
+                        help="Imagem de disco persistente (mmap). Criada se não existir.")
+    parser.add_argument("--blocks", type=int, default=100,
+                        help="Total de blocos ao criar um disco, por dispositivo com --devices (padrão: 100)")
+    parser.add_argument("--block-size", type=int, default=10,
+                        help="Tamanho de cada bloco em bytes ao criar um disco (padrão: 10)")
+    parser.add_argument("--inodes", type=int, default=1024,
+                        help="Tamanho da tabela de inodes ao criar uma imagem (padrão: 1024)")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="Desativa o journal de metadados da imagem")
+    parser.add_argument("--journal-interval", type=float, default=100, metavar="MS",
+                        help="Intervalo do group commit do journal; 0 confirma cada operação (padrão: 100)")
+    parser.add_argument("--devices", type=int, default=1,
+                        help="Dispositivos em memória agrupados em um volume (padrão: 1, disco único)")
+    parser.add_argument("--raid", choices=(Volume.STRIPE, Volume.CONCAT), default=Volume.STRIPE,
+                        help="Organização do volume: stripe (RAID-0) ou concat (padrão: stripe)")
+    parser.add_argument("--stripe-size", type=int, default=Volume.STRIPE_BLOCKS, metavar="BLOCOS",
+                        help=f"Blocos por faixa no modo stripe (padrão: {Volume.STRIPE_BLOCKS})")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Deduplicação de blocos por conteúdo (blocos idênticos gravados uma vez)")
+    parser.add_argument("--quota-grace", type=float, default=QuotaManager.GRACE, metavar="SEGUNDOS",
+                        help="Prazo de tolerância dos limites suaves de cota (padrão: 7 dias)")
+    parser.add_argument("--cache", type=int, default=32, metavar="BLOCOS",
+                        help="Capacidade do buffer cache em blocos; 0 desativa (padrão: 32)")
+    parser.add_argument("--script", metavar="ARQUIVO",
+                        help="Executa os comandos do arquivo (um por linha) sem prompt e sai")
+    parser.add_argument("--batch", action="store_true",
+                        help="Lê comandos da entrada padrão sem prompt (automático se ela não for um terminal)")
+    parser.add_argument("--stats", action="store_true",
+                        help="Liga a instrumentação (contadores/latências) desde o boot")
+    parser.add_argument("--serve", action="store_true",
+                        help="Modo servidor: aceita várias sessões simultâneas (TCP ou socket Unix)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Endereço do servidor TCP (padrão: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=7070,
+                        help="Porta do servidor TCP; 0 escolhe uma livre (padrão: 7070)")
+    parser.add_argument("--unix", metavar="CAMINHO",
+                        help="Escuta em um socket Unix em vez de TCP")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Threads que executam os comandos das sessões (padrão: 8)")
+    args = parser.parse_args(argv)
+    if args.image and args.devices > 1:
+        parser.error("--devices não pode ser usado com --image (o volume mantém os metadados em memória)")
+    return args
+
+
+class Shell:
+    """
+    Estado da sessão do shell e tabela de despacho dos comandos.
+    Cada comando é um método cmd_<nome>(args); o que ele imprime é a saída.
+    Vários shells podem compartilhar o mesmo FileSystem e o mesmo banco de
+    usuários (users_db), cada um com seu usuário e diretório atual.
+    """
+    # Serializa a criação de usuários (su) entre shells que compartilham o banco
+    _users_lock = threading.Lock()
+
+    def __init__(self, fs, disk, cache, instr=None, users_db=None):
+        self.fs = fs
+        self.disk = disk
+        self.cache = cache
+        self.instr = instr
+        # Simula um banco de dados de usuários em memória (ex: /etc/passwd simplificado)
+        if users_db is None:
+            users_db = {"root": User("root", uid=0, gid=0)}
+        self.users_db = users_db
+        # A sessão começa com o usuário 'root' (Superusuário).
+        self.current_user = users_db["root"]
+        # Sessão: credenciais efetivas (recalculadas em su/addgroup) e diretório atual
+        self.session = Session(fs, self.current_user)
+        self.running = True
+        # Tabela de despacho: nome do comando -> método
+        self.commands = {
+            name[len("cmd_"):]: getattr(self, name)
+            for name in dir(self) if name.startswith("cmd_")
+        }
+
+    def prompt(self):
+        # Obtém o caminho atual para exibir no prompt (ex: root@/docs $ )
+        return f"{self.current_user.name}@{self.session.get_pwd()} $ "
+
+    def execute(self, command_input):
+        """Executa uma linha de comando. Retorna False para linhas vazias/comentários."""
+        # Parser: Divide o comando e os argumentos
+        parts = command_input.split()
+        if not parts or parts[0].startswith("#"):
+            return False
+        cmd, args = parts[0], parts[1:]
+        handler = self.commands.get(cmd)
+        if handler is None:
+            print(f"Comando '{cmd}' não reconhecido.")
+            return True
+        try:
+            handler(args)
+        except Exception as e:
+            # Captura genérica de erros para não derrubar o shell
+            print(f"Erro inesperado: {e}")
+        return True
+
+    # ------------------------------------------------------------------
+    # Comandos
+    # ------------------------------------------------------------------
+
+    def cmd_exit(self, args):
+        print("Encerrando simulação...")
+        self.running = False
+
+    def cmd_help(self, args):
+        print_help()
+
+    # Opções do ls com valor: opção -> (parâmetro de stream_ls, conversão)
+    _LS_OPTIONS = {
+        "--sort": ("sort", str),
+        "--limit": ("limit", int),
+        "--offset": ("offset", int),
+        "--prefix": ("prefix", str),
+        "--glob": ("pattern", str),
+    }
+
+    def cmd_ls(self, args):
+        # Lista conteúdo do diretório atual (ou do caminho indicado), linha a linha
+        path = None
+        options = {}
+        try:
+            tokens = iter(args)
+            for arg in tokens:
+                if arg == "-r":
+                    options["reverse"] = True
+                elif arg in self._LS_OPTIONS:
+                    name, convert = self._LS_OPTIONS[arg]
+                    options[name] = convert(next(tokens))
+                elif path is None:
+                    path = arg
+                else:
+                    raise ValueError(arg)
+        except (StopIteration, ValueError):
+            print("Uso: ls [dir] [--sort name|size|time] [-r] [--limit N] [--offset N] "
+                  "[--prefix P] [--glob PADRAO]")
+            return
+        for line in self.fs.stream_ls(path, self.session, **options):
+            print(line)
+
+    def cmd_pwd(self, args):
+        # Print Working Directory
+        print(self.session.get_pwd())
+
+    def cmd_mkdir(self, args):
+        # Cria diretório se houver argumento
+        if args:
+            print(self.fs.mkdir(args[0], self.session))
+        else:
+            print("Uso: mkdir <nome>")
+
+    def cmd_cd(self, args):
+        # Navegação de diretórios
+        if args:
+            msg = self.session.cd(args[0])
+            if msg: print(msg)
+        else:
+            print("Uso: cd <path>")
+
+    def cmd_touch(self, args):
+        # Cria arquivo vazio (atualiza timestamp se existir)
+        if args:
+            print(self.fs.touch(args[0], self.session))
+        else:
+            print("Uso: touch <nome>")
+
+    def cmd_rm(self, args):
+        # Remove arquivo ou diretório (-r remove a subárvore inteira)
+        recursive = bool(args) and args[0] == "-r"
+        if recursive:
+            args = args[1:]
+        if args:
+            print(self.fs.rm(args[0], self.session, recursive=recursive))
+        else:
+            print("Uso: rm [-r] <nome>")
+
+    def cmd_cp(self, args):
+        # Cópia de arquivos (Source -> Destination); -r copia diretórios
+        recursive = bool(args) and args[0] == "-r"
+        if recursive:
+            args = args[1:]
+        if len(args) >= 2:
+            print(self.fs.cp(args[0], args[1], self.session, recursive=recursive))
+        else:
+            print("Uso: cp [-r] <origem> <destino>")
+
+    def cmd_find(self, args):
+        if len(args) >= 2:
+            print(self.fs.find(args[1], args[0], self.session))
+        elif args:
+            print(self.fs.find(args[0], user=self.session))
+        else:
+            print("Uso: find [dir] <padrão>")
+
+    def cmd_du(self, args):
+        print(self.fs.du(args[0] if args else None, self.session))
+
+    def cmd_mv(self, args):
+        # Mover ou Renomear arquivos
+        if len(args) >= 2:
+            print(self.fs.mv(args[0], args[1], self.session))
+        else:
+            print("Uso: mv <origem> <destino>")
+
+    def cmd_cat(self, args):
+        # Leitura de arquivo em streaming (exibe os pedaços à medida que são lidos)
+        if args:
+            for piece in self.fs.stream_file(args[0], self.session):
+                sys.stdout.write(piece)
+            sys.stdout.write("\n")
+        else:
+            print("Uso: cat <nome>")
+
+    def cmd_write(self, args):
+        # Escrita em arquivo (Simula editor de texto simples via CLI)
+        # Junta todos os argumentos após o nome do arquivo como conteúdo
+        if len(args) >= 4 and args[0] == "-o":
+            # Escrita parcial a partir de um offset
+            try:
+                offset = int(args[1])
+                print(self.fs.pwrite_file(args[2], offset, " ".join(args[3:]), self.session))
+            except ValueError:
+                print("Erro: Offset deve ser um número inteiro.")
+        elif len(args) >= 2:
+            filename = args[0]
+            content = " ".join(args[1:])
+            print(self.fs.write_file(filename, content, self.session))
+        else:
+            print("Uso: write [-o <offset>] <nome> <texto>")
+
+    def cmd_append(self, args):
+        # Acrescenta ao fim do arquivo (aloca apenas os blocos da cauda)
+        if len(args) >= 2:
+            print(self.fs.append_file(args[0], " ".join(args[1:]), self.session))
+        else:
+            print("Uso: append <nome> <texto>")
+
+    def cmd_truncate(self, args):
+        if len(args) >= 2:
+            try:
+                print(self.fs.truncate_file(args[0], int(args[1]), self.session))
+            except ValueError:
+                print("Erro: Tamanho deve ser um número inteiro.")
+        else:
+            print("Uso: truncate <nome> <tamanho>")
+
+    def cmd_chmod(self, args):
+        # Altera permissões (exige formato octal)
+        if len(args) >= 2:
+            try:
+                mode = int(args[0], 8)  # Converte string base 8 para int
+                print(self.fs.chmod_file(args[1], mode, self.session))
+            except ValueError:
+                print("Erro: Modo deve ser um número octal (ex: 755).")
+        else:
+            print("Uso: chmod <modo_octal> <nome>")
+
+    def cmd_disk(self, args):
+        # Ferramenta de diagnóstico: Mostra estado físico do disco
+        disk = self.disk
+        print(f"Blocos Livres: {disk.free_count}/{disk.total_blocks}")
+        # Visualização simplificada dos primeiros 50 blocos (lida do bitmap)
+        print(f"Mapa Visual: {['#' if b else '.' for b in disk.free_map[:50]]} ...")
+        if disk.dedup:
+            st = disk.dedup_stats()
+            print(f"Deduplicação: {st['referenced']} bloco(s) referenciado(s) em {st['used']} "
+                  f"físico(s) (razão {st['ratio']:.2f}x), {st['hits']} bloco(s) poupado(s), "
+                  f"{st['indexed']} no índice")
+        devices = getattr(disk, "device_stats", lambda: None)()
+        if devices:
+            layout = (f"RAID-0, faixas de {disk.stripe_blocks} bloco(s)"
+                      if disk.mode == Volume.STRIPE else "concatenação")
+            print(f"Volume: {len(devices)} dispositivo(s), {layout}")
+            for i, st in enumerate(devices):
+                print(f"  dev{i}: {st['used']}/{st['blocks']} blocos em uso, "
+                      f"{st['reads']} leitura(s) ({st['bytes_read']} B), "
+                      f"{st['writes']} escrita(s) ({st['bytes_written']} B), "
+                      f"ocupado {st['busy_ms']:.1f} ms ({st['utilization']:.2%})")
+
+    def cmd_frag(self, args):
+        print(self.fs.fragmentation())
+
+    def cmd_defrag(self, args):
+        # Desfragmentação incremental: processa poucos arquivos por chamada
+        try:
+            steps = int(args[0]) if args else 8
+            print(self.fs.defrag(steps))
+        except ValueError:
+            print("Uso: defrag [n_arquivos]")
+
+    def cmd_sync(self, args):
+        # Write-back explícito dos blocos sujos
+        if self.cache:
+            dirty = self.cache.stats()["dirty"]
+            self.cache.sync()
+            print(f"{dirty} bloco(s) gravado(s) no disco.")
+        else:
+            self.disk.flush()
+            print("Cache desativado: nada a sincronizar.")
+        journal = getattr(self.disk, "journal_stats", lambda: None)()
+        if journal:
+            print(f"Journal: {journal['commits']} commit(s) com {journal['operations']} "
+                  f"operação(ões), {journal['checkpoints']} checkpoint(s).")
+
+    def cmd_cache(self, args):
+        if self.cache:
+            st = self.cache.stats()
+            print(f"Cache: {st['cached']}/{st['capacity']} blocos ({st['dirty']} sujos)")
+            print(f"Hits: {st['hits']}, Misses: {st['misses']}, Taxa de acerto: {st['hit_ratio']:.1%}")
+            print(f"Despejos: {st['evictions']}, Write-backs: {st['writebacks']}")
+        else:
+            print("Cache desativado.")
+
+    def cmd_stats(self, args):
+        # Instrumentação: 'stats' mostra, 'stats on/off' liga/desliga, 'stats reset' zera
+        if self.instr is None:
+            print("Instrumentação indisponível.")
+            return
+        action = args[0] if args else ""
+        if action == "on":
+            self.instr.enable()
+            print("Instrumentação ligada.")
+        elif action == "off":
+            self.instr.disable()
+            print("Instrumentação desligada.")
+        elif action == "reset":
+            self.instr.reset()
+            print("Estatísticas zeradas.")
+        elif action:
+            print("Uso: stats [on|off|reset]")
+        else:
+            print(self.instr.report())
+
+    def cmd_su(self, args):
+        # Switch User (Simulado)
+        # Se o usuário não existe, o simulador cria automaticamente para facilitar testes
+        if args:
+            target_name = args[0]
+            with self._users_lock:
+                created = target_name not in self.users_db
+                if created:
+                    new_uid = len(self.users_db) + 1000
+                    self.users_db[target_name] = User(target_name, uid=new_uid, gid=new_uid)
+            self.current_user = self.users_db[target_name]
+            if created:
+                print(f"Usuário criado e alterado para '{target_name}'")
+            self.session.set_user(self.current_user)
+        else:
+            print("Uso: su <usuario>")
+
+    def _resolve_id(self, value, attr):
+        """Converte nome de usuário (uid/gid primário) ou número em id."""
+        if value in self.users_db:
+            return getattr(self.users_db[value], attr)
+        return int(value)
+
+    def cmd_id(self, args):
+        # Mostra as credenciais do usuário atual (ou do indicado)
+        user = self.users_db.get(args[0]) if args else self.current_user
+        if user is None:
+            print(f"Erro: Usuário '{args[0]}' não existe.")
+            return
+        cred = self.fs.pm.credentials(user)
+        print(f"uid={cred.uid}({user.name}) gid={cred.gid} grupos={sorted(cred.groups)}")
+
+    def cmd_addgroup(self, args):
+        # Adiciona um grupo suplementar a um usuário (apenas root)
+        if len(args) < 2:
+            print("Uso: addgroup <usuario> <grupo>")
+            return
+        if not self.session.cred.is_root:
+            print("Erro: Apenas root pode alterar grupos.")
+            return
+        user = self.users_db.get(args[0])
+        if user is None:
+            print(f"Erro: Usuário '{args[0]}' não existe.")
+            return
+        try:
+            user.add_group(self._resolve_id(args[1], "gid"))
+        except ValueError:
+            print("Erro: Grupo deve ser um número ou nome de usuário.")
+            return
+        if user is self.current_user:
+            self.session.set_user(user)
+        print(f"Grupos de '{user.name}': {sorted(user.groups | {user.gid})}")
+
+    def cmd_chown(self, args):
+        # Altera dono e/ou grupo: chown <dono>[:<grupo>] <nome> ou chown :<grupo> <nome>
+        if len(args) < 2:
+            print("Uso: chown <dono>[:<grupo>] <nome>")
+            return
+        owner, _, group = args[0].partition(":")
+        try:
+            uid = self._resolve_id(owner, "uid") if owner else None
+            gid = self._resolve_id(group, "gid") if group else None
+        except ValueError:
+            print("Erro: Dono/grupo deve ser um número ou nome de usuário.")
+            return
+        print(self.fs.chown_file(args[1], uid, gid, self.session))
+
+    def _quota_line(self, label, st):
+        """Uma linha de cota: uso, limites e prazo restante de blocos e inodes."""
+        parts = []
+        for resource, name in (("block", "blocos"), ("inode", "inodes")):
+            used = st["blocks" if resource == "block" else "inodes"]
+            text = (f"{name} {used} (suave {_format_limit(st[resource + '_soft'])}, "
+                    f"rígido {_format_limit(st[resource + '_hard'])}")
+            grace = st[resource + "_grace"]
+            if grace is not None:
+                text += f", prazo {_format_grace(grace)}"
+            parts.append(text + ")")
+        return f"  {label}: " + ", ".join(parts)
+
+    def cmd_quota(self, args):
+        # Uso e limites do usuário atual (ou do indicado) e do grupo primário dele
+        user = self.users_db.get(args[0]) if args else self.current_user
+        if user is None:
+            print(f"Erro: Usuário '{args[0]}' não existe.")
+            return
+        if user is not self.current_user and not self.session.cred.is_root:
+            print("Erro: Apenas root pode consultar a cota de outros usuários.")
+            return
+        quotas = self.fs.quotas
+        print(f"Cotas de '{user.name}':")
+        print(self._quota_line(f"usuário {user.uid}", quotas.usage(QuotaManager.USER, user.uid)))
+        print(self._quota_line(f"grupo {user.gid}", quotas.usage(QuotaManager.GROUP, user.gid)))
+
+    def cmd_setquota(self, args):
+        # Define limites: setquota <usuario> ... ou setquota :<grupo> ...
+        if len(args) != 5:
+            print("Uso: setquota <usuario|:grupo> <blocos_suave> <blocos_rígido> "
+                  "<inodes_suave> <inodes_rígido>")
+            return
+        if not self.session.cred.is_root:
+            print("Erro: Apenas root pode definir cotas.")
+            return
+        target = args[0]
+        try:
+            if target.startswith(":"):
+                kind, ident = QuotaManager.GROUP, self._resolve_id(target[1:], "gid")
+            else:
+                kind, ident = QuotaManager.USER, self._resolve_id(target, "uid")
+            limits = [int(value) for value in args[1:]]
+        except ValueError:
+            print("Erro: Alvo deve ser um usuário/grupo e os limites números inteiros.")
+            return
+        try:
+            self.fs.quotas.set_limits(kind, ident, *limits)
+        except ValueError as e:
+            print(e)
+            return
+        print(f"Cota {'do grupo' if kind == QuotaManager.GROUP else 'do usuário'} "
+              f"{ident} atualizada.")
+
+    def cmd_repquota(self, args):
+        # Relatório de todas as cotas: O(usuários e grupos), sem percorrer a árvore
+        if not self.session.cred.is_root:
+            print("Erro: Apenas root pode gerar o relatório de cotas.")
+            return
+        quotas = self.fs.quotas
+        names = {QuotaManager.USER: {u.uid: u.name for u in self.users_db.values()},
+                 QuotaManager.GROUP: {u.gid: u.name for u in self.users_db.values()}}
+        print(f"Prazo de tolerância dos limites suaves: {int(quotas.grace)}s")
+        for title, kind in (("Usuário", QuotaManager.USER), ("Grupo", QuotaManager.GROUP)):
+            print(f"{title:<14}{'':3}{'blocos':>8}{'suave':>8}{'rígido':>8}{'prazo':>10}"
+                  f"{'inodes':>8}{'suave':>8}{'rígido':>8}{'prazo':>10}")
+            for ident, st in quotas.report(kind):
+                row = ""
+                flags = ""
+                for resource, used in (("block", st["blocks"]), ("inode", st["inodes"])):
+                    soft, hard = st[resource + "_soft"], st[resource + "_hard"]
+                    grace = st[resource + "_grace"]
+                    flags += "+" if (soft and used > soft) or (hard and used > hard) else "-"
+                    row += (f"{used:>8}{_format_limit(soft):>8}{_format_limit(hard):>8}"
+                            f"{'' if grace is None else _format_grace(grace):>10}")
+                print(f"{names[kind].get(ident, str(ident)):<14} {flags}{row}")
+
+    # ------------------------------------------------------------------
+    # Modos de execução
+    # ------------------------------------------------------------------
+
+    def interactive(self):
+        """Loop principal (REPL) com prompt."""
+        print("=== Simulador de SO: M3-SO ===")
+        print("Digite 'help' para ver os comandos.\n")
+        while self.running:
+            try:
+                command_input = input(self.prompt())
+            except (EOFError, KeyboardInterrupt):
+                # Ctrl-D / Ctrl-C encerram a sessão
+                print()
+                break
+            self.execute(command_input)
+
+    def batch(self, lines):
+        """
+        Executa os comandos de lines sem renderizar prompt (script ou entrada
+        padrão redirecionada). Retorna (comandos executados, segundos).
+        """
+        executed = 0
+        start = time.perf_counter()
+        for line in lines:
+            if self.execute(line):
+                executed += 1
+                if not self.running:
+                    break
+        return executed, time.perf_counter() - start
+
+
+def _format_limit(value):
+    return str(value) if value else "-"
+
+
+def _format_grace(seconds):
+    """Prazo em unidades legíveis (ex: 6d23h, 4h10m, 35s); 'esgotado' se zero."""
+    seconds = int(seconds)
+    if seconds <= 0:
+        return "esgotado"
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    if days:
+        return f"{days}d{hours}h"
+    if hours:
+        return f"{hours}h{minutes}m"
+    if minutes:
+        return f"{minutes}m{secs}s"
+    return f"{secs}s"
+
+
+def report_throughput(executed, elapsed):
+    """Resumo do modo batch (na saída de erro, para não misturar com a saída dos comandos)."""
+    rate = executed / elapsed if elapsed > 0 else 0.0
+    print(f"{executed} comando(s) em {elapsed:.3f}s ({rate:.0f} comandos/s)", file=sys.stderr)
+
+
 def main():
+    args_cli = parse_args()
+
     # --- 1. Inicialização do Sistema (Boot) ---
     # Instancia o Hardware simulado (Disco de Memória)
-    # Define um disco pequeno de 100 blocos, onde cada bloco armazena 10 caracteres.
-    disk = MemoryDisk(total_blocks=100, block_size=10)
+    # Por padrão, um disco pequeno de 100 blocos, onde cada bloco armazena 10 caracteres.
+    # A alocação por extents procura sequências contíguas (best-fit) para cada arquivo.
+    if args_cli.image:
+        # Disco persistente: monta a imagem existente (preguiçosamente) ou formata uma nova.
+        # Metadados protegidos por journal com group commit (a cada --journal-interval ms).
+        disk = ImageDisk.open_or_create(args_cli.image, total_blocks=args_cli.blocks,
+                                        block_size=args_cli.block_size,
+                                        max_inodes=args_cli.inodes,
+                                        allocation=MemoryDisk.EXTENT,
+                                        journal=not args_cli.no_journal,
+                                        sync_interval=args_cli.journal_interval / 1000,
+                                        dedup=args_cli.dedup)
+        if disk.recovered:
+            print(f"Journal: {disk.recovered} transação(ões) recuperada(s).", file=sys.stderr)
+    elif args_cli.devices > 1:
+        # Volume: vários dispositivos de --blocks blocos em um único espaço de endereços
+        devices = [MemoryDisk(total_blocks=args_cli.blocks, block_size=args_cli.block_size)
+                   for _ in range(args_cli.devices)]
+        disk = Volume(devices, mode=args_cli.raid, stripe_blocks=args_cli.stripe_size,
+                      allocation=MemoryDisk.EXTENT, dedup=args_cli.dedup)
+    else:
+        disk = MemoryDisk(total_blocks=args_cli.blocks, block_size=args_cli.block_size,
+                          allocation=MemoryDisk.EXTENT, dedup=args_cli.dedup)
+
+    # Buffer cache (LRU, write-back) entre os arquivos e o disco
+    cache = BufferCache(disk, capacity=args_cli.cache) if args_cli.cache > 0 else None
 
     # Instancia o gerenciador de segurança (Permissões)
     perm_mgr = PermissionManager()
 
     # Instancia o Sistema de Arquivos (Kernel/FS Layer), injetando as dependências de disco e permissões.
-    fs = FileSystem(disk, perm_mgr)
-
-    # --- 2. Configuração de Usuário Inicial ---
-    # Cria o usuário 'root' (Superusuário) para iniciar a sessão.
-    current_user = User("root", uid=0, gid=0)
-
-    # Simula um banco de dados de usuários em memória (ex: /etc/passwd simplificado)
-    users_db = {"root": current_user}
-
-    print("=== Simulador de SO: M3-SO ===")
-    print("Digite 'help' para ver os comandos.\n")
-
-    # --- 3. Loop Principal (Shell / REPL) ---
-    while True:
+    fs = FileSystem(cache or disk, perm_mgr)
+    fs.quotas.grace = args_cli.quota_grace
+
+    # Instrumentação (desligada por padrão: sem custo até 'stats on' ou --stats)
+    instr = Instrumentation()
+    instr.attach_system(fs, disk, perm_mgr, cache=cache)
+    if args_cli.stats:
+        instr.enable()
+
+    # --- 2. Modo servidor: várias sessões compartilhando o mesmo kernel ---
+    if args_cli.serve:
+        from server import ShellServer
         try:
-            # Obtém o caminho atual para exibir no prompt (ex: root@/docs $ )
-            path = fs.get_pwd()
-            command_input = input(f"{current_user.name}@{path} $ ").strip()
-
-            # Ignora entradas vazias (apenas Enter)
-            if not command_input:
-                continue
-
-            # Parser: Divide o comando e os argumentos
-            parts = command_input.split()
-            cmd = parts[0]
-            args = parts[1:]
-
-            # --- 4. Processamento de Comandos ---
-
-            if cmd == "exit":
-                print("Encerrando simulação...")
-                break
-
-            elif cmd == "help":
-                print_help()
-
-            elif cmd == "ls":
-                # Lista conteúdo do diretório atual
-                print(fs.ls())
-
-            elif cmd == "pwd":
-                # Print Working Directory
-                print(fs.get_pwd())
-
-            elif cmd == "mkdir":
-                # Cria diretório se houver argumento
-                if args:
-                    print(fs.mkdir(args[0], current_user))
-                else:
-                    print("Uso: mkdir <nome>")
-
-            elif cmd == "cd":
-                # Navegação de diretórios
-                if args:
-                    msg = fs.cd(args[0])
-                    if msg: print(msg)
-                else:
-                    print("Uso: cd <path>")
-
-            elif cmd == "touch":
-                # Cria arquivo vazio (atualiza timestamp se existir)
-                if args:
-                    print(fs.touch(args[0], current_user))
-                else:
-                    print("Uso: touch <nome>")
-
-            elif cmd == "rm":
-                # Remove arquivo ou diretório
-                if args:
-                    print(fs.rm(args[0], current_user))
-                else:
-                    print("Uso: rm <nome>")
-
-            elif cmd == "cp":
-                # Cópia de arquivos (Source -> Destination)
-                if len(args) >= 2:
-                    print(fs.cp(args[0], args[1], current_user))
-                else:
-                    print("Uso: cp <origem> <destino>")
-
-            elif cmd == "mv":
-                # Mover ou Renomear arquivos
-                if len(args) >= 2:
-                    print(fs.mv(args[0], args[1], current_user))
-                else:
-                    print("Uso: mv <origem> <destino>")
-
-            elif cmd == "cat":
-                # Leitura de arquivo (concatena blocos e exibe)
-                if args:
-                    print(fs.read_file(args[0], current_user))
-                else:
-                    print("Uso: cat <nome>")
-
-            elif cmd == "write":
-                # Escrita em arquivo (Simula editor de texto simples via CLI)
-                # Junta todos os argumentos após o nome do arquivo como conteúdo
-                if len(args) >= 2:
-                    filename = args[0]
-                    content = " ".join(args[1:])
-                    print(fs.write_file(filename, content, current_user))
-                else:
-                    print("Uso: write <nome> <texto>")
-
-            elif cmd == "chmod":
-                # Altera permissões (exige formato octal)
-                if len(args) >= 2:
-                    try:
-                        mode = int(args[0], 8)  # Converte string base 8 para int
-                        print(fs.chmod_file(args[1], mode, current_user))
-                    except ValueError:
-                        print("Erro: Modo deve ser um número octal (ex: 755).")
-                else:
-                    print("Uso: chmod <modo_octal> <nome>")
-
-            elif cmd == "disk":
-                # Ferramenta de diagnóstico: Mostra estado físico do disco
-                print(f"Blocos Livres: {disk.blocks.count(None)}/{disk.total_blocks}")
-                # Visualização simplificada dos primeiros 50 blocos
-                print(f"Mapa Visual: {['#' if b else '.' for b in disk.blocks[:50]]} ...")
-
-            elif cmd == "su":
-                # Switch User (Simulado)
-                # Se o usuário não existe, o simulador cria automaticamente para facilitar testes
-                if args:
-                    target_name = args[0]
-                    if target_name in users_db:
-                        current_user = users_db[target_name]
-                    else:
-                        new_uid = len(users_db) + 1000
-                        new_user = User(target_name, uid=new_uid, gid=new_uid)
-                        users_db[target_name] = new_user
-                        current_user = new_user
-                        print(f"Usuário criado e alterado para '{target_name}'")
-                else:
-                    print("Uso: su <usuario>")
-
-            else:
-                print(f"Comando '{cmd}' não reconhecido.")
-
-        except Exception as e:
-            # Captura genérica de erros para não derrubar o shell
-            print(f"Erro inesperado: {e}")
+            ShellServer(fs, disk, cache, instr, workers=args_cli.workers).run(
+                host=args_cli.host, port=args_cli.port, unix=args_cli.unix)
+        finally:
+            (cache or disk).close()
+        return
+
+    # --- 3. Sessão do shell (usuário inicial 'root') ---
+    shell = Shell(fs, disk, cache, instr)
+
+    # --- 4. Execução: script, entrada padrão em lote ou REPL interativo ---
+    try:
+        if args_cli.script:
+            with open(args_cli.script, encoding="utf-8") as script:
+                report_throughput(*shell.batch(script))
+        elif args_cli.batch or not sys.stdin.isatty():
+            report_throughput(*shell.batch(sys.stdin))
+        else:
+            shell.interactive()
+    finally:
+        # Descarrega o cache e o disco (grava a imagem, se persistente)
+        (cache or disk).close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,46 +1,718 @@
+import contextlib
+import hashlib
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+
+
+class _FreeExtents:
+    """
+    Índice das sequências livres do disco, usado no modo EXTENT: os inícios
+    ficam em uma lista ordenada (vizinhos e ordem de endereço) e também em
+    baldes por comprimento, com a lista ordenada dos comprimentos existentes.
+    Best-fit e first-fit consultam os baldes em vez de percorrer o bitmap;
+    reservar e liberar custam buscas binárias, unindo vizinhos livres.
+    """
+
+    def __init__(self, runs=()):
+        self._starts = []
+        self._length = {}
+        self._lengths = []
+        self._by_length = {}
+        for start, length in runs:
+            self._insert(start, length)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self):
+        length = self._length
+        return ((start, length[start]) for start in self._starts)
+
+    def _insert(self, start, length):
+        insort(self._starts, start)
+        self._length[start] = length
+        bucket = self._by_length.get(length)
+        if bucket is None:
+            bucket = self._by_length[length] = []
+            insort(self._lengths, length)
+        insort(bucket, start)
+
+    def _delete(self, start):
+        length = self._length.pop(start)
+        del self._starts[bisect_left(self._starts, start)]
+        bucket = self._by_length[length]
+        del bucket[bisect_left(bucket, start)]
+        if not bucket:
+            del self._by_length[length]
+            del self._lengths[bisect_left(self._lengths, length)]
+        return length
+
+    def add(self, start, length):
+        """Inclui [start, start + length) (que estava ocupado), unindo aos vizinhos livres."""
+        starts = self._starts
+        i = bisect_left(starts, start)
+        if i < len(starts) and starts[i] == start + length:
+            length += self._delete(starts[i])
+        if i > 0:
+            prev = starts[i - 1]
+            if prev + self._length[prev] == start:
+                length += self._delete(prev)
+                start = prev
+        self._insert(start, length)
+
+    def remove(self, start, length):
+        """Retira [start, start + length), contido em uma única sequência livre."""
+        run = self._starts[bisect_right(self._starts, start) - 1]
+        run_end = run + self._delete(run)
+        if run < start:
+            self._insert(run, start - run)
+        if start + length < run_end:
+            self._insert(start + length, run_end - start - length)
+
+    def best_fit(self, n_blocks):
+        """Início da menor sequência com pelo menos n_blocks (a de menor endereço no empate), ou -1."""
+        i = bisect_left(self._lengths, n_blocks)
+        if i == len(self._lengths):
+            return -1
+        return self._by_length[self._lengths[i]][0]
+
+    def first_fit(self, n_blocks):
+        """Início da sequência de menor endereço com pelo menos n_blocks, ou -1."""
+        i = bisect_left(self._lengths, n_blocks)
+        by_length = self._by_length
+        return min((by_length[length][0] for length in self._lengths[i:]), default=-1)
+
+    def largest(self):
+        return self._lengths[-1] if self._lengths else 0
+
+    def longest_first(self):
+        """Gera as sequências da mais longa para a mais curta (por endereço no empate)."""
+        for length in reversed(self._lengths):
+            for start in self._by_length[length]:
+                yield start, length
+
+
 class MemoryDisk:
     """
     Simula um disco físico dividido em blocos.
     Gerencia a alocação e liberação de espaço (blocos).
+
+    O espaço livre é controlado por um bitmap (0 = livre, 1 = ocupado) e um
+    cursor next-fit: cada busca continua de onde a anterior parou, em vez de
+    reiniciar no bloco 0. O total de blocos livres é mantido em um contador.
+    No modo EXTENT, as sequências livres também ficam em um índice
+    (_FreeExtents), para que cada reserva não percorra o bitmap inteiro.
+
+    As alocações são descritas por extents: tuplas (inicio, comprimento) que
+    representam sequências contíguas de blocos.
+
+    Cada bloco ocupado tem um contador de referências: cópias (cp) apenas
+    compartilham os blocos da origem, e um bloco só volta a ficar livre
+    quando a última referência é liberada (copy-on-write).
+
+    No modo de deduplicação (dedup=True), os blocos gravados por allocate
+    são indexados pelo hash do conteúdo: um bloco com conteúdo idêntico a
+    outro já armazenado apenas ganha uma referência, em vez de ocupar um
+    bloco novo. As leituras não mudam; escritas no lugar retiram o bloco do
+    índice (unindex) antes de alterá-lo.
+
+    Reserva, liberação e compartilhamento de blocos são serializados pela
+    trava do alocador (alloc_lock); leituras e escritas de dados não travam,
+    pois cada arquivo só acessa os próprios blocos.
     """
-    def __init__(self, total_blocks=100, block_size=10):
+    FREE = 0
+    USED = 1
+
+    # Modos de alocação
+    BLOCK = "block"    # bloco a bloco (next-fit), extents apenas agrupam vizinhos
+    EXTENT = "extent"  # procura sequências livres contíguas (best-fit ou first-fit)
+
+    BEST_FIT = "best"
+    FIRST_FIT = "first"
+
+    def __init__(self, total_blocks=100, block_size=10, allocation=BLOCK, fit=BEST_FIT,
+                 dedup=False):
         self.block_size = block_size
-        # O "disco" físico: vetor onde cada posição é um bloco
-        self.blocks = [None] * total_blocks
+        # O "disco" físico: um único buffer contíguo pré-alocado.
+        # O bloco i ocupa os bytes [i * block_size, (i + 1) * block_size).
+        self.data = bytearray(total_blocks * block_size)
+        self._init_allocator(total_blocks, allocation, fit)
+        self._init_dedup(dedup)
+
+    def _init_allocator(self, total_blocks, allocation, fit):
         self.total_blocks = total_blocks
+        if allocation not in (self.BLOCK, self.EXTENT):
+            raise ValueError(f"Modo de alocação inválido: {allocation}")
+        if fit not in (self.BEST_FIT, self.FIRST_FIT):
+            raise ValueError(f"Estratégia de encaixe inválida: {fit}")
+        self.allocation = allocation
+        self.fit = fit
+
+        # Bitmap de espaço livre e contador de blocos livres (O(1))
+        self.free_map = bytearray(total_blocks)
+        self.free_count = total_blocks
+        # Contador de referências por bloco (0 = livre)
+        self.refcount = array("H", bytes(2 * total_blocks))
+        # Cursor next-fit: posição a partir da qual a próxima busca começa
+        self._cursor = 0
+        # Índice de sequências livres do modo EXTENT (criado no primeiro uso)
+        self._free_index = None
+        # Totais de blocos que passaram a ocupados/livres no bitmap (instrumentação)
+        self.blocks_allocated = 0
+        self.blocks_freed = 0
+        # Trava do alocador: bitmap, contadores de referência, cursor e índice
+        self.alloc_lock = threading.RLock()
+
+    def _init_dedup(self, enabled):
+        # Índice de deduplicação (protegido pela trava do alocador):
+        # hash do conteúdo -> bloco, e bloco -> hash (para retirá-lo do índice)
+        self.dedup = enabled
+        self._by_hash = {}
+        self._hash_of = {}
+        # Blocos que deixaram de ser gravados por já existirem no disco
+        self.dedup_hits = 0
+
+    # ------------------------------------------------------------------
+    # Bitmap / sequências livres
+    # ------------------------------------------------------------------
+
+    def _find_free(self):
+        """
+        Encontra o próximo bloco livre a partir do cursor (next-fit).
+        A busca no bitmap é feita por bytearray.find (em C) e volta ao início
+        do disco apenas quando chega ao fim.
+        """
+        idx = self.free_map.find(self.FREE, self._cursor)
+        if idx == -1:
+            idx = self.free_map.find(self.FREE, 0, self._cursor)
+        return idx
+
+    def _mark(self, start, length, value):
+        """Marca um extent inteiro no bitmap e ajusta o contador de livres."""
+        self.free_map[start:start + length] = bytes([value]) * length
+        self.refcount[start:start + length] = array("H", [value]) * length
+        if value == self.USED:
+            self.free_count -= length
+            self.blocks_allocated += length
+        else:
+            self.free_count += length
+            self.blocks_freed += length
+        index = self._free_index
+        if index is not None:
+            if value == self.USED:
+                index.remove(start, length)
+            else:
+                index.add(start, length)
+        self._blocks_changed(start, length)
+
+    def _extent_index(self):
+        """
+        Índice de sequências livres (apenas no modo EXTENT; None no BLOCK).
+        É montado com uma varredura do bitmap no primeiro uso e, depois,
+        mantido a cada reserva e liberação. Chamar com alloc_lock.
+        """
+        if self._free_index is None and self.allocation == self.EXTENT:
+            self._free_index = _FreeExtents(self._scan_free_runs())
+        return self._free_index
+
+    def _index_freed(self, blocks):
+        """Inclui no índice os blocos que ficaram livres (agrupados em sequências)."""
+        index = self._free_index
+        start = end = -1
+        for idx in sorted(blocks):
+            if idx == end:
+                end += 1
+                continue
+            if start >= 0:
+                index.add(start, end - start)
+            start, end = idx, idx + 1
+        if start >= 0:
+            index.add(start, end - start)
+
+    def free_runs(self):
+        """Gera as sequências livres do disco como extents (inicio, comprimento)."""
+        with self.alloc_lock:
+            index = self._extent_index()
+            runs = list(index) if index is not None else None
+        if runs is not None:
+            return iter(runs)
+        return self._scan_free_runs()
+
+    def _scan_free_runs(self):
+        """Percorre o bitmap gerando as sequências livres."""
+        pos = 0
+        while pos < self.total_blocks:
+            start = self.free_map.find(self.FREE, pos)
+            if start == -1:
+                return
+            end = self.free_map.find(self.USED, start)
+            if end == -1:
+                end = self.total_blocks
+            yield (start, end - start)
+            pos = end
+
+    def largest_free_run(self):
+        """Retorna o comprimento da maior sequência livre."""
+        with self.alloc_lock:
+            index = self._extent_index()
+            if index is not None:
+                return index.largest()
+        return max((length for _, length in self._scan_free_runs()), default=0)
+
+    def find_run(self, n_blocks, fit=None):
+        """
+        Procura uma sequência livre com pelo menos n_blocks blocos.
+        Best-fit escolhe a menor sequência suficiente; first-fit a de menor endereço.
+        Retorna o índice inicial ou -1.
+        """
+        fit = fit or self.fit
+        with self.alloc_lock:
+            index = self._extent_index()
+            if index is not None:
+                if fit == self.FIRST_FIT:
+                    return index.first_fit(n_blocks)
+                return index.best_fit(n_blocks)
+        best_start, best_len = -1, None
+        for start, length in self._scan_free_runs():
+            if length < n_blocks:
+                continue
+            if fit == self.FIRST_FIT or length == n_blocks:
+                return start
+            if best_len is None or length < best_len:
+                best_start, best_len = start, length
+        return best_start
+
+    # ------------------------------------------------------------------
+    # Alocação
+    # ------------------------------------------------------------------
+
+    def _reserve_blocks(self, n_blocks):
+        """Reserva n_blocks bloco a bloco (next-fit), agrupando vizinhos em extents."""
+        extents = []
+        for _ in range(n_blocks):
+            free_index = self._find_free()
+            self._mark(free_index, 1, self.USED)
+            self._cursor = free_index + 1 if free_index + 1 < self.total_blocks else 0
+            if extents and extents[-1][0] + extents[-1][1] == free_index:
+                extents[-1] = (extents[-1][0], extents[-1][1] + 1)
+            else:
+                extents.append((free_index, 1))
+        return extents
+
+    def _reserve_extents(self, n_blocks):
+        """
+        Reserva n_blocks preferindo uma única sequência contígua.
+        Se nenhuma sequência comportar tudo, usa as maiores sequências livres
+        até completar (minimizando o número de extents).
+        """
+        start = self.find_run(n_blocks)
+        if start != -1:
+            self._mark(start, n_blocks, self.USED)
+            return [(start, n_blocks)]
+
+        extents = []
+        remaining = n_blocks
+        for run_start, run_len in self._extent_index().longest_first():
+            take = min(run_len, remaining)
+            extents.append((run_start, take))
+            remaining -= take
+            if remaining == 0:
+                break
+        # Marcadas depois de escolhidas: marcar altera o índice percorrido
+        for run_start, take in extents:
+            self._mark(run_start, take, self.USED)
+        return sorted(extents)
+
+    def reserve(self, n_blocks):
+        """
+        Reserva n_blocks blocos livres e retorna a lista de extents.
+        Lança exceção (sem alterar o disco) se não houver espaço suficiente.
+        """
+        with self.alloc_lock:
+            if n_blocks > self.free_count:
+                raise Exception("Erro: Espaço em disco insuficiente.")
+            if n_blocks == 0:
+                return []
+            if self.allocation == self.EXTENT:
+                return self._reserve_extents(n_blocks)
+            return self._reserve_blocks(n_blocks)
 
     def allocate(self, content):
         """
         Tenta alocar conteúdo no disco.
-        Divide o conteúdo em chunks e procura blocos livres sequencialmente ou dispersos.
-        """
-        # Divide o conteúdo em pedaços do tamanho do bloco
-        chunks = [content[i:i + self.block_size] for i in range(0, len(content), self.block_size)]
-
-        allocated_indices = []
-
-        try:
-            for chunk in chunks:
-                # Encontra o próximo índice livre (lança ValueError se cheio)
-                free_index = self.blocks.index(None)
-                self.blocks[free_index] = chunk
-                allocated_indices.append(free_index)
-            return allocated_indices # Retorna lista de blocos usados (FAT simulada)
-        except ValueError:
-            # Rollback: se faltar espaço no meio, libera o que já foi alocado
-            self.free(allocated_indices)
-            raise Exception("Erro: Espaço em disco insuficiente.")
-
-    def read(self, block_indices):
-        """Reconstrói o conteúdo lendo a lista de blocos fornecida."""
-        content = ""
-        for idx in block_indices:
-            if 0 <= idx < self.total_blocks and self.blocks[idx] is not None:
-                content += self.blocks[idx]
-        return content
-
-    def free(self, block_indices):
-        """Libera os blocos marcando-os como None."""
-        for idx in block_indices:
-            if 0 <= idx < self.total_blocks:
-                self.blocks[idx] = None
\ No newline at end of file
+        Reserva os blocos necessários e copia o conteúdo diretamente no buffer.
+        Aceita str (gravada em UTF-8) ou qualquer objeto bytes-like.
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        if self.dedup:
+            return self.allocate_dedup(content, self.write_block)
+        n_blocks = -(-len(content) // self.block_size)  # divisão com teto
+        extents = self.reserve(n_blocks)
+        self.write(extents, content)
+        return extents # Retorna lista de extents usados
+
+    def write(self, extents, content):
+        """
+        Copia o conteúdo (bytes-like) para os extents indicados, sem fatiar em chunks.
+        O restante do último bloco é zerado.
+        """
+        src = memoryview(content)
+        bs = self.block_size
+        offset = 0
+        for start, length in extents:
+            n_bytes = min(length * bs, len(src) - offset)
+            base = start * bs
+            self.data[base:base + n_bytes] = src[offset:offset + n_bytes]
+            offset += n_bytes
+            if n_bytes < length * bs:
+                # Zera a sobra do último bloco
+                tail = length * bs - n_bytes
+                self.data[base + n_bytes:base + n_bytes + tail] = bytes(tail)
+
+    def iter_views(self, extents, size=None):
+        """
+        Gera fatias memoryview (sem cópia) do buffer para cada extent.
+        Se size for informado, a leitura é truncada em size bytes.
+        """
+        view = memoryview(self.data)
+        bs = self.block_size
+        remaining = size if size is not None else len(self.data)
+        for start, length in extents:
+            if remaining <= 0:
+                return
+            n_bytes = min(length * bs, remaining)
+            yield view[start * bs:start * bs + n_bytes]
+            remaining -= n_bytes
+
+    def read(self, extents, size=None):
+        """Reconstrói o conteúdo (bytes) dos extents com uma única junção."""
+        views = list(self.iter_views(extents, size))
+        if len(views) == 1:
+            return bytes(views[0])
+        return b"".join(views)
+
+    def read_block(self, idx):
+        """Lê um bloco inteiro (bytes)."""
+        base = idx * self.block_size
+        return bytes(self.data[base:base + self.block_size])
+
+    def write_block(self, idx, content):
+        """Grava um bloco inteiro; conteúdo menor que o bloco é completado com zeros."""
+        base = idx * self.block_size
+        n_bytes = len(content)
+        self.data[base:base + n_bytes] = content
+        if n_bytes < self.block_size:
+            self.data[base + n_bytes:base + self.block_size] = bytes(self.block_size - n_bytes)
+
+    def write_blocks(self, blocks):
+        """Grava vários blocos inteiros: blocks é uma sequência de (índice, conteúdo)."""
+        for idx, content in blocks:
+            self.write_block(idx, content)
+
+    def free(self, extents):
+        """
+        Libera uma referência de cada bloco dos extents. O bloco só é marcado
+        como livre no bitmap quando o contador de referências chega a zero.
+        """
+        refcount = self.refcount
+        with self.alloc_lock:
+            if self.dedup:
+                self._free_dedup(extents)
+                return
+            freed = [] if self._free_index is not None else None
+            free_before = self.free_count
+            for start, length in extents:
+                for idx in range(max(start, 0), min(start + length, self.total_blocks)):
+                    refs = refcount[idx]
+                    if refs > 1:
+                        refcount[idx] = refs - 1
+                    elif refs == 1:
+                        refcount[idx] = 0
+                        self.free_map[idx] = self.FREE
+                        self.free_count += 1
+                        if freed is not None:
+                            freed.append(idx)
+                self._blocks_changed(start, length)
+            if freed:
+                self._index_freed(freed)
+            self.blocks_freed += self.free_count - free_before
+
+    # ------------------------------------------------------------------
+    # Deduplicação
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _digest(block):
+        """Hash do conteúdo de um bloco completo."""
+        return hashlib.blake2b(block, digest_size=16).digest()
+
+    def allocate_dedup(self, content, write_block):
+        """
+        Aloca content reaproveitando blocos de conteúdo idêntico já gravados.
+        Blocos repetidos (no disco ou dentro do próprio conteúdo) ganham uma
+        referência; apenas os inéditos são reservados e gravados com
+        write_block (do disco ou do buffer cache). Os blocos novos só entram
+        no índice depois de gravados, para que nenhuma outra alocação os
+        compartilhe antes de conterem os dados. Retorna a lista de extents.
+        """
+        bs = self.block_size
+        content = bytes(content)
+        chunks = [content[pos:pos + bs] for pos in range(0, len(content), bs)]
+        if chunks and len(chunks[-1]) < bs:
+            # O último bloco é gravado completado com zeros
+            chunks[-1] += bytes(bs - len(chunks[-1]))
+        # Trechos iguais dentro do conteúdo são resumidos (hash) uma única vez
+        uses = Counter(chunks)
+        digest_of = {chunk: self._digest(chunk) for chunk in uses}
+        refcount = self.refcount
+        max_refs = self.MAX_REFS
+        with self.alloc_lock:
+            # Planejamento (sem alterar o disco): cada trecho distinto vai para
+            # um bloco existente (>= 0), para um bloco novo (-1 - nº do novo)
+            # ou, se o bloco saturar, para uma lista de (bloco, usos)
+            target = {}
+            added = []       # (bloco existente, referências acrescentadas)
+            new_chunks = []  # trecho de cada bloco novo
+            new_uses = []
+            for chunk, n in uses.items():
+                idx = self._by_hash.get(digest_of[chunk])
+                room = max_refs - refcount[idx] if idx is not None else 0
+                if n <= room:
+                    added.append((idx, n))
+                    target[chunk] = idx
+                    continue
+                parts = []
+                if room > 0:
+                    added.append((idx, room))
+                    parts.append((idx, room))
+                    n -= room
+                while n > 0:
+                    take = min(n, max_refs)
+                    parts.append((-1 - len(new_chunks), take))
+                    new_chunks.append(chunk)
+                    new_uses.append(take)
+                    n -= take
+                target[chunk] = parts[0][0] if len(parts) == 1 else parts
+
+            # Sem espaço, reserve lança a exceção antes de qualquer alteração
+            fresh = self.expand(self.reserve(len(new_chunks)))
+            for idx, n in added:
+                refcount[idx] += n
+                self._blocks_changed(idx, 1)
+            for idx, n in zip(fresh, new_uses):
+                if n > 1:
+                    refcount[idx] = n
+                    self._blocks_changed(idx, 1)
+            self.dedup_hits += len(chunks) - len(fresh)
+
+        for idx, chunk in zip(fresh, new_chunks):
+            write_block(idx, chunk)
+
+        with self.alloc_lock:
+            for idx, chunk in zip(fresh, new_chunks):
+                digest = digest_of[chunk]
+                old = self._by_hash.get(digest)
+                if old is None or refcount[old] >= max_refs:
+                    self._hash_of.pop(old, None)
+                    self._by_hash[digest] = idx
+                    self._hash_of[idx] = digest
+
+        # Bloco físico de cada posição do conteúdo
+        split = {}
+        for chunk, t in target.items():
+            if isinstance(t, list):
+                split[chunk] = iter([b if b >= 0 else fresh[-1 - b] for b, n in t for _ in range(n)])
+            elif t < 0:
+                target[chunk] = fresh[-1 - t]
+        if split:
+            blocks = [next(split[c]) if c in split else target[c] for c in chunks]
+        else:
+            blocks = [target[c] for c in chunks]
+
+        extents = []
+        start = end = -1
+        for idx in blocks:
+            if idx == end:
+                end += 1
+                continue
+            if start >= 0:
+                extents.append((start, end - start))
+            start, end = idx, idx + 1
+        if start >= 0:
+            extents.append((start, end - start))
+        return extents
+
+    def _free_dedup(self, extents):
+        """free com deduplicação: um bloco pode se repetir nos extents."""
+        refcount = self.refcount
+        freed = [] if self._free_index is not None else None
+        free_before = self.free_count
+        counts = {}
+        for (start, length), n in Counter(extents).items():
+            for idx in range(max(start, 0), min(start + length, self.total_blocks)):
+                counts[idx] = counts.get(idx, 0) + n
+        for idx, n in counts.items():
+            refs = refcount[idx]
+            if refs > n:
+                refcount[idx] = refs - n
+            elif refs:
+                refcount[idx] = 0
+                self.free_map[idx] = self.FREE
+                self.free_count += 1
+                self._unindex(idx)
+                if freed is not None:
+                    freed.append(idx)
+            self._blocks_changed(idx, 1)
+        if freed:
+            self._index_freed(freed)
+        self.blocks_freed += self.free_count - free_before
+
+    def _unindex(self, idx):
+        digest = self._hash_of.pop(idx, None)
+        if digest is not None and self._by_hash.get(digest) == idx:
+            del self._by_hash[digest]
+
+    def unindex(self, blocks):
+        """
+        Retira blocos do índice de deduplicação. Deve ser chamado antes de
+        alterar um bloco no lugar: depois disso, nenhuma alocação nova passa
+        a compartilhá-lo, e o chamador pode conferir com segurança se ele já
+        é compartilhado (copy-on-write).
+        """
+        if not self._hash_of:
+            return
+        with self.alloc_lock:
+            for idx in blocks:
+                self._unindex(idx)
+
+    def dedup_stats(self):
+        """
+        Estatísticas de deduplicação: blocos indexados, blocos poupados e a
+        razão entre blocos referenciados pelos arquivos e blocos físicos em
+        uso (inclui o compartilhamento das cópias copy-on-write).
+        """
+        with self.alloc_lock:
+            used = self.used_count()
+            referenced = sum(self.refcount)
+            return {
+                "indexed": len(self._by_hash),
+                "hits": self.dedup_hits,
+                "referenced": referenced,
+                "used": used,
+                "ratio": referenced / used if used else 1.0,
+            }
+
+    # ------------------------------------------------------------------
+    # Compartilhamento de blocos (copy-on-write)
+    # ------------------------------------------------------------------
+
+    MAX_REFS = 0xFFFF
+
+    def share(self, extents):
+        """Acrescenta uma referência a cada bloco dos extents (sem copiar dados)."""
+        refcount = self.refcount
+        with self.alloc_lock:
+            for start, length in extents:
+                for idx in range(start, start + length):
+                    if refcount[idx] >= self.MAX_REFS:
+                        raise Exception("Erro: Limite de referências do bloco atingido.")
+            for start, length in extents:
+                for idx in range(start, start + length):
+                    refcount[idx] += 1
+                self._blocks_changed(start, length)
+
+    def is_shared(self, idx):
+        """Indica se o bloco é referenciado por mais de um arquivo."""
+        return self.refcount[idx] > 1
+
+    def any_shared(self, extents):
+        """Indica se algum bloco dos extents é compartilhado."""
+        refcount = self.refcount
+        return any(refcount[idx] > 1
+                   for start, length in extents for idx in range(start, start + length))
+
+    def relocate(self, extents, new_start):
+        """
+        Move o conteúdo dos extents para a sequência contígua que começa em new_start.
+        A sequência de destino deve estar livre. Retorna o novo extent.
+        """
+        n_blocks = sum(length for _, length in extents)
+        with self.alloc_lock:
+            data = self.read(extents)
+            # Hashes dos blocos movidos (o índice passa a apontar para o destino)
+            moved = [self._hash_of.get(idx) for idx in self.expand(extents)] if self._hash_of else []
+            self._mark(new_start, n_blocks, self.USED)
+            self.write([(new_start, n_blocks)], data)
+            self.free(extents)
+            for idx, digest in enumerate(moved, start=new_start):
+                if digest is not None and digest not in self._by_hash:
+                    self._by_hash[digest] = idx
+                    self._hash_of[idx] = digest
+        return (new_start, n_blocks)
+
+    def used_count(self):
+        """Retorna o número de blocos ocupados (O(1))."""
+        return self.total_blocks - self.free_count
+
+    @staticmethod
+    def expand(extents):
+        """Converte uma lista de extents na lista equivalente de índices de blocos."""
+        return [idx for start, length in extents for idx in range(start, start + length)]
+
+    # ------------------------------------------------------------------
+    # Ganchos de persistência de metadados.
+    # O MemoryDisk é volátil, então todos são no-ops; discos persistentes
+    # (ver image_disk.ImageDisk) os sobrescrevem.
+    # ------------------------------------------------------------------
+
+    def mount_root(self, table):
+        """
+        Preenche a tabela de inodes (InodeTable) com a raiz armazenada no
+        disco e retorna seu número, ou None se não houver.
+        """
+        return None
+
+    def reserve_inode(self):
+        """
+        Reserva um número de inode no disco para um nó a ser criado, ou
+        None se o disco não guarda inodes (a tabela escolhe o número).
+        """
+        return None
+
+    def new_inode(self, node, user):
+        """Registra um nó recém-criado sob node.parent."""
+
+    def sync_file(self, file_obj):
+        """Grava os metadados e extents atuais de um arquivo."""
+
+    def sync_dir(self, ino):
+        """Grava os agregados (bytes/arquivos) do diretório ino."""
+
+    def relink_inode(self, node, old_parent):
+        """Atualiza nome e diretório pai de um nó renomeado ou movido."""
+
+    def release_inode(self, node):
+        """Remove o nó do diretório pai e libera seu inode."""
+
+    def _blocks_changed(self, start, length):
+        """Bitmap/contadores de referência dos blocos [start, start + length) mudaram."""
+
+    def transaction(self):
+        """
+        Delimita uma operação do sistema de arquivos cujas alterações de
+        metadados devem chegar ao disco juntas (ou não chegar). Sem journal,
+        não faz nada.
+        """
+        return contextlib.nullcontext()
+
+    def on_commit(self, callback):
+        """Registra callback para rodar antes de cada commit do journal (se houver)."""
+
+    def flush(self):
+        """Garante que os dados gravados cheguem ao meio de armazenamento."""
+
+    def close(self):
+        """Descarrega e fecha o dispositivo."""
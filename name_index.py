@@ -0,0 +1,125 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate
+
+
+class NameIndex:
+    """
+    Índice ordenado dos nomes de um diretório.
+
+    Os nomes ficam em uma lista de blocos ordenados (de até 2 * LOAD nomes
+    cada) e em uma lista com o maior nome de cada bloco. Inserir ou remover
+    custa uma busca binária e um deslocamento dentro de um único bloco, em
+    vez de mover a lista inteira; um bloco que passa do limite é dividido ao
+    meio. As posições absolutas (para offset/limit) usam somas acumuladas do
+    tamanho dos blocos, recalculadas apenas depois de uma alteração.
+    """
+    LOAD = 512
+
+    def __init__(self, names=()):
+        names = sorted(names)
+        load = self.LOAD
+        self._chunks = [names[i:i + load] for i in range(0, len(names), load)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._len = len(names)
+        # Fim (posição exclusiva) de cada bloco; None = desatualizado
+        self._ends = None
+
+    def __len__(self):
+        return self._len
+
+    def add(self, name):
+        """Insere name (que ainda não está no índice)."""
+        chunks, maxes = self._chunks, self._maxes
+        if not chunks:
+            chunks.append([name])
+            maxes.append(name)
+        else:
+            i = bisect_left(maxes, name)
+            if i == len(maxes):
+                # Maior que todos: vai para o fim do último bloco
+                i -= 1
+                chunks[i].append(name)
+                maxes[i] = name
+            else:
+                insort(chunks[i], name)
+            chunk = chunks[i]
+            if len(chunk) > 2 * self.LOAD:
+                half = len(chunk) // 2
+                chunks[i:i + 1] = [chunk[:half], chunk[half:]]
+                maxes[i:i + 1] = [chunk[half - 1], chunk[-1]]
+        self._len += 1
+        self._ends = None
+
+    def remove(self, name):
+        """Remove name (que está no índice)."""
+        chunks, maxes = self._chunks, self._maxes
+        i = bisect_left(maxes, name)
+        chunk = chunks[i]
+        j = bisect_left(chunk, name)
+        del chunk[j]
+        if not chunk:
+            del chunks[i]
+            del maxes[i]
+        elif j == len(chunk):
+            maxes[i] = chunk[-1]
+        self._len -= 1
+        self._ends = None
+
+    # ------------------------------------------------------------------
+    # Posições
+    # ------------------------------------------------------------------
+
+    def _chunk_ends(self):
+        if self._ends is None:
+            self._ends = list(accumulate(len(chunk) for chunk in self._chunks))
+        return self._ends
+
+    def _locate(self, pos):
+        """Converte uma posição absoluta em (bloco, índice no bloco)."""
+        ends = self._chunk_ends()
+        i = bisect_right(ends, pos)
+        return i, pos - (ends[i - 1] if i else 0)
+
+    def position(self, name):
+        """Quantidade de nomes menores que name (posição em que ele estaria)."""
+        i = bisect_left(self._maxes, name)
+        if i == len(self._maxes):
+            return self._len
+        j = bisect_left(self._chunks[i], name)
+        return (self._chunk_ends()[i - 1] if i else 0) + j
+
+    def irange(self, lo=None, hi=None, skip=0, reverse=False):
+        """
+        Gera os nomes n com lo <= n < hi (limites opcionais) em ordem,
+        pulando os skip primeiros (ou últimos, com reverse). Custa
+        O(log n) para posicionar mais O(1) por nome gerado.
+        """
+        first = self.position(lo) if lo is not None else 0
+        last = self.position(hi) if hi is not None else self._len
+        chunks = self._chunks
+        if not reverse:
+            pos = first + skip
+            if pos >= last:
+                return
+            i, j = self._locate(pos)
+            remaining = last - pos
+            while remaining > 0:
+                chunk = chunks[i]
+                for name in chunk[j:j + remaining]:
+                    yield name
+                remaining -= len(chunk) - j
+                i, j = i + 1, 0
+        else:
+            pos = last - 1 - skip
+            if pos < first:
+                return
+            i, j = self._locate(pos)
+            remaining = pos - first + 1
+            while remaining > 0:
+                chunk = chunks[i]
+                lo_j = max(j + 1 - remaining, 0)
+                for k in range(j, lo_j - 1, -1):
+                    yield chunk[k]
+                remaining -= j + 1
+                i -= 1
+                j = len(chunks[i]) - 1 if i >= 0 else 0
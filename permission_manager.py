@@ -1,47 +1,149 @@
+from collections import OrderedDict
+
+
+class Credentials:
+    """
+    Credenciais efetivas de uma sessão, pré-calculadas a partir de um User:
+    uid, gid primário e o conjunto de todos os grupos (primário +
+    suplementares). Guardam também o cache LRU de permissões (inode ->
+    versão e bits rwx efetivos) usado pelo PermissionManager que as criou.
+    Podem ser passadas no lugar de um User para as operações do FileSystem.
+    """
+    __slots__ = ("name", "uid", "gid", "groups", "is_root", "perms")
+
+    def __init__(self, user):
+        self.name = user.name
+        self.uid = user.uid
+        self.gid = user.gid
+        self.groups = frozenset(user.groups) | {user.gid}
+        self.is_root = user.uid == 0
+        self.perms = OrderedDict()
+
+    @property
+    def key(self):
+        return self.uid, self.gid, self.groups
+
+    def __repr__(self):
+        return f"Credentials(uid={self.uid}, gid={self.gid}, groups={sorted(self.groups)})"
+
+
 class PermissionManager:
     """
     Gerencia verificações de permissão baseadas em bits (Unix-like).
     Bits: Read(4), Write(2), Execute(1).
+
+    Os bits efetivos de cada par (inode, credencial) são calculados uma vez
+    e guardados no cache da credencial junto com a versão de permissões do
+    inode (InodeTable.pversion), lida antes do cálculo. chmod, chown e
+    remoção mudam a versão depois de alterar o inode, então uma entrada
+    calculada antes (mesmo por uma verificação concorrente, sem trava) não
+    é mais aceita. Cada cache guarda até CACHE_SIZE inodes (LRU). Uma
+    instância atende a um único FileSystem, pois o cache é indexado pelo
+    número do inode.
     """
     READ = 4
     WRITE = 2
     EXECUTE = 1
 
+    # Inodes no cache de permissões de cada credencial
+    CACHE_SIZE = 4096
+
+    # Operação -> bit exigido
+    OP_BITS = {'r': READ, 'w': WRITE, 'x': EXECUTE}
+
     def __init__(self):
-        pass
+        # Credenciais já criadas (uid, gid, grupos) -> Credentials
+        self._creds = {}
 
-    def check_permission(self, file_obj, user, operation):
-        """
-        Verifica se o usuário tem permissão para a operação.
-        Analisa Owner, Group ou Other dependendo do UID/GID.
-        """
-        perm_bits = file_obj.permissions
+    def credentials(self, user):
+        """Retorna as credenciais efetivas (compartilhadas) do usuário (ou da sessão)."""
+        if isinstance(user, Credentials):
+            return user
+        cred = getattr(user, "cred", None)
+        if cred is not None:
+            return cred
+        cred = Credentials(user)
+        return self._creds.setdefault(cred.key, cred)
 
-        if user.uid == file_obj.uid:
+    def _effective_bits(self, file_obj, cred):
+        """Bits rwx que a credencial possui sobre o arquivo (caminho sem cache)."""
+        perm_bits = file_obj.permissions
+        if cred.is_root:
+            # root lê e escreve qualquer arquivo; executa se algum bit x estiver ativo
+            return self.READ | self.WRITE | (self.EXECUTE if perm_bits & 0o111 else 0)
+        if cred.uid == file_obj.uid:
             # Desloca 6 bits para pegar a permissão de Dono (ex: 700 -> 7)
-            shifted_perm = (perm_bits >> 6) & 0o7
-        elif user.gid == file_obj.gid:
-            # Desloca 3 bits para pegar a permissão de Grupo
-            shifted_perm = (perm_bits >> 3) & 0o7
-        else:
-            # Pega os últimos 3 bits para Outros
-            shifted_perm = perm_bits & 0o7
+            return (perm_bits >> 6) & 0o7
+        if file_obj.gid in cred.groups:
+            # Desloca 3 bits para pegar a permissão de Grupo (primário ou suplementar)
+            return (perm_bits >> 3) & 0o7
+        # Pega os últimos 3 bits para Outros
+        return perm_bits & 0o7
 
-        required = 0
-        if operation == 'r':
-            required = self.READ
-        elif operation == 'w':
-            required = self.WRITE
-        elif operation == 'x':
-            required = self.EXECUTE
+    def _bits(self, file_obj, cred):
+        """Bits efetivos, do cache da credencial se a versão do inode não mudou."""
+        ino = file_obj.ino
+        version = file_obj.table.pversion[ino]
+        perms = cred.perms
+        entry = perms.get(ino)
+        if entry is not None and entry >> 3 == version:
+            try:
+                perms.move_to_end(ino)
+            except KeyError:
+                pass  # despejada por outra thread com a mesma credencial
+            return entry & 0o7
+        bits = self._effective_bits(file_obj, cred)
+        perms[ino] = version << 3 | bits
+        if len(perms) > self.CACHE_SIZE:
+            try:
+                perms.popitem(last=False)
+            except KeyError:
+                pass
+        return bits
 
+    def check_permission(self, file_obj, user, operation):
+        """
+        Verifica se o usuário tem permissão para a operação.
+        Analisa Owner, Group ou Other dependendo do UID/GID (root sempre pode ler/escrever).
+        """
+        cred = user if type(user) is Credentials else self.credentials(user)
         # Verifica se o bit necessário está ativo usando AND bit a bit
-        return (shifted_perm & required) == required
+        return self._bits(file_obj, cred) & self.OP_BITS[operation] != 0
+
+    def check_many(self, file_objs, user, operation):
+        """
+        Verificação em lote: retorna a lista de resultados (bool) na ordem de
+        file_objs, resolvendo a credencial e o bit da operação uma única vez.
+        """
+        cred = self.credentials(user)
+        required = self.OP_BITS[operation]
+        bits = self._bits
+        return [bits(file_obj, cred) & required != 0 for file_obj in file_objs]
 
     def chmod(self, file_obj, user, new_mode):
         """Altera os bits de permissão de um arquivo."""
-        if user.uid == file_obj.uid:
+        if user.uid == file_obj.uid or user.uid == 0:
             file_obj.permissions = new_mode
             print(f"Permissões de '{file_obj.name}' alteradas para {oct(new_mode)}")
         else:
-            print("Erro: Apenas o dono pode alterar permissões.")
\ No newline at end of file
+            print("Erro: Apenas o dono pode alterar permissões.")
+
+    def chown(self, file_obj, user, uid=None, gid=None):
+        """
+        Altera dono e/ou grupo de um arquivo. Apenas root muda o dono; o dono
+        pode mudar o grupo para um dos seus próprios grupos.
+        Retorna True se a alteração foi feita.
+        """
+        cred = self.credentials(user)
+        if uid is not None and uid != file_obj.uid and not cred.is_root:
+            print("Erro: Apenas root pode alterar o dono.")
+            return False
+        if gid is not None and not cred.is_root:
+            if cred.uid != file_obj.uid or gid not in cred.groups:
+                print("Erro: Apenas o dono pode alterar o grupo (para um grupo ao qual pertence).")
+                return False
+        if uid is not None:
+            file_obj.uid = uid
+        if gid is not None:
+            file_obj.gid = gid
+        return True
@@ -0,0 +1,207 @@
+import threading
+import time
+
+
+class _QuotaEntry:
+    """Uso, limites e início do prazo de tolerância de um usuário ou grupo."""
+    __slots__ = ("blocks", "inodes", "block_soft", "block_hard", "inode_soft", "inode_hard",
+                 "block_since", "inode_since")
+
+    def __init__(self):
+        self.blocks = 0
+        self.inodes = 0
+        # 0 = sem limite
+        self.block_soft = 0
+        self.block_hard = 0
+        self.inode_soft = 0
+        self.inode_hard = 0
+        # Momento em que o uso passou do limite suave (0 = dentro do limite)
+        self.block_since = 0.0
+        self.inode_since = 0.0
+
+    def update_grace(self):
+        """Inicia ou encerra o prazo de tolerância conforme o uso atual."""
+        if self.block_soft and self.blocks > self.block_soft:
+            if not self.block_since:
+                self.block_since = time.time()
+        else:
+            self.block_since = 0.0
+        if self.inode_soft and self.inodes > self.inode_soft:
+            if not self.inode_since:
+                self.inode_since = time.time()
+        else:
+            self.inode_since = 0.0
+
+
+class QuotaManager:
+    """
+    Cotas de disco por usuário (File.uid) e por grupo (File.gid).
+
+    O uso de cada uid e gid (blocos dos arquivos e inodes) fica em
+    contadores atualizados incrementalmente pela tabela de inodes: alocação
+    e liberação de inodes, mudança de extents (escrita, truncate, cp, rm) e
+    de dono (chown). Consultar uma cota é O(1) e o relatório é O(usuários),
+    sem percorrer a árvore. Cada arquivo conta os próprios blocos, inclusive
+    os compartilhados com cópias (copy-on-write) ou deduplicados.
+
+    Limites suaves podem ser ultrapassados por até grace segundos; esgotado
+    o prazo, passam a valer como rígidos até o uso voltar abaixo deles.
+    Limites rígidos nunca são ultrapassados. Zero significa sem limite.
+    A verificação (check) é feita antes de alocar, sem reserva: escritas
+    simultâneas do mesmo dono podem passar do limite por no máximo o
+    tamanho delas.
+    """
+    USER = "user"
+    GROUP = "group"
+
+    GRACE = 7 * 24 * 3600
+
+    def __init__(self, grace=GRACE):
+        self.grace = grace
+        self._entries = {self.USER: {}, self.GROUP: {}}
+        # (tipo, id) com algum limite: vazio = nada a verificar
+        self._limited = set()
+        # (tipo, id) com uso alterado desde o último changes() (None = sem
+        # acompanhamento; ligado por discos que gravam o uso)
+        self._changed = None
+        self._lock = threading.Lock()
+
+    def _entry(self, kind, ident):
+        entries = self._entries[kind]
+        entry = entries.get(ident)
+        if entry is None:
+            entry = entries[ident] = _QuotaEntry()
+        return entry
+
+    def charge(self, uid, gid, blocks=0, inodes=0):
+        """Soma variações de uso (positivas ou negativas) ao dono e ao grupo."""
+        users, groups = self._entries[self.USER], self._entries[self.GROUP]
+        with self._lock:
+            for entry in (users.get(uid) or self._entry(self.USER, uid),
+                          groups.get(gid) or self._entry(self.GROUP, gid)):
+                entry.blocks += blocks
+                entry.inodes += inodes
+                if entry.block_soft or entry.inode_soft:
+                    entry.update_grace()
+            if self._changed is not None:
+                self._changed.add((self.USER, uid))
+                self._changed.add((self.GROUP, gid))
+
+    def move(self, old_uid, old_gid, uid, gid, blocks, inodes):
+        """Transfere o uso de um inode (chown) para o novo dono e grupo."""
+        with self._lock:
+            for kind, old, new in ((self.USER, old_uid, uid), (self.GROUP, old_gid, gid)):
+                if old == new:
+                    continue
+                for entry, sign in ((self._entry(kind, old), -1), (self._entry(kind, new), 1)):
+                    entry.blocks += sign * blocks
+                    entry.inodes += sign * inodes
+                    if entry.block_soft or entry.inode_soft:
+                        entry.update_grace()
+                if self._changed is not None:
+                    self._changed.add((kind, old))
+                    self._changed.add((kind, new))
+
+    def restore(self, kind, ident, blocks, inodes):
+        """Define o uso de um usuário ou grupo (lido de um disco persistente)."""
+        with self._lock:
+            entry = self._entry(kind, ident)
+            entry.blocks, entry.inodes = blocks, inodes
+            entry.update_grace()
+
+    def track_changes(self):
+        """Passa a registrar quais usuários e grupos tiveram o uso alterado."""
+        with self._lock:
+            if self._changed is None:
+                self._changed = set()
+
+    def changes(self):
+        """
+        Lista (tipo, id, blocos, inodes) dos usuários e grupos alterados desde
+        a chamada anterior e limpa o registro (O(alterados)).
+        """
+        with self._lock:
+            if not self._changed:
+                return []
+            changed, self._changed = self._changed, set()
+            return [(kind, ident, self._entries[kind][ident].blocks,
+                     self._entries[kind][ident].inodes) for kind, ident in changed]
+
+    def _exceeds(self, usage, soft, hard, since, now):
+        if hard and usage > hard:
+            return "rígida"
+        if soft and usage > soft and since and now - since > self.grace:
+            return "suave (prazo de tolerância esgotado)"
+        return None
+
+    def check(self, uid, gid, blocks=0, inodes=0):
+        """
+        Lança exceção se o dono ou o grupo não puder receber mais blocks
+        blocos e inodes inodes.
+        """
+        if not self._limited:
+            return
+        now = time.time()
+        with self._lock:
+            for kind, ident in ((self.USER, uid), (self.GROUP, gid)):
+                entry = self._entries[kind].get(ident)
+                if entry is None:
+                    continue
+                who = f"{'do usuário' if kind == self.USER else 'do grupo'} {ident}"
+                if blocks > 0:
+                    limit = self._exceeds(entry.blocks + blocks, entry.block_soft,
+                                          entry.block_hard, entry.block_since, now)
+                    if limit:
+                        raise Exception(f"Erro: Cota {limit} de blocos {who} excedida.")
+                if inodes > 0:
+                    limit = self._exceeds(entry.inodes + inodes, entry.inode_soft,
+                                          entry.inode_hard, entry.inode_since, now)
+                    if limit:
+                        raise Exception(f"Erro: Cota {limit} de inodes {who} excedida.")
+
+    def set_limits(self, kind, ident, block_soft=0, block_hard=0, inode_soft=0, inode_hard=0):
+        """Define os limites (0 = sem limite) de um usuário ou grupo."""
+        if kind not in self._entries:
+            raise ValueError(f"Tipo de cota inválido: {kind}")
+        if min(block_soft, block_hard, inode_soft, inode_hard) < 0:
+            raise ValueError("Erro: Limites não podem ser negativos.")
+        if (block_hard and block_soft > block_hard) or (inode_hard and inode_soft > inode_hard):
+            raise ValueError("Erro: O limite suave não pode ser maior que o rígido.")
+        with self._lock:
+            entry = self._entry(kind, ident)
+            entry.block_soft, entry.block_hard = block_soft, block_hard
+            entry.inode_soft, entry.inode_hard = inode_soft, inode_hard
+            entry.update_grace()
+            if block_soft or block_hard or inode_soft or inode_hard:
+                self._limited.add((kind, ident))
+            else:
+                self._limited.discard((kind, ident))
+
+    def _snapshot(self, entry, now):
+        def left(since):
+            # Segundos restantes do prazo (None fora do prazo)
+            return max(self.grace - (now - since), 0.0) if since else None
+        return {
+            "blocks": entry.blocks,
+            "block_soft": entry.block_soft,
+            "block_hard": entry.block_hard,
+            "block_grace": left(entry.block_since),
+            "inodes": entry.inodes,
+            "inode_soft": entry.inode_soft,
+            "inode_hard": entry.inode_hard,
+            "inode_grace": left(entry.inode_since),
+        }
+
+    def usage(self, kind, ident):
+        """Uso, limites e prazo restante (segundos ou None) de um usuário ou grupo (O(1))."""
+        with self._lock:
+            return self._snapshot(self._entries[kind].get(ident) or _QuotaEntry(), time.time())
+
+    def report(self, kind):
+        """Lista (id, uso) de todos os usuários ou grupos com uso ou limites, por id."""
+        now = time.time()
+        with self._lock:
+            return [(ident, self._snapshot(entry, now))
+                    for ident, entry in sorted(self._entries[kind].items())
+                    if entry.blocks or entry.inodes or entry.block_hard or entry.block_soft
+                    or entry.inode_hard or entry.inode_soft]
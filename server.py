@@ -0,0 +1,148 @@
+"""
+Modo servidor: várias sessões de shell simultâneas (TCP em localhost ou
+socket Unix) compartilhando um único FileSystem e um único disco.
+
+Cada conexão recebe seu próprio Shell (usuário e diretório atual); o banco
+de usuários é compartilhado, como um /etc/passwd. Os comandos são
+executados por um pool de threads, de modo que sessões diferentes operam
+de fato concorrentemente sobre o sistema de arquivos.
+
+Protocolo (texto UTF-8, orientado a linhas):
+  cliente -> servidor: um comando por linha, como no shell interativo;
+  servidor -> cliente: a saída do comando seguida da linha de prompt,
+                       iniciada por PROMPT_MARK (ex: "\\x1eroot@/ $ ").
+A linha de prompt marca o fim de cada resposta. Depois de 'exit' o
+servidor envia a saída e fecha a conexão.
+"""
+import asyncio
+import contextvars
+import io
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from main import Shell
+from user import User
+
+PROMPT_MARK = "\x1e"
+
+# Buffer de saída da sessão cujo comando a thread atual está executando
+_output = contextvars.ContextVar("session_output", default=None)
+
+
+class _SessionStdout:
+    """
+    Substituto de sys.stdout durante o modo servidor: o que os comandos
+    imprimem vai para o buffer da sessão corrente; fora de um comando
+    (ex: mensagens do próprio servidor), vai para o stdout original.
+    """
+    def __init__(self, real):
+        self._real = real
+
+    def write(self, text):
+        buf = _output.get()
+        return (self._real if buf is None else buf).write(text)
+
+    def flush(self):
+        if _output.get() is None:
+            self._real.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+class ShellServer:
+    """Servidor asyncio de sessões de shell sobre um kernel simulado compartilhado."""
+
+    def __init__(self, fs, disk, cache, instr=None, workers=8):
+        self.fs = fs
+        self.disk = disk
+        self.cache = cache
+        self.instr = instr
+        self.workers = workers
+        self.users_db = {"root": User("root", uid=0, gid=0)}
+        self.executor = None
+        # Contadores do servidor
+        self.active = 0
+        self.sessions = 0
+        self.commands = 0
+
+    def _execute(self, shell, line):
+        """Executa um comando (em uma thread do pool) e retorna a resposta completa."""
+        buf = io.StringIO()
+        token = _output.set(buf)
+        try:
+            shell.execute(line)
+            if shell.running:
+                buf.write(PROMPT_MARK + shell.prompt() + "\n")
+        finally:
+            _output.reset(token)
+        return buf.getvalue()
+
+    async def handle(self, reader, writer):
+        """Atende uma conexão: um Shell próprio até 'exit' ou desconexão."""
+        loop = asyncio.get_running_loop()
+        shell = Shell(self.fs, self.disk, self.cache, self.instr, users_db=self.users_db)
+        self.active += 1
+        self.sessions += 1
+        try:
+            writer.write(f"=== Simulador de SO: M3-SO (sessão {self.sessions}) ===\n"
+                         f"{PROMPT_MARK}{shell.prompt()}\n".encode("utf-8"))
+            await writer.drain()
+            while shell.running:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await loop.run_in_executor(
+                    self.executor, self._execute, shell, line.decode("utf-8", errors="replace"))
+                self.commands += 1
+                writer.write(reply.encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # Cliente desconectado ou linha acima do limite do leitor
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve(self, host="127.0.0.1", port=7070, unix=None):
+        """Escuta até receber SIGINT (Ctrl-C) ou SIGTERM."""
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, path=unix, backlog=1024)
+        else:
+            server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        for sock in server.sockets:
+            address = sock.getsockname()
+            if isinstance(address, tuple):
+                address = f"{address[0]}:{address[1]}"
+            print(f"Servidor escutando em {address}", file=sys.stderr, flush=True)
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+            except (NotImplementedError, RuntimeError):
+                # Sem suporte a sinais no loop (ex: Windows): Ctrl-C vira KeyboardInterrupt
+                pass
+        async with server:
+            await stop
+
+    def run(self, host="127.0.0.1", port=7070, unix=None):
+        """Ponto de entrada bloqueante do modo servidor."""
+        real_stdout = sys.stdout
+        sys.stdout = _SessionStdout(real_stdout)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix="sessao")
+        try:
+            asyncio.run(self.serve(host, port, unix))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=True)
+            sys.stdout = real_stdout
+            print(f"Servidor encerrado: {self.sessions} sessão(ões), "
+                  f"{self.commands} comando(s).", file=sys.stderr)
@@ -0,0 +1,92 @@
+class Session:
+    """
+    Estado de uma sessão (shell, cliente ou thread) sobre um FileSystem
+    compartilhado: usuário, credenciais efetivas e diretório atual.
+
+    Pode ser passada no lugar do usuário para as operações do FileSystem:
+    caminhos relativos são resolvidos a partir do diretório da sessão.
+    Uma sessão não deve ser usada por várias threads ao mesmo tempo.
+    """
+    def __init__(self, fs, user):
+        self.fs = fs
+        self.set_user(user)
+        self._cwd_node = fs.root
+        self._cwd_parts = ()
+        self._pwd = "/"
+        # Geração da árvore em que o diretório atual foi validado pela última vez
+        self._generation = fs.generation
+
+    def set_user(self, user):
+        """Troca o usuário da sessão (su) e recalcula as credenciais efetivas."""
+        self.user = user
+        self.cred = self.fs.pm.credentials(user)
+
+    # Identidade (mesma interface de User/Credentials)
+    @property
+    def name(self):
+        return self.user.name
+
+    @property
+    def uid(self):
+        return self.cred.uid
+
+    @property
+    def gid(self):
+        return self.cred.gid
+
+    # ------------------------------------------------------------------
+    # Diretório atual
+    # ------------------------------------------------------------------
+
+    def _revalidate(self):
+        """
+        Outra operação (rm/mv de diretório) alterou a árvore: recalcula o
+        caminho do diretório atual, que pode ter sido movido ou removido.
+        Se foi removido, volta ao ancestral mais próximo que ainda existe.
+        """
+        fs = self.fs
+        self._generation = fs.generation
+        parts = fs._path_of_live(self._cwd_node)
+        if parts is None:
+            parts = self._cwd_parts
+            while True:
+                node = fs._lookup_key(parts)
+                if node is not None and node.is_dir:
+                    break
+                parts = parts[:-1]
+            self._cwd_node = node
+        self._cwd_parts = parts
+        self._pwd = "/" + "/".join(parts)
+
+    @property
+    def cwd(self):
+        """Componentes (tupla) do diretório atual."""
+        if self._generation != self.fs.generation:
+            self._revalidate()
+        return self._cwd_parts
+
+    @property
+    def current_dir(self):
+        if self._generation != self.fs.generation:
+            self._revalidate()
+        return self._cwd_node
+
+    def get_pwd(self):
+        """Retorna o caminho absoluto do diretório atual (memoizado)."""
+        if self._generation != self.fs.generation:
+            self._revalidate()
+        return self._pwd
+
+    def cd(self, path):
+        """Navega entre diretórios (caminhos absolutos/relativos, '.', '..' e '/')."""
+        key = self.fs._abspath(path, self)
+        node = self.fs._lookup_key(key)
+        if node is None:
+            return f"Erro: '{path}' não encontrado."
+        if not node.is_dir:
+            return f"Erro: '{path}' não é um diretório."
+        self._cwd_node = node
+        self._cwd_parts = key
+        self._pwd = "/" + "/".join(key)
+        self._generation = self.fs.generation
+        return ""
@@ -5,11 +5,17 @@ class UserType(Enum):
     USER = 2
 
 class User:
-    def __init__(self, name, uid, gid):
+    def __init__(self, name, uid, gid, groups=()):
         self.name = name
         self.uid = uid
         self.gid = gid
+        # Grupos suplementares (além do grupo primário gid)
+        self.groups = set(groups)
         self.type = UserType.USER
 
+    def add_group(self, gid):
+        """Adiciona um grupo suplementar."""
+        self.groups.add(gid)
+
     def __repr__(self):
-        return f"User({self.name}, uid={self.uid}, gid={self.gid})"
\ No newline at end of file
+        return f"User({self.name}, uid={self.uid}, gid={self.gid}, groups={sorted(self.groups)})"
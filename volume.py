@@ -0,0 +1,332 @@
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import accumulate
+
+from memory_disk import MemoryDisk
+
+
+class _DeviceStats:
+    """Contadores de E/S de um dispositivo do volume."""
+    __slots__ = ("reads", "writes", "bytes_read", "bytes_written", "busy_ns")
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.busy_ns = 0
+
+
+class Volume(MemoryDisk):
+    """
+    Volume lógico: vários dispositivos (MemoryDisk, ou discos com a mesma
+    interface de blocos) vistos pelo sistema de arquivos como um único disco.
+
+    O volume mantém o alocador (bitmap, contadores de referência e índice de
+    deduplicação) sobre o espaço de endereços lógico; os dispositivos guardam
+    apenas os dados, e os alocadores deles não são usados. Cada bloco lógico
+    corresponde a um bloco de um dispositivo:
+      - STRIPE (RAID-0): o espaço é dividido em faixas de stripe_blocks
+        blocos, distribuídas em rodízio entre os dispositivos. Cada um
+        contribui o mesmo número de faixas completas (o excedente dos
+        maiores fica sem uso);
+      - CONCAT: os dispositivos são concatenados, na ordem dada.
+
+    Transferências de vários blocos são divididas por dispositivo. Quando
+    envolvem mais de um dispositivo e ao menos PARALLEL_BYTES, os trechos de
+    cada um são atendidos em paralelo por um pool de threads; abaixo disso,
+    o custo de despachar supera o ganho e a thread chamadora faz tudo. Cada
+    dispositivo tem contadores de operações, bytes e tempo ocupado, usados
+    no relatório de utilização (device_stats).
+    """
+    STRIPE = "stripe"  # RAID-0
+    CONCAT = "concat"
+
+    STRIPE_BLOCKS = 8
+    PARALLEL_BYTES = 64 * 1024
+
+    def __init__(self, devices, mode=STRIPE, stripe_blocks=STRIPE_BLOCKS,
+                 allocation=MemoryDisk.BLOCK, fit=MemoryDisk.BEST_FIT, dedup=False):
+        devices = list(devices)
+        if not devices:
+            raise ValueError("O volume precisa de pelo menos um dispositivo.")
+        if mode not in (self.STRIPE, self.CONCAT):
+            raise ValueError(f"Modo de volume inválido: {mode}")
+        if stripe_blocks < 1:
+            raise ValueError("A faixa deve ter pelo menos 1 bloco.")
+        block_size = devices[0].block_size
+        if any(dev.block_size != block_size for dev in devices):
+            raise ValueError("Os dispositivos do volume devem ter o mesmo tamanho de bloco.")
+        self.devices = devices
+        self.mode = mode
+        self.stripe_blocks = stripe_blocks
+        self.block_size = block_size
+        if mode == self.STRIPE:
+            per_device = min(dev.total_blocks for dev in devices) // stripe_blocks * stripe_blocks
+            if per_device == 0:
+                raise ValueError("Os dispositivos devem ter pelo menos uma faixa completa.")
+            device_blocks = [per_device] * len(devices)
+        else:
+            device_blocks = [dev.total_blocks for dev in devices]
+        # Fim (bloco lógico exclusivo) de cada dispositivo na concatenação
+        self._ends = list(accumulate(device_blocks))
+        self._device_blocks = device_blocks
+        self._init_allocator(sum(device_blocks), allocation, fit)
+        self._init_dedup(dedup)
+
+        # Contadores por dispositivo (a trava dos contadores não envolve outras)
+        self._io_stats = [_DeviceStats() for _ in devices]
+        self._stats_lock = threading.Lock()
+        self._since = time.perf_counter_ns()
+        # Pool de E/S paralela, criado na primeira transferência que o usa
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Endereçamento
+    # ------------------------------------------------------------------
+
+    def _locate(self, idx):
+        """Bloco lógico -> (nº do dispositivo, bloco no dispositivo)."""
+        if self.mode == self.STRIPE:
+            unit, offset = divmod(idx, self.stripe_blocks)
+            row, dev = divmod(unit, len(self.devices))
+            return dev, row * self.stripe_blocks + offset
+        dev = bisect_right(self._ends, idx)
+        return dev, idx - (self._ends[dev - 1] if dev else 0)
+
+    def _runs(self, extents):
+        """
+        Divide extents lógicos em trechos (dispositivo, bloco inicial,
+        comprimento), contíguos em um único dispositivo, na ordem lógica.
+        """
+        runs = []
+        for start, length in extents:
+            while length > 0:
+                dev, phys = self._locate(start)
+                if self.mode == self.STRIPE:
+                    n = min(length, self.stripe_blocks - start % self.stripe_blocks)
+                else:
+                    n = min(length, self._ends[dev] - start)
+                last = runs[-1] if runs else None
+                if last and last[0] == dev and last[1] + last[2] == phys:
+                    runs[-1] = (dev, last[1], last[2] + n)
+                else:
+                    runs.append((dev, phys, n))
+                start += n
+                length -= n
+        return runs
+
+    # ------------------------------------------------------------------
+    # E/S por dispositivo
+    # ------------------------------------------------------------------
+
+    def _record(self, dev, write, ops, n_bytes, elapsed_ns):
+        stats = self._io_stats[dev]
+        with self._stats_lock:
+            if write:
+                stats.writes += ops
+                stats.bytes_written += n_bytes
+            else:
+                stats.reads += ops
+                stats.bytes_read += n_bytes
+            stats.busy_ns += elapsed_ns
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=len(self.devices),
+                                                    thread_name_prefix="volume")
+        return self._pool
+
+    def _dispatch(self, jobs, task, n_bytes):
+        """
+        Executa task(dispositivo, trechos) para cada dispositivo de jobs. Com
+        mais de um dispositivo e ao menos PARALLEL_BYTES, os demais vão para
+        o pool enquanto a thread chamadora atende o primeiro.
+        """
+        items = list(jobs.items())
+        if len(items) < 2 or n_bytes < self.PARALLEL_BYTES:
+            for dev, runs in items:
+                task(dev, runs)
+            return
+        pool = self._executor()
+        futures = [pool.submit(task, dev, runs) for dev, runs in items[1:]]
+        try:
+            task(*items[0])
+        finally:
+            for future in futures:
+                future.result()
+
+    def _write_runs(self, dev, runs):
+        device = self.devices[dev]
+        clock = time.perf_counter_ns
+        start = clock()
+        n_bytes = 0
+        for phys, n, data in runs:
+            device.write([(phys, n)], data)
+            n_bytes += n * self.block_size
+        self._record(dev, True, len(runs), n_bytes, clock() - start)
+
+    def _read_runs(self, out, dev, runs):
+        device = self.devices[dev]
+        clock = time.perf_counter_ns
+        start = clock()
+        n_bytes = 0
+        for phys, n, offset, size in runs:
+            for view in device.iter_views([(phys, n)], size):
+                out[offset:offset + len(view)] = view
+                offset += len(view)
+            n_bytes += size
+        self._record(dev, False, len(runs), n_bytes, clock() - start)
+
+    def _write_block_runs(self, dev, blocks):
+        device = self.devices[dev]
+        clock = time.perf_counter_ns
+        start = clock()
+        for phys, content in blocks:
+            device.write_block(phys, content)
+        self._record(dev, True, len(blocks), len(blocks) * self.block_size, clock() - start)
+
+    # ------------------------------------------------------------------
+    # Interface de dados do disco
+    # ------------------------------------------------------------------
+
+    def write(self, extents, content):
+        """Grava o conteúdo nos extents lógicos, um lote de trechos por dispositivo."""
+        src = memoryview(content)
+        bs = self.block_size
+        jobs = {}
+        offset = 0
+        for dev, phys, n in self._runs(extents):
+            jobs.setdefault(dev, []).append((phys, n, src[offset:offset + n * bs]))
+            offset += n * bs
+        self._dispatch(jobs, self._write_runs, len(src))
+
+    def read(self, extents, size=None):
+        """Lê os extents lógicos, um lote de trechos por dispositivo."""
+        bs = self.block_size
+        runs = self._runs(extents)
+        total = sum(n for _, _, n in runs) * bs
+        if size is not None:
+            total = min(total, size)
+        if total < self.PARALLEL_BYTES or len({dev for dev, _, _ in runs}) < 2:
+            # Sem paralelismo, juntar as fatias evita a cópia extra do buffer
+            return b"".join(self._iter_runs(runs, total))
+        jobs = {}
+        offset = 0
+        for dev, phys, n in runs:
+            if offset >= total:
+                break
+            n_bytes = min(n * bs, total - offset)
+            jobs.setdefault(dev, []).append((phys, n, offset, n_bytes))
+            offset += n_bytes
+        # Cada dispositivo preenche faixas disjuntas do resultado
+        out = bytearray(total)
+        self._dispatch(jobs, partial(self._read_runs, out), total)
+        return bytes(out)
+
+    def iter_views(self, extents, size=None):
+        """Gera fatias (sem cópia) dos dispositivos, na ordem lógica."""
+        return self._iter_runs(self._runs(extents), size)
+
+    def _iter_runs(self, runs, size):
+        """
+        Gera as fatias de cada faixa. O tempo de dispositivo registrado é só o
+        gasto produzindo as fatias, sem o do consumidor entre um yield e outro.
+        """
+        bs = self.block_size
+        clock = time.perf_counter_ns
+        remaining = size if size is not None else self.total_blocks * bs
+        for dev, phys, n in runs:
+            if remaining <= 0:
+                return
+            n_bytes = min(n * bs, remaining)
+            views = self.devices[dev].iter_views([(phys, n)], n_bytes)
+            busy = 0
+            try:
+                while True:
+                    start = clock()
+                    view = next(views, None)
+                    busy += clock() - start
+                    if view is None:
+                        break
+                    yield view
+            finally:
+                # Registrado mesmo se o consumidor abandonar a leitura no meio
+                self._record(dev, False, 1, n_bytes, busy)
+            remaining -= n_bytes
+
+    def read_block(self, idx):
+        dev, phys = self._locate(idx)
+        clock = time.perf_counter_ns
+        start = clock()
+        content = self.devices[dev].read_block(phys)
+        self._record(dev, False, 1, self.block_size, clock() - start)
+        return content
+
+    def write_block(self, idx, content):
+        dev, phys = self._locate(idx)
+        clock = time.perf_counter_ns
+        start = clock()
+        self.devices[dev].write_block(phys, content)
+        self._record(dev, True, 1, self.block_size, clock() - start)
+
+    def write_blocks(self, blocks):
+        """Grava vários blocos, agrupados por dispositivo (em paralelo, se valer a pena)."""
+        jobs = {}
+        count = 0
+        for idx, content in blocks:
+            dev, phys = self._locate(idx)
+            jobs.setdefault(dev, []).append((phys, content))
+            count += 1
+        self._dispatch(jobs, self._write_block_runs, count * self.block_size)
+
+    # ------------------------------------------------------------------
+    # Utilização
+    # ------------------------------------------------------------------
+
+    def _used_per_device(self):
+        n = len(self.devices)
+        if self.mode == self.STRIPE:
+            s = self.stripe_blocks
+            return [sum(self.free_map[dev * s + k::n * s].count(self.USED) for k in range(s))
+                    for dev in range(n)]
+        starts = [0] + self._ends[:-1]
+        return [self.free_map[a:b].count(self.USED) for a, b in zip(starts, self._ends)]
+
+    def device_stats(self):
+        """
+        Utilização de cada dispositivo: blocos do volume nele e quantos estão
+        em uso, operações e bytes lidos/gravados e a fração do tempo (desde a
+        criação do volume) em que esteve ocupado atendendo E/S.
+        """
+        elapsed = max(time.perf_counter_ns() - self._since, 1)
+        with self.alloc_lock:
+            used = self._used_per_device()
+        with self._stats_lock:
+            return [{
+                "blocks": blocks,
+                "used": n_used,
+                "reads": st.reads,
+                "writes": st.writes,
+                "bytes_read": st.bytes_read,
+                "bytes_written": st.bytes_written,
+                "busy_ms": st.busy_ns / 1e6,
+                "utilization": st.busy_ns / elapsed,
+            } for blocks, n_used, st in zip(self._device_blocks, used, self._io_stats)]
+
+    def flush(self):
+        for device in self.devices:
+            device.flush()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        for device in self.devices:
+            device.close()